@@ -0,0 +1,185 @@
+import os
+import math
+import time
+import fcntl
+import threading
+from typing import Dict, List, Tuple, Optional
+
+import metrics
+
+metrics.registry.describe("cargo_admission_wait_seconds", "histogram", "Time requests queued before admission, by priority class")
+metrics.registry.describe("cargo_admission_rejections_total", "counter", "Requests turned away with 503, by class, route and reason")
+
+# Admission control
+#
+# Every route belongs to a priority class. Crew-critical routes (finding,
+# retrieving and placing items) are admitted at once; heavy analytics routes
+# are held to concurrency limits, so that however many of them arrive, some
+# worker processes stay free for the crew.
+#
+# Limits hold across all worker processes. A slot is an exclusive flock on one
+# of a fixed set of files, taken without blocking and given back when the
+# request ends, or when its process dies. A request needs a slot of its class
+# and, if its route has a limit of its own, one of its route. While none is
+# free it waits in its class's queue, which is a set of slot files too. If the
+# queue is full, or the wait outlasts the class's limit, the request is turned
+# away at once with 503 and a Retry-After of how long the route's requests
+# have recently taken. A queued request still occupies its worker, so queues
+# are meant to be short.
+
+POLL_INTERVAL = 0.005  # First pause between attempts at a slot; doubles up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 0.05
+SERVICE_TIME_WEIGHT = 0.2  # Weight of the latest request in each route's average service time
+
+
+class ClassLimits:
+    """Concurrency and queueing limits shared by the routes of one priority class"""
+
+    def __init__(self, concurrency: Optional[int] = None, queue: int = 0, max_wait: float = 0.0):
+        self.concurrency = concurrency  # None: never limited
+        self.queue = queue  # Requests allowed to wait for a slot
+        self.max_wait = max_wait  # Seconds a queued request waits before it is turned away
+
+
+class Rejected(Exception):
+    """A request that was not admitted; retry_after is in whole seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Slots:
+    """A fixed number of slots shared by every process, one lock file each"""
+
+    def __init__(self, directory: str, name: str, count: int):
+        self.paths = [os.path.join(directory, f"{name}.{slot}.slot") for slot in range(count)]
+
+    def try_take(self):
+        """An open, locked slot file, or None if every slot is taken"""
+        for path in self.paths:
+            try:
+                f = open(path, 'a')
+            except FileNotFoundError:
+                # The directory is made the first time a limited route is admitted
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = open(path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+
+def _give_back(held: List) -> None:
+    for f in held:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+    held.clear()
+
+
+class Ticket:
+    """An admitted request's slots, held until release"""
+
+    def __init__(self, controller: "AdmissionController", route: str, held: List):
+        self.controller = controller
+        self.route = route
+        self.held = held
+        self.admitted = time.perf_counter()
+
+    def release(self) -> None:
+        if self.held:
+            _give_back(self.held)
+            self.controller.finished(self.route, time.perf_counter() - self.admitted)
+
+
+class AdmissionController:
+    """Priority classes and per-route concurrency limits for the routes of one app"""
+
+    def __init__(self, directory: str, classes: Dict[str, ClassLimits],
+                 routes: Dict[str, Tuple[str, Optional[int]]], default_class: str):
+        self.directory = directory
+        self.classes = classes
+        self.routes = routes  # route -> (class, concurrency limit of its own or None)
+        self.default_class = default_class
+        self._class_slots = {}
+        self._queues = {}
+        self._route_slots = {}
+        self._service_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        for name, limits in classes.items():
+            if limits.concurrency is not None:
+                self._class_slots[name] = _Slots(directory, f"class.{name}", limits.concurrency)
+            self._queues[name] = _Slots(directory, f"queue.{name}", limits.queue)
+        for route, (_, limit) in routes.items():
+            if limit is not None:
+                self._route_slots[route] = _Slots(directory, f"route.{route}", limit)
+
+    def class_of(self, route: Optional[str]) -> str:
+        return self.routes.get(route, (self.default_class, None))[0]
+
+    def retry_after(self, route: str) -> int:
+        with self._lock:
+            return max(1, math.ceil(self._service_times.get(route, 1.0)))
+
+    def finished(self, route: str, elapsed: float) -> None:
+        with self._lock:
+            average = self._service_times.get(route)
+            self._service_times[route] = elapsed if average is None else \
+                average + SERVICE_TIME_WEIGHT * (elapsed - average)
+
+    def _try_admit(self, route: str, class_name: str) -> Optional[List]:
+        """Every slot the request needs, or None (holding nothing) if one is taken"""
+        held = []
+        for slots in (self._route_slots.get(route), self._class_slots.get(class_name)):
+            if slots is None:
+                continue
+            f = slots.try_take()
+            if f is None:
+                _give_back(held)
+                return None
+            held.append(f)
+        return held
+
+    def admit(self, route: Optional[str]) -> Optional[Ticket]:
+        """Admit a request to a route, waiting in its class's queue if need be
+
+        Returns None for routes that are never limited; raises Rejected if the
+        request is turned away.
+        """
+        class_name = self.class_of(route)
+        if route not in self._route_slots and class_name not in self._class_slots:
+            return None
+
+        held = self._try_admit(route, class_name)
+        if held is not None:
+            metrics.registry.observe("cargo_admission_wait_seconds", 0.0, priority_class=class_name)
+            return Ticket(self, route, held)
+
+        place = self._queues[class_name].try_take()
+        if place is None:
+            metrics.registry.inc("cargo_admission_rejections_total", route=route, reason="queue_full",
+                                 priority_class=class_name)
+            raise Rejected("queue full", self.retry_after(route))
+
+        started = time.perf_counter()
+        deadline = started + self.classes[class_name].max_wait
+        interval = POLL_INTERVAL
+        try:
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    metrics.registry.inc("cargo_admission_rejections_total", route=route, reason="timeout",
+                                         priority_class=class_name)
+                    raise Rejected("timed out in queue", self.retry_after(route))
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                held = self._try_admit(route, class_name)
+                if held is not None:
+                    metrics.registry.observe("cargo_admission_wait_seconds", time.perf_counter() - started,
+                                             priority_class=class_name)
+                    return Ticket(self, route, held)
+        finally:
+            _give_back([place])
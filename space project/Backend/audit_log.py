@@ -0,0 +1,295 @@
+import os
+import json
+import queue
+import random
+import atexit
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional, Callable
+
+import metrics
+
+metrics.registry.describe("cargo_log_entries_total", "counter", "Audit log entries by action and how they were handled")
+metrics.registry.describe("cargo_log_commits_total", "counter", "Audit log group commits written to disk")
+
+# Durability modes
+SYNC = "sync"      # Written before the request returns
+BATCH = "batch"    # Queued and group-committed by the background writer
+SAMPLE = "sample"  # Like batch, but only a fraction of entries is kept
+
+IDENTITY_BYTES = 256  # Leading bytes that, with the inode, tell a rewritten log file apart
+CLOSE_TIMEOUT = 5.0  # Seconds to wait at exit for the writer thread's last commit
+
+
+def append_entries(path: str, entries: List[Dict]) -> None:
+    """Append entries to a JSON array log file in place, without rewriting it"""
+    if not entries:
+        return
+
+    body = ",\n".join(_indent(json.dumps(entry, indent=2)) for entry in entries)
+
+    with _locked(path, 'a+b') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end == 0:
+            f.write(f"[\n{body}\n]".encode())
+            return
+
+        # Find the closing bracket and whether the array already has elements
+        tail_start = max(0, end - 4096)
+        f.seek(tail_start)
+        tail = f.read()
+        close = tail.rfind(b"]")
+        if close < 0:
+            raise ValueError(f"{path} is not a JSON array")
+        before = tail[:close].rstrip()
+        empty = before.endswith(b"[") if before else _is_empty_array(f, tail_start)
+
+        # Opened in append mode, so truncate back to the bracket and rewrite the tail
+        f.truncate(tail_start + len(before))
+        separator = "\n" if empty else ",\n"
+        f.write(f"{separator}{body}\n]".encode())
+
+
+def split_entries(path: str, predicate: Callable[[Dict], bool],
+                  seal: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
+    """Remove the entries matching predicate from a log file and return them
+
+    seal, if given, is called with them under the lock before they are removed;
+    if it raises, the file is left as it was.
+    """
+    if not os.path.exists(path):
+        return []
+    with _locked(path, 'r+b') as f:
+        content = f.read()
+        entries = json.loads(content) if content.strip() else []
+        removed = [entry for entry in entries if predicate(entry)]
+        if not removed:
+            return []
+        kept = [entry for entry in entries if not predicate(entry)]
+        if seal:
+            seal(removed)
+
+        # Replace the file while holding its lock; writers waiting on it notice and reopen
+        temp_path = f"{path}.tmp.{os.getpid()}"
+        with open(temp_path, 'w') as temp:
+            if kept:
+                temp.write("[\n" + ",\n".join(_indent(json.dumps(entry, indent=2)) for entry in kept) + "\n]")
+        os.replace(temp_path, path)
+    return removed
+
+
+@contextmanager
+def _locked(path: str, mode: str):
+    """Open a log file under an exclusive lock, retrying if it was replaced meanwhile"""
+    while True:
+        f = open(path, mode)
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(f.fileno()).st_ino:
+                try:
+                    yield f
+                finally:
+                    f.flush()
+                return
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+
+def read_entries(path: str) -> List[Dict]:
+    """Read every entry from a JSON array log file"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return []
+    with f:
+        # Appends rewrite the end of the file in place, so read under a shared lock like read_from
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            content = f.read()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return json.loads(content) if content.strip() else []
+
+
+def read_from(path: str, position: int = 0, identity: Optional[Tuple[int, bytes]] = None
+              ) -> Tuple[List[Dict], int, Optional[Tuple[int, bytes]], bool]:
+    """Entries appended to a log file since an earlier read (position 0 for all of them)
+
+    Pass back the position and identity the earlier read returned. Positions
+    only hold for the file they came from: if compaction replaced the file
+    since, every entry is read again and the last value returned is True.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return [], 0, None, identity is not None
+    with f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        try:
+            inode = os.fstat(f.fileno()).st_ino
+            head = f.read(IDENTITY_BYTES)
+            replaced = identity is not None and (identity[0] != inode or not head.startswith(identity[1]))
+            if identity is None or replaced:
+                position = 0
+            f.seek(position)
+            rest = f.read()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    close = rest.rfind(b"]")
+    body = rest[:close].rstrip() if close >= 0 else b""
+    text = body.lstrip()
+    if text[:1] in (b"[", b","):
+        text = text[1:]
+    entries = json.loads(b"[" + text + b"]") if text.strip() else []
+    # Appends rewrite the file from just after the last entry, and never touch the bytes before it
+    end = position + len(body)
+    return entries, end, (inode, head[:end]), replaced
+
+
+def _indent(text: str) -> str:
+    return "\n".join("  " + line for line in text.split("\n"))
+
+
+def _is_empty_array(f, limit: int) -> bool:
+    f.seek(0)
+    return f.read(limit).strip() == b"["
+
+
+class AuditLogWriter:
+    """Background writer that group-commits audit log entries
+
+    Entries for critical mutations are written synchronously. Entries for
+    read-only actions are queued in a bounded buffer and committed together
+    once the batch fills up or the flush interval passes. When the buffer is
+    full, queued entries are dropped rather than blocking the request.
+
+    Queued entries only ever leave the queue in a commit, which takes all of
+    them under the write lock, so flush() and synchronous writes commit every
+    entry accepted before them, in order, and nothing is written twice. The
+    writer thread only decides when to commit. At exit it is stopped and
+    joined before the final flush.
+    """
+
+    def __init__(self, path: str, durability: Dict[str, str], sample_rates: Dict[str, float],
+                 max_queue: int = 10000, batch_size: int = 256, flush_interval: float = 0.5):
+        self.path = path
+        self.durability = durability
+        self.sample_rates = sample_rates
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pending = threading.Event()  # Set when an entry is queued
+        self._full = threading.Event()  # Set when a full batch is queued
+        self._stopping = False
+        atexit.register(self.close)
+
+    def mode_for(self, action: str) -> str:
+        return self.durability.get(action, SYNC)
+
+    def write(self, entry: Dict) -> None:
+        """Record an entry according to its action's durability mode"""
+        action = entry['action']
+        mode = self.mode_for(action)
+
+        if mode == SAMPLE and random.random() >= self.sample_rates.get(action, 1.0):
+            metrics.registry.inc("cargo_log_entries_total", action=action, outcome="sampled_out")
+            return
+
+        if mode == SYNC:
+            # Commit anything queued first so the file stays in timestamp order
+            with self._write_lock:
+                append_entries(self.path, self._drain() + [entry])
+            metrics.registry.inc("cargo_log_commits_total", mode=SYNC)
+            metrics.registry.inc("cargo_log_entries_total", action=action, outcome="written")
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            metrics.registry.inc("cargo_log_entries_total", action=action, outcome="queued")
+        except queue.Full:
+            metrics.registry.inc("cargo_log_entries_total", action=action, outcome="dropped")
+        self._pending.set()
+        if self._queue.qsize() >= self.batch_size:
+            self._full.set()
+
+    def read_all(self) -> List[Dict]:
+        """Entries on disk plus those accepted but not yet committed, oldest first"""
+        with self._write_lock:
+            logs = read_entries(self.path)
+            if self._queue is not None and self._pid == os.getpid():
+                with self._queue.mutex:
+                    logs.extend(self._queue.queue)
+        return logs
+
+    def flush(self) -> None:
+        """Write every accepted entry now"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        with self._write_lock:
+            self._commit()
+
+    def close(self) -> None:
+        """Stop the writer thread once it has committed, then write anything left"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._pending.set()
+        self._full.set()
+        self._thread.join(CLOSE_TIMEOUT)
+        self.flush()
+
+    def _commit(self) -> None:
+        """Append everything queued (call with the write lock held)"""
+        batch = self._drain()
+        if batch:
+            append_entries(self.path, batch)
+            metrics.registry.inc("cargo_log_commits_total", mode=BATCH)
+
+    def _drain(self) -> List[Dict]:
+        batch = []
+        if self._queue is None or self._pid != os.getpid():
+            return batch
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _ensure_started(self) -> None:
+        # Worker processes are forked after import, so each one starts its own thread
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pending, self._full = threading.Event(), threading.Event()
+            self._stopping = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._pending.wait()
+
+            # Let the batch fill up or the flush interval pass; entries wait in the queue
+            self._full.wait(self.flush_interval)
+            with self._write_lock:
+                # Cleared before draining: an entry queued after the drain sets them again
+                self._pending.clear()
+                self._full.clear()
+                self._commit()
@@ -0,0 +1,146 @@
+import bisect
+from typing import Dict, List, Tuple, Optional
+
+import models
+
+# Container consolidation
+#
+# Frees whole storage containers, for return or reuse, by moving all their
+# items into the others. Emptying a container costs one move per item in it,
+# so candidates are tried fewest items first (then least full), which frees
+# the most containers for the fewest moves. A candidate's items are placed
+# largest first, each into the container with the least free volume that
+# still takes it (best fit), which keeps roomy containers for the items still
+# to come. Items of protected_priority and above only go to containers at
+# least as accessible as the one they leave. If any item finds no room, the
+# candidate's placements are undone and it stays as it is.
+#
+# Destinations are kept in one list sorted by free volume, so a best fit is a
+# binary search followed by a short walk past containers that are too heavy
+# (or, for protected items, too far back), and each placement re-sorts one
+# entry; no pair of containers is ever compared directly. A container being
+# emptied is taken out of the list, and one that has taken items is never
+# emptied later, so no item moves twice. Containers holding reservations or
+# inactive items (which cannot be moved) are never emptied. Capacity checks
+# match rearrangement.check_move, and the moves come out as a rearrangement
+# plan, in order.
+
+TOLERANCE = 1e-9  # The search is conservative; candidates are checked exactly
+
+
+class FreeSpace:
+    """Storage containers by free volume, with the loads a plan has given them so far"""
+
+    def __init__(self, data: Dict):
+        self.containers = {container_id: container for container_id, container in data['containers'].items()
+                           if container.type == models.ContainerType.STORAGE}
+        self.loads: Dict[str, List[float]] = {}  # container ID -> [used volume, current weight]
+        self.held = {}  # container ID -> reserved (volume, weight), as of the start of the plan
+        self.order: List[Tuple[float, str]] = []  # (free volume, container ID), ascending
+        for container_id, container in self.containers.items():
+            self.loads[container_id] = [container.used_volume, container.current_weight]
+            self.held[container_id] = container.held()
+            self.order.append((self._free(container_id), container_id))
+        self.order.sort()
+
+    def _free(self, container_id: str) -> float:
+        container = self.containers[container_id]
+        return container.total_volume - self.loads[container_id][0] - self.held[container_id][0]
+
+    def _fits(self, container_id: str, volume: float, weight: float) -> bool:
+        container = self.containers[container_id]
+        (used_volume, current_weight), (held_volume, held_weight) = self.loads[container_id], self.held[container_id]
+        return used_volume + held_volume + volume <= container.total_volume and \
+            current_weight + held_weight + weight <= container.max_weight
+
+    def remove(self, container_id: str) -> None:
+        entry = (self._free(container_id), container_id)
+        del self.order[bisect.bisect_left(self.order, entry)]
+
+    def add(self, container_id: str) -> None:
+        bisect.insort(self.order, (self._free(container_id), container_id))
+
+    def change(self, container_id: str, volume: float, weight: float) -> None:
+        """Add (or with negative amounts, take away) load, keeping the order"""
+        self.remove(container_id)
+        load = self.loads[container_id]
+        load[0] += volume
+        load[1] += weight
+        self.add(container_id)
+
+    def best_fit(self, volume: float, weight: float, min_access: Optional[float] = None) -> Optional[str]:
+        """Container with the least free volume that takes an item and is accessible enough"""
+        for position in range(bisect.bisect_left(self.order, (volume - TOLERANCE,)), len(self.order)):
+            container_id = self.order[position][1]
+            if min_access is not None and self.containers[container_id].accessibility_factor < min_access:
+                continue
+            if self._fits(container_id, volume, weight):
+                return container_id
+        return None
+
+
+def _candidates(data: Dict) -> List[Tuple[int, float, str]]:
+    """(item count, used volume, ID) of the storage containers that could be emptied, best first"""
+    found = []
+    for container_id, container in data['containers'].items():
+        if container.type != models.ContainerType.STORAGE or not container.items or container.held() != (0.0, 0.0):
+            continue
+        if any(data['items'][item_id].status != models.ItemStatus.ACTIVE for item_id in container.items):
+            continue
+        found.append((len(container.items), container.used_volume, container_id))
+    found.sort()
+    return found
+
+
+def plan(data: Dict, max_containers: int, max_moves: int, protected_priority: int) -> Dict:
+    """Moves that empty as many storage containers as possible, within the limits"""
+    space = FreeSpace(data)
+    moves = []
+    freed = []
+    receiving = set()  # Containers that have taken items, so must not be emptied
+    candidates = _candidates(data)
+    for count, _, container_id in candidates:
+        if len(freed) >= max_containers or len(moves) + count > max_moves:
+            break  # Later candidates only have more items
+        if container_id in receiving:
+            continue
+
+        source = data['containers'][container_id]
+        space.remove(container_id)
+        items = sorted((data['items'][item_id] for item_id in source.items),
+                       key=lambda item: (-item.volume, -item.weight, item.item_id))
+        placed: List[Tuple[models.Item, str]] = []
+        for item in items:
+            min_access = source.accessibility_factor if item.priority >= protected_priority else None
+            target = space.best_fit(item.volume, item.weight, min_access)
+            if target is None:
+                break
+            space.change(target, item.volume, item.weight)
+            placed.append((item, target))
+
+        if len(placed) < len(items):
+            # Undo: the container keeps its items and stays a destination
+            for item, target in placed:
+                space.change(target, -item.volume, -item.weight)
+            space.add(container_id)
+            continue
+
+        for item, target in placed:
+            moves.append({"item_id": item.item_id, "from_container": container_id, "to_container": target})
+            receiving.add(target)
+        freed.append({
+            "container_id": container_id,
+            "name": source.name,
+            "module": source.module,
+            "items_moved": count,
+            "volume_freed": round(source.total_volume, 4),
+            "accessibility_factor": source.accessibility_factor
+        })
+
+    return {
+        "moves": moves,
+        "freed_containers": freed,
+        "total_moves": len(moves),
+        "volume_freed": round(sum(entry["volume_freed"] for entry in freed), 4),
+        "candidates": len(candidates)
+    }
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Tuple, Any, Optional, Iterator
+
+import metrics
+import models
+
+# Change events
+#
+# Every save is turned into compact change events (item placed, moved, wasted,
+# returned, container utilization changed, ...) by comparing the rows the
+# request changed with what was stored before. Events are appended to a
+# journal file shared by all worker processes, each with the next state
+# version number. Stores append while they still hold their write locks, so
+# two commits touching the same row are journaled in commit order.
+#
+# The journal is JSON lines ordered by version and is bounded: once it grows
+# past its size limit, the older half is dropped. Readers find their place by
+# binary search on version, and a reader that fell behind the oldest retained
+# version is told to resync.
+
+metrics.registry.describe("cargo_events_total", "counter", "Change events journaled, by type")
+
+SECTION_NAMES = tuple(name for name, _ in models.SECTION_TYPES)
+RESYNC = "resync"
+
+
+# Deriving events
+
+def _section_changes(section, previous: Optional[Dict]) -> List[Tuple[str, Any, Any]]:
+    """(key, stored row or None, current row or None) for every row that differs"""
+    if hasattr(section, 'changes'):
+        return section.changes()
+    previous = previous or {}
+    changes = []
+    for key, row in section.items():
+        old = previous.get(key)
+        if old is None or old.to_dict() != row.to_dict():
+            changes.append((key, old, row))
+    changes.extend((key, old, None) for key, old in previous.items() if key not in section)
+    return changes
+
+
+def _utilization(container) -> Dict:
+    return {
+        "used_volume": round(container.used_volume, 4),
+        "total_volume": container.total_volume,
+        "current_weight": round(container.current_weight, 4),
+        "max_weight": container.max_weight
+    }
+
+
+def _item_event(key: str, old, new) -> Tuple[str, Dict]:
+    if new is None:
+        returned = (old.location or "").startswith("waste_")
+        return ("item_returned" if returned else "item_removed"), {"location": old.location}
+    state = {"location": new.location, "status": str(new.status)}
+    if old is None:
+        return "item_placed", state
+    if new.status == models.ItemStatus.WASTE and old.status != models.ItemStatus.WASTE:
+        return "item_wasted", state
+    if new.location != old.location:
+        return "item_moved", {"from": old.location, **state}
+    return "item_updated", state
+
+
+def _container_event(kind: str, key: str, old, new) -> Tuple[str, Dict]:
+    if new is None:
+        return (f"{kind}_returned" if kind == "waste_container" else f"{kind}_removed"), {}
+    if old is None:
+        return f"{kind}_added", _utilization(new)
+    if (new.used_volume, new.current_weight) != (old.used_volume, old.current_weight):
+        return f"{kind}_utilization", _utilization(new)
+    return f"{kind}_updated", _utilization(new)
+
+
+def describe(name: str, key: str, old, new) -> Tuple[str, Dict]:
+    """Event type and details for one changed row of a section"""
+    if name == 'items':
+        return _item_event(key, old, new)
+    return _container_event(name[:-1], key, old, new)
+
+
+def changed_rows(data: Dict, previous: Optional[Dict] = None) -> List[Tuple[str, str, Any, Any]]:
+    """(section, key, stored row or None, current row or None) for everything data changed
+
+    previous is the stored data, for plain dicts.
+    """
+    return [(name, key, old, new) for name in SECTION_NAMES
+            for key, old, new in _section_changes(data[name], previous.get(name) if previous else None)]
+
+
+def to_events(rows: List[Tuple[str, str, Any, Any]]) -> List[Dict]:
+    """Unversioned events for changed rows"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    collected = []
+    for name, key, old, new in rows:
+        event_type, details = describe(name, key, old, new)
+        collected.append({"type": event_type, "entity": name, "id": key, "data": details,
+                          "timestamp": timestamp})
+    return collected
+
+
+def collect(data: Dict, previous: Optional[Dict] = None) -> List[Dict]:
+    """Unversioned events for everything data changed; previous is the stored data for plain dicts"""
+    return to_events(changed_rows(data, previous))
+
+
+def changed_entities(found: List[Dict]) -> Dict[str, Dict[str, bool]]:
+    """Entities touched by a run of events: section -> ID -> whether it was created in the run"""
+    entities = {name: {} for name in SECTION_NAMES}
+    for event in found:
+        touched = entities.get(event.get("entity"))
+        if touched is not None and event["id"] not in touched:
+            touched[event["id"]] = event["type"].endswith(("_placed", "_added"))
+    return entities
+
+
+# Journal
+
+class EventJournal:
+    """Append-only, size-bounded JSON lines journal of versioned events"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._appended = threading.Condition()
+
+    @contextmanager
+    def lock(self):
+        with open(f"{self.path}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, pending: List[Dict]) -> int:
+        """Give events the next versions and journal them; returns the latest version"""
+        if not pending:
+            return self.latest_version()
+        with self.lock():
+            version = self.latest_version()
+            lines = []
+            for event in pending:
+                version += 1
+                lines.append(json.dumps({"version": version, **event}, separators=(',', ':')))
+                metrics.registry.inc("cargo_events_total", type=event["type"])
+            with open(self.path, 'a') as f:
+                f.write("\n".join(lines) + "\n")
+            if os.path.getsize(self.path) > self.max_bytes:
+                self._compact()
+        with self._appended:
+            self._appended.notify_all()
+        return version
+
+    def _compact(self) -> None:
+        """Drop the older half of the journal (call with the lock held)"""
+        with open(self.path, 'rb') as f:
+            f.seek(os.path.getsize(self.path) // 2)
+            f.readline()
+            kept = f.read()
+            if not kept:
+                # Always keep the newest event, so versions carry on after it
+                f.seek(0)
+                kept = f.readlines()[-1]
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(kept)
+        os.replace(temp_path, self.path)
+
+    # Reading
+
+    @staticmethod
+    def _version_at(f, offset: int) -> Tuple[Optional[int], int]:
+        """Version of the first whole line starting at or after offset, and where it starts"""
+        f.seek(max(offset - 1, 0))
+        if offset:
+            f.readline()
+        start = f.tell()
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            return None, start
+        return json.loads(line)["version"], start
+
+    def latest_version(self) -> int:
+        try:
+            with open(self.path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                block = min(size, 65536)
+                f.seek(size - block)
+                lines = f.read(block).split(b"\n")
+        except FileNotFoundError:
+            return 0
+        # The last piece is empty, or a line still being written
+        for line in reversed(lines[:-1]):
+            if line:
+                return json.loads(line)["version"]
+        return 0
+
+    def oldest_version(self) -> int:
+        try:
+            with open(self.path, 'rb') as f:
+                version, _ = self._version_at(f, 0)
+        except FileNotFoundError:
+            return 0
+        return version or 0
+
+    def _offset_after(self, f, version: int) -> int:
+        """Start of the first line with a version above the given one"""
+        lo, hi = 0, f.seek(0, os.SEEK_END)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            found, _ = self._version_at(f, middle)
+            if found is not None and found <= version:
+                lo = middle + 1
+            else:
+                hi = middle
+        return self._version_at(f, lo)[1]
+
+    def read_since(self, version: int, limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Events after a version, oldest first, and the current oldest retained version"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return [], 0
+        with f:
+            oldest, _ = self._version_at(f, 0)
+            f.seek(self._offset_after(f, version))
+            found = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                event = json.loads(line)
+                if event["version"] > version:
+                    found.append(event)
+                    if limit is not None and len(found) >= limit:
+                        break
+        return found, oldest or 0
+
+    def behind(self, version: int) -> bool:
+        """Whether events after a version have already been dropped from the journal"""
+        oldest = self.oldest_version()
+        return oldest > 0 and version < oldest - 1
+
+    def follow(self, version: int, duration: float, heartbeat: float,
+               poll_interval: float) -> Iterator[Optional[List[Dict]]]:
+        """Batches of new events as they are journaled; None when a heartbeat is due
+
+        A reader that falls behind the journal gets a single resync event
+        carrying the latest version and continues from there.
+        """
+        deadline = time.monotonic() + duration
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            if self.behind(version):
+                version = self.latest_version()
+                yield [{"version": version, "type": RESYNC}]
+                last_sent = time.monotonic()
+                continue
+            found, _ = self.read_since(version, limit=1000)
+            if found:
+                version = found[-1]["version"]
+                yield found
+                last_sent = time.monotonic()
+                continue
+            if time.monotonic() - last_sent >= heartbeat:
+                yield None
+                last_sent = time.monotonic()
+            # Appends in this process wake us at once; other workers' are seen on the next poll
+            with self._appended:
+                self._appended.wait(poll_interval)
@@ -0,0 +1,189 @@
+import io
+import csv
+import json
+from typing import Dict, List, Tuple, Optional, Iterator, Iterable, Callable
+
+import models
+import facets
+import log_retention
+
+# pyarrow is optional: without it only CSV exports are offered
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Streaming exports
+#
+# Exports are generators: rows are read from the request's checkout one stored
+# chunk at a time (see BaseSection.scan), turned into output and sent as they
+# go, so memory stays flat however large the station is. A checkout reads the
+# mapped snapshot files it was opened on, which stay intact while writers
+# install new ones, so an export sees one consistent state and never holds a
+# lock. CSV is sent in blocks of about CHUNK_BYTES; Parquet a row group at a
+# time.
+#
+# Log exports read the sealed days in range one segment at a time. Entries
+# still in the active log are read up front under the compaction lock, which
+# keeps them from being sealed while the list of segments is taken.
+
+CHUNK_BYTES = 64 * 1024  # CSV text collected before it is sent
+ROW_GROUP_ROWS = 10000  # Rows per Parquet row group
+
+FORMATS = ("csv", "parquet")
+
+# Column kinds (as in the models' COLUMNS) -> Parquet types; dates are written as text
+_ARROW_TYPES = {"str": "string", "i32": "int32", "f64": "float64", "date": "string", "datetime": "string"}
+
+Columns = List[Tuple[str, str]]  # (name, kind)
+
+
+def parquet_available() -> bool:
+    return pyarrow is not None
+
+
+def _stored_rows(section) -> Iterator[Tuple[str, object]]:
+    """(key, row) for every row of a section, decoded a stored chunk at a time"""
+    parts, records = facets.sources(section)
+    for base, skip in parts:
+        for row, key, values in base.scan():
+            if row not in skip:
+                yield key, base.build(row, key, values)
+    yield from records.items()
+
+
+# Datasets: (columns, rows as tuples in column order)
+
+def items(data: Dict) -> Tuple[Columns, Iterator[Tuple]]:
+    columns = [("item_id", "str")] + list(models.Item.COLUMNS)
+    fields = [name for name, _ in models.Item.COLUMNS]
+
+    def rows():
+        for key, item in _stored_rows(data['items']):
+            record = item.to_dict()
+            yield (key, *[record.get(field) for field in fields])
+    return columns, rows()
+
+
+def containers(data: Dict) -> Tuple[Columns, Iterator[Tuple]]:
+    """Storage containers, with a count in place of their item list"""
+    fields = [(name, kind) for name, kind in models.Container.COLUMNS if name != "items"]
+    columns = [("container_id", "str")] + fields + [("item_count", "i32")]
+
+    def rows():
+        for key, container in _stored_rows(data['containers']):
+            record = container.to_dict()
+            yield (key, *[record.get(field) for field, _ in fields], len(container.items))
+    return columns, rows()
+
+
+def waste_manifest(data: Dict, waste_container_id: Optional[str] = None) -> Tuple[Columns, Iterator[Tuple]]:
+    """Items in waste containers (or one of them), with where and when they leave"""
+    columns = [("waste_container_id", "str"), ("waste_container_name", "str"), ("undock_date", "date"),
+               ("item_id", "str"), ("name", "str"), ("category", "str"), ("status", "str"),
+               ("volume", "f64"), ("weight", "f64")]
+    waste_containers = {key: (container.name, models.format_date(container.undock_date))
+                        for key, container in data['waste_containers'].items()}
+
+    def rows():
+        for key, item in _stored_rows(data['items']):
+            location = item.location or ""
+            if not location.startswith("waste_"):
+                continue
+            container_id = location[6:]
+            if waste_container_id is not None and container_id != waste_container_id:
+                continue
+            name, undock_date = waste_containers.get(container_id, (None, None))
+            yield (container_id, name, undock_date, key, item.name, item.category,
+                   str(item.status) if item.status is not None else None, item.volume, item.weight)
+    return columns, rows()
+
+
+def logs(archive: log_retention.LogArchive, read_active: Callable[[], List[Dict]],
+         start_day: Optional[str] = None, end_day: Optional[str] = None,
+         action: Optional[str] = None) -> Tuple[Columns, Iterator[Tuple]]:
+    """Audit log entries on the days in range (inclusive), oldest first; details as JSON text"""
+    columns = [("timestamp", "str"), ("action", "str"), ("details", "str")]
+    with archive.lock():
+        days = [day for day in archive.segment_days()
+                if (start_day is None or day >= start_day) and (end_day is None or day <= end_day)]
+        active = read_active()
+
+    def in_range(entry: Dict) -> bool:
+        day = log_retention.entry_day(entry)
+        return (start_day is None or day >= start_day) and (end_day is None or day <= end_day) \
+            and (action is None or entry.get('action') == action)
+
+    def rows():
+        for day in days:
+            for entry in archive.read_segment(day):
+                if in_range(entry):
+                    yield entry.get('timestamp'), entry.get('action'), json.dumps(entry.get('details'))
+        for entry in active:
+            if in_range(entry):
+                yield entry.get('timestamp'), entry.get('action'), json.dumps(entry.get('details'))
+    return columns, rows()
+
+
+# Formats
+
+def to_csv(columns: Columns, rows: Iterable[Tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """A write-only file that hands over what was written since the last take"""
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        taken = b"".join(self.chunks)
+        self.chunks = []
+        return taken
+
+
+def _row_group(schema, group: List[Tuple]):
+    return pyarrow.Table.from_arrays([pyarrow.array(values, field.type) for values, field in zip(zip(*group), schema)],
+                                     schema=schema)
+
+
+def to_parquet(columns: Columns, rows: Iterable[Tuple]) -> Iterator[bytes]:
+    schema = pyarrow.schema([(name, _ARROW_TYPES[kind]) for name, kind in columns])
+    sink = _Sink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) >= ROW_GROUP_ROWS:
+            writer.write_table(_row_group(schema, group))
+            group = []
+            yield sink.take()
+    if group:
+        writer.write_table(_row_group(schema, group))
+    writer.close()
+    yield sink.take()
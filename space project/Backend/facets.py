@@ -0,0 +1,293 @@
+import threading
+import weakref
+from collections import Counter
+from itertools import compress
+from typing import Dict, List, Tuple, Optional, Any, Iterable
+
+import models
+import overlay
+import snapshot
+
+# Faceted item search
+#
+# Each stored item section (one per snapshot file) gets bitmap
+# indexes over its row numbers: one bitmap per category, status and priority
+# value, and per module through the container an item is in. Bitmaps are
+# plain Python ints, built from the stored columns without a per-row Python
+# loop: a column is turned into one byte per row, bytes.translate marks the
+# rows holding a value, and int() packs the marks into bits. Filters are then
+# ORs within a facet and ANDs across facets, and counts are popcounts. Item
+# IDs and per-container counts come from the selected rows only.
+#
+# Stored files never change, so an index is built once per file and kept
+# until the file is replaced. Rows a request has read, changed or added are
+# not in the stored columns yet; they are skipped in the bitmaps and tested
+# one by one instead. Plain dict sections (the JSON data file) are scanned.
+
+FACETS = ("category", "status", "priority", "module", "container")
+INDEXED = ("category", "status", "priority")  # Facets with a bitmap per value, built from their own column
+
+_MARKS = [bytes(48 + (code == value) for code in range(256)) for value in range(256)]
+_SELECT = bytes(range(256)).replace(b"0", b"\x00").replace(b"1", b"\x01")
+
+
+def _pack(marks: bytes) -> int:
+    """Bitmap from one b"0"/b"1" mark per row (row 0 is bit 0)"""
+    return int(marks[::-1], 2) if marks else 0
+
+
+def _rows(bitmap: int, size: int) -> Iterable[int]:
+    """Row numbers set in a bitmap"""
+    if not bitmap:
+        return ()
+    marks = bin(bitmap)[:1:-1].encode().ljust(size, b"0")
+    return compress(range(size), marks.translate(_SELECT))
+
+
+class FacetFilter:
+    """Values accepted for one facet: a set of values, or a range for priority"""
+
+    def __init__(self, values: Optional[Iterable] = None, low: Optional[int] = None, high: Optional[int] = None):
+        self.values = set(values) if values is not None else None
+        self.low = low
+        self.high = high
+
+    def accepts(self, value) -> bool:
+        if value is None:
+            return False
+        if self.values is not None and value not in self.values:
+            return False
+        if self.low is not None and value < self.low:
+            return False
+        if self.high is not None and value > self.high:
+            return False
+        return True
+
+
+class FacetIndex:
+    """Bitmaps over the rows of one stored item section"""
+
+    def __init__(self, base: snapshot.BaseSection):
+        self.base = base
+        self.size = base.rows
+        self.live = _pack(bytes(map(bool, base.ids)).translate(_MARKS[1]))
+        self._values: Dict[str, Dict[Any, int]] = {}
+        self._containers: Dict[str, int] = {}
+        self._modules: Optional[Tuple[Tuple, Dict[str, int]]] = None
+        self._lock = threading.Lock()
+
+    def _column(self, field: str):
+        return self.base.columns.get(f"{self.base.name}.{field}")
+
+    def _by_code(self, column, decode) -> Dict[Any, int]:
+        """Bitmap per distinct value of a low-cardinality column"""
+        distinct = sorted(set(column))
+        if len(distinct) > 255:
+            return {decode(value): _pack(bytes(map(value.__eq__, column)).translate(_MARKS[1]))
+                    for value in distinct}
+        codes = {value: code for code, value in enumerate(distinct)}
+        coded = bytes(map(codes.__getitem__, column))
+        return {decode(value): _pack(coded.translate(_MARKS[code])) for value, code in codes.items()}
+
+    def values(self, field: str) -> Dict[Any, int]:
+        """value -> bitmap for an INDEXED facet"""
+        found = self._values.get(field)
+        if found is None:
+            with self._lock:
+                found = self._values.get(field)
+                if found is None:
+                    column = self._column(field)
+                    if column is None:
+                        found = {}
+                    elif field == "priority":
+                        found = self._by_code(column, int)
+                    else:
+                        found = self._by_code(column, self.base.strings.get)
+                    self._values[field] = found
+        return found
+
+    def container(self, container_id: str) -> int:
+        found = self._containers.get(container_id)
+        if found is None:
+            column = self._column("location")
+            target = self.base.strings.find(container_id) if column is not None else 0
+            found = _pack(bytes(map(target.__eq__, column)).translate(_MARKS[1])) if target else 0
+            self._containers[container_id] = found
+        return found
+
+    def modules(self, container_modules: Dict[str, Optional[str]]) -> Dict[str, int]:
+        """module -> bitmap, through the module of each item's container"""
+        key = tuple(sorted((container_id, module) for container_id, module in container_modules.items() if module))
+        if self._modules is not None and self._modules[0] == key:
+            return self._modules[1]
+        column = self._column("location")
+        found: Dict[str, int] = {}
+        if column is not None:
+            get = self.base.strings.get
+            by_location = {}
+            for idx in set(column):
+                module = container_modules.get(get(idx)) if idx else None
+                if module:
+                    by_location[idx] = module
+            names = sorted(set(by_location.values()))
+            if len(names) > 255:
+                found = {name: 0 for name in names}
+                for idx, module in by_location.items():
+                    found[module] |= _pack(bytes(map(idx.__eq__, column)).translate(_MARKS[1]))
+            elif names:
+                codes = {name: code + 1 for code, name in enumerate(names)}
+                translate = [0] * (max(by_location) + 1)
+                for idx, module in by_location.items():
+                    translate[idx] = codes[module]
+                coded = bytes(map(translate.__getitem__, column))
+                found = {name: _pack(coded.translate(_MARKS[code])) for name, code in codes.items()}
+        self._modules = (key, found)
+        return found
+
+    def column(self, field: str, bitmap: int) -> List:
+        """Stored values of a field for the rows set in a bitmap, in row order (strings as table indexes)"""
+        column = self.base.ids if field == "id" else self._column(field)
+        if column is None or not bitmap:
+            return []
+        marks = bin(bitmap)[:1:-1].encode().ljust(self.size, b"0").translate(_SELECT)
+        return list(compress(column, marks))
+
+    def container_counts(self, bitmap: int) -> Counter:
+        get = self.base.strings.get
+        return Counter({get(idx): count for idx, count in Counter(self.column("location", bitmap)).items()})
+
+
+_indexes: "weakref.WeakKeyDictionary[snapshot.BaseSection, FacetIndex]" = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def index_for(base: snapshot.BaseSection) -> FacetIndex:
+    with _indexes_lock:
+        index = _indexes.get(base)
+        if index is None:
+            index = _indexes[base] = FacetIndex(base)
+        return index
+
+
+def sources(section) -> Tuple[List[List], Dict[str, models.Item]]:
+    """Stored parts as [BaseSection, row numbers to skip], and the rows to test one by one"""
+    if isinstance(section, snapshot.Section):
+        base = section.base
+        skip = {base.find(key) for key in list(section.touched) + list(section.deleted)}
+        skip.discard(None)
+        return [[base, skip]], {**section.touched, **section.added}
+    if isinstance(section, overlay.Overlay):
+        parts, records = sources(section.base)
+        for key in list(section.rows) + list(section.deleted):
+            records.pop(key, None)
+            for base, skip in parts:
+                row = base.find(key)
+                if row is not None:
+                    skip.add(row)
+        records.update(section.rows)
+        return parts, records
+    return [], dict(section.items())
+
+
+_module_maps: "weakref.WeakKeyDictionary[snapshot.BaseSection, Dict[str, Optional[str]]]" = weakref.WeakKeyDictionary()
+
+
+def container_modules(section) -> Dict[str, Optional[str]]:
+    """container ID -> module, read from the stored columns without decoding whole containers"""
+    parts, records = sources(section)
+    found = {}
+    for base, skip in parts:
+        with _indexes_lock:
+            modules = _module_maps.get(base)
+        if modules is None:
+            get, ids = base.strings.get, base.ids
+            column = base.columns.get(f"{base.name}.module")
+            modules = {get(ids[row]): get(column[row]) if column is not None else None
+                       for row in range(base.rows) if ids[row]}
+            with _indexes_lock:
+                _module_maps[base] = modules
+        if skip:
+            skipped = {base.strings.get(base.ids[row]) for row in skip}
+            modules = {key: module for key, module in modules.items() if key not in skipped}
+        found.update(modules)
+    for key, container in records.items():
+        found[key] = container.module
+    return found
+
+
+def _record_values(item: models.Item, container_modules: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    return {
+        "category": item.category,
+        "status": str(item.status) if item.status is not None else None,
+        "priority": item.priority,
+        "module": container_modules.get(item.location),
+        "container": item.location
+    }
+
+
+def search(data: Dict, filters: Dict[str, FacetFilter], with_counts: bool = True) -> Tuple[List[str], Dict]:
+    """IDs of the items passing every filter, and per-facet value counts
+
+    A facet's counts apply every filter except its own, so they show what
+    choosing another value of that facet would find.
+    """
+    modules = container_modules(data['containers'])
+    counts = {facet: Counter() for facet in FACETS}
+    matches: List[str] = []
+    parts, records = sources(data['items'])
+
+    for base, skip in parts:
+        index = index_for(base)
+        live = index.live
+        for row in skip:
+            live &= ~(1 << row)
+
+        # One bitmap per filtered facet: the rows holding an accepted value
+        masks = {}
+        for facet, accepted in filters.items():
+            if facet in INDEXED:
+                candidates = index.values(facet)
+            elif facet == "module":
+                candidates = index.modules(modules)
+            else:
+                candidates = {container_id: index.container(container_id) for container_id in accepted.values or ()}
+            mask = 0
+            for value, bitmap in candidates.items():
+                if accepted.accepts(value):
+                    mask |= bitmap
+            masks[facet] = mask
+
+        selected = live
+        for mask in masks.values():
+            selected &= mask
+        get, ids = base.strings.get, base.ids
+        matches.extend(get(ids[row]) for row in _rows(selected, index.size))
+
+        if with_counts:
+            for facet in FACETS:
+                within = live
+                for other, mask in masks.items():
+                    if other != facet:
+                        within &= mask
+                if facet == "container":
+                    counts[facet].update(index.container_counts(within))
+                    continue
+                bitmaps = index.modules(modules) if facet == "module" else index.values(facet)
+                for value, bitmap in bitmaps.items():
+                    count = (bitmap & within).bit_count()
+                    if count:
+                        counts[facet][value] += count
+
+    # Rows not in the stored columns, one by one
+    for key, item in records.items():
+        values = _record_values(item, modules)
+        failed = [facet for facet, accepted in filters.items() if not accepted.accepts(values[facet])]
+        if not failed:
+            matches.append(key)
+        if with_counts and len(failed) <= 1:
+            for facet in FACETS:
+                if values[facet] is not None and (not failed or failed == [facet]):
+                    counts[facet][values[facet]] += 1
+
+    return matches, {facet: dict(sorted(found.items(), key=lambda entry: str(entry[0])))
+                     for facet, found in counts.items()}
@@ -0,0 +1,290 @@
+import math
+import bisect
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Callable
+
+import models
+import facets
+import audit_log
+import log_retention
+
+# Consumption forecasting
+#
+# Every retrieval counts as one use. Usage rates per item and per category are
+# exponentially decaying counts of uses: a use adds 1/tau and the total decays
+# by e^(-t/tau), which makes it a moving average of uses per day with the
+# configured half-life. Updating one costs O(1) per use, and uses can arrive in
+# any order.
+#
+# The forecaster follows the audit log: each sync reads only the entries
+# appended since the last one. Compaction (see log_retention.py) rewrites the
+# active log; the forecaster then reads it again, skipping on each remaining
+# day the entries it already had, and takes the uses it never saw on the newly
+# sealed days from the rollups' per-item counts. A new forecaster starts from
+# the rollups and the active log. Sealed segments are never read.
+#
+# Projections work a category at a time over the stored columns (see
+# facets.py): stock is a popcount, and the expiry dates of the category's
+# active items are pulled out of the column in one pass. Consumption is taken
+# to use the soonest-expiring items first, so the k-th of them is reached after
+# k / rate days; any item that expires sooner is at risk.
+
+ROLLUP_HOUR = 0.5  # Uses known only by day are placed at midday
+
+
+class DecayingRates:
+    """Uses per day per key, as exponentially decaying counts"""
+
+    def __init__(self, tau: float):
+        self.tau = tau
+        self.values: Dict[str, List[float]] = {}  # key -> [value, day the value is as of]
+
+    def add(self, key: str, day: float, count: float = 1) -> None:
+        entry = self.values.get(key)
+        if entry is None:
+            self.values[key] = [count / self.tau, day]
+        elif day >= entry[1]:
+            entry[0] = entry[0] * math.exp((entry[1] - day) / self.tau) + count / self.tau
+            entry[1] = day
+        else:
+            entry[0] += count / self.tau * math.exp((day - entry[1]) / self.tau)
+
+    def rate(self, key: str, day: float) -> float:
+        entry = self.values.get(key)
+        if entry is None:
+            return 0.0
+        return entry[0] * math.exp(min(0.0, entry[1] - day) / self.tau)
+
+
+class Forecaster:
+    """Usage rates fed by the audit log, and the projections made from them"""
+
+    def __init__(self, log_path: str, archive: log_retention.LogArchive, half_life_days: float):
+        self.lock = threading.Lock()
+        self.log_path = log_path
+        self.archive = archive
+        self.tau = half_life_days / math.log(2)
+        self.items = DecayingRates(self.tau)
+        self.categories = DecayingRates(self.tau)
+        self.start: Optional[float] = None  # Day of the earliest use seen
+        self.started = False
+        self.position = 0  # Where the next read of the active log starts
+        self.identity = None
+        self.day_entries: Counter = Counter()  # Active log entries read, per day
+        self.day_uses: Dict[str, Counter] = {}  # Uses read from the active log, per day and item
+        self.sealed_through = ""  # Last rollup day folded in
+
+    # Following the log
+
+    def _use(self, item_id: str, category: Optional[str], day: float, count: float = 1) -> None:
+        self.items.add(item_id, day, count)
+        if category:
+            self.categories.add(category, day, count)
+        if self.start is None or day < self.start:
+            self.start = day
+
+    def _consume(self, entries: List[Dict], category_of: Callable[[str], Optional[str]],
+                 skip: Optional[Counter] = None) -> None:
+        """Record log entries; per day, the first skip[day] of them were already counted"""
+        for entry in entries:
+            day = log_retention.entry_day(entry)
+            self.day_entries[day] += 1
+            counted = skip is not None and skip[day] > 0
+            if counted:
+                skip[day] -= 1
+            for action in log_retention.iter_actions([entry]):
+                details = action.get('details') or {}
+                if action.get('action') != 'retrieve_item' or not details.get('item_id'):
+                    continue
+                item_id = details['item_id']
+                self.day_uses.setdefault(log_retention.entry_day(action), Counter())[item_id] += 1
+                if not counted:
+                    when = models.parse_datetime(action['timestamp']) / models.SECONDS_PER_DAY
+                    self._use(item_id, details.get('category') or category_of(item_id), when)
+
+    def _fold_rollups(self, category_of: Callable[[str], Optional[str]]) -> None:
+        """Uses on days sealed since the last sync that were not read from the active log"""
+        newest = self.sealed_through
+        for record in self.archive.rollups():
+            if record["action"] != 'retrieve_item' or record["date"] <= self.sealed_through:
+                continue
+            newest = max(newest, record["date"])
+            day = models.parse_date(record["date"]) + ROLLUP_HOUR
+            seen = self.day_uses.pop(record["date"], Counter())
+            categories = record.get("categories", {})
+            if not seen and sum(categories.values()) == record["count"]:
+                # Nothing of the day was read, and the rollup has its category counts
+                for item_id, count in record["items"].items():
+                    self.items.add(item_id, day, count)
+                for category, count in categories.items():
+                    self.categories.add(category, day, count)
+                if self.start is None or day < self.start:
+                    self.start = day
+                continue
+            for item_id, count in record["items"].items():
+                missing = count - seen.get(item_id, 0)
+                if missing > 0:
+                    self._use(item_id, category_of(item_id), day, missing)
+        self.sealed_through = newest
+
+    def sync(self, category_of: Callable[[str], Optional[str]]) -> None:
+        """Catch up with the audit log; category_of names the category of items logged without one"""
+        if self.started:
+            entries, position, identity, replaced = audit_log.read_from(self.log_path, self.position, self.identity)
+            if not replaced:
+                self._consume(entries, category_of)
+                self.position, self.identity = position, identity
+                return
+
+        # First sync, or compaction rewrote the log: read it again while compaction is held off
+        with self.archive.lock():
+            self._fold_rollups(category_of)
+            entries, self.position, self.identity, _ = audit_log.read_from(self.log_path)
+            skip = Counter({day: count for day, count in self.day_entries.items() if day > self.sealed_through})
+            self.day_entries, self.day_uses = Counter(), {}
+            self._consume(entries, category_of, skip if self.started else None)
+            self.started = True
+
+    # Projections
+
+    def _correction(self, day: float) -> float:
+        # A moving average started from nothing reads low until a few half-lives have passed
+        if self.start is None:
+            return 1.0
+        return 1 - math.exp(-max(day - self.start, 1.0) / self.tau)
+
+    def item_rate(self, item_id: str, day: float) -> float:
+        return self.items.rate(item_id, day) / self._correction(day)
+
+    def category_rate(self, category: str, day: float) -> float:
+        return self.categories.rate(category, day) / self._correction(day)
+
+    def forecast(self, data: Dict, horizon_days: int, limit: int) -> Dict:
+        """Depletion and expiry risk per category over the horizon, and the items most at risk"""
+        today = models.today()
+        now = models.now() / models.SECONDS_PER_DAY
+        stock = _active_stock(data['items'])
+
+        categories = []
+        at_risk = []
+        for category in sorted(stock):
+            expiries = sorted(stock[category].expiries)
+            rate = self.category_rate(category, now)
+            fresh = bisect.bisect_left(expiries, today)
+            expired = fresh - bisect.bisect_right(expiries, 0)
+
+            # Soonest expiry first: items expiring within the horizon lead the queue
+            soon = expiries[fresh:bisect.bisect_right(expiries, today + horizon_days)]
+            risky = 0
+            for position, expiry in enumerate(soon):
+                reached_in = (position + 1) / rate if rate > 0 else None
+                if reached_in is None or expiry - today < reached_in:
+                    risky += 1
+                    at_risk.append((expiry, category, reached_in))
+
+            usable = len(expiries) - expired - risky
+            needed = rate * horizon_days
+            days_left = usable / rate if rate > 0 else None
+            categories.append({
+                "category": category,
+                "active_items": len(expiries),
+                "usage_per_day": round(rate, 4),
+                "days_to_depletion": round(days_left, 1) if days_left is not None else None,
+                "depletion_date": models.format_date(today + int(days_left))
+                                  if days_left is not None and days_left < horizon_days else None,
+                "expired_items": expired,
+                "expiring_before_use": risky,
+                "restock_needed": usable < needed,
+                "restock_quantity": max(0, math.ceil(needed - usable))
+            })
+
+        at_risk.sort(key=lambda entry: entry[:2])
+        items = []
+        for expiry, category, reached_in in at_risk[:limit]:
+            item_id = stock[category].next_with(expiry)
+            items.append({
+                "item_id": item_id,
+                "category": category,
+                "expiration_date": models.format_date(expiry),
+                "days_to_expiry": expiry - today,
+                "expected_use_in_days": round(reached_in, 1) if reached_in is not None else None,
+                "item_usage_per_day": round(self.item_rate(item_id, now), 4)
+            })
+        return {"categories": categories, "at_risk_items": items, "at_risk_count": len(at_risk)}
+
+    def item_forecast(self, item: models.Item, item_id: str) -> Dict:
+        today = models.today()
+        now = models.now() / models.SECONDS_PER_DAY
+        item_rate = self.item_rate(item_id, now)
+        category_rate = self.category_rate(item.category, now) if item.category else 0.0
+        days_to_expiry = item.expiration_date - today if item.expiration_date is not None else None
+        return {
+            "item_id": item_id,
+            "category": item.category,
+            "usage_per_day": round(item_rate, 4),
+            "days_between_uses": round(1 / item_rate, 1) if item_rate > 0 else None,
+            "category_usage_per_day": round(category_rate, 4),
+            "days_to_expiry": days_to_expiry,
+            "expected_uses_before_expiry": round(item_rate * days_to_expiry, 1)
+                                           if days_to_expiry is not None and days_to_expiry > 0 else None
+        }
+
+
+class _Stock:
+    """Expiry ordinal (0 for none) of each active item of a category, and where to find its ID"""
+
+    def __init__(self):
+        self.expiries: List[int] = []
+        self.starts: List[int] = []  # Where each run of items begins in expiries
+        self.runs: List = []  # Per run: (FacetIndex, bitmap) of stored rows, or a list of IDs
+        self._ids: Dict[int, List] = {}  # Run -> its IDs, decoded once an ID is asked for
+        self._found: Dict[int, int] = {}  # Expiry -> where the last item asked for with it was
+
+    def add_rows(self, index: facets.FacetIndex, bitmap: int) -> None:
+        self.starts.append(len(self.expiries))
+        self.runs.append((index, bitmap))
+        self.expiries.extend(index.column("expiration_date", bitmap))
+
+    def add_item(self, item_id: str, expiry: Optional[int]) -> None:
+        if not self.runs or not isinstance(self.runs[-1], list):
+            self.starts.append(len(self.expiries))
+            self.runs.append([])
+        self.runs[-1].append(item_id)
+        self.expiries.append(expiry or 0)
+
+    def next_with(self, expiry: int) -> str:
+        """ID of the next item with this expiry, in stock order"""
+        position = self.expiries.index(expiry, self._found.get(expiry, -1) + 1)
+        self._found[expiry] = position
+        run = bisect.bisect_right(self.starts, position) - 1
+        ids = self._ids.get(run)
+        if ids is None:
+            if isinstance(self.runs[run], list):
+                ids = self.runs[run]
+            else:
+                index, bitmap = self.runs[run]
+                get = index.base.strings.get
+                ids = [get(idx) for idx in index.column("id", bitmap)]
+            self._ids[run] = ids
+        return ids[position - self.starts[run]]
+
+
+def _active_stock(section) -> Dict[str, _Stock]:
+    """Stock of active items per category, read a column at a time"""
+    found: Dict[str, _Stock] = {}
+    parts, records = facets.sources(section)
+    for base, skip in parts:
+        index = facets.index_for(base)
+        live = index.live
+        for row in skip:
+            live &= ~(1 << row)
+        active = index.values("status").get(str(models.ItemStatus.ACTIVE), 0) & live
+        for category, bitmap in index.values("category").items():
+            rows = bitmap & active
+            if rows and category is not None:
+                found.setdefault(category, _Stock()).add_rows(index, rows)
+    for key, item in records.items():
+        if item.status == models.ItemStatus.ACTIVE and item.category is not None:
+            found.setdefault(item.category, _Stock()).add_item(key, item.expiration_date)
+    return found
@@ -0,0 +1,276 @@
+import os
+import json
+import fcntl
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Tuple, Any, Optional, Callable
+
+import models
+import snapshot
+
+# Point-in-time history
+#
+# Every commit appends the rows it changed to the history journal: their new
+# values, or null for a deletion, numbered in commit order. Container item
+# lists are journaled as the items added and removed rather than in full.
+#
+# The journal is cut into segments, each starting at a checkpoint: a snapshot
+# file (see snapshot.py) of the whole station as of the cut. Once a segment
+# grows past its size limit the next checkpoint is cut, so a query opens one
+# memory-mapped checkpoint, where finding a row is a hash lookup, and replays
+# at most one segment, however long the mission has run. The index lists
+# checkpoints as fixed-width lines of sequence number and time, so the one
+# for a query is found by binary search.
+#
+# Cutting a checkpoint only starts a new segment, under the journal lock. The
+# checkpoint file is built afterwards, away from the commit, from the previous
+# checkpoint and the segment just closed; until it exists, queries start from
+# the previous one. Replaying is idempotent, so the very first checkpoint can
+# be taken from the stored data even while other workers commit.
+
+INDEX_WIDTH = 33  # "<sequence, 12 digits> <YYYY-MM-DD HH:MM:SS>\n"
+OPEN_CHECKPOINTS = 4  # Checkpoints kept mapped between queries
+
+_ROW_TYPES = dict(models.SECTION_TYPES)
+
+
+def _row(old, new) -> Optional[Dict]:
+    """Journal form of a changed row"""
+    if new is None:
+        return None
+    row = new.to_dict()
+    if old is not None and isinstance(row.get("items"), list):
+        kept = [item_id for item_id in old.items if item_id in new.items]
+        added = [item_id for item_id in new.items if item_id not in old.items]
+        if kept + added == row["items"]:
+            # Otherwise the order changed, and the full list is kept
+            del row["items"]
+            row["+items"] = added
+            row["-items"] = [item_id for item_id in old.items if item_id not in new.items]
+    return row
+
+
+def _replay(row: Optional[Dict], change: Optional[Dict]) -> Optional[Dict]:
+    """A row after one journaled change; applying a change twice has no further effect"""
+    if change is None or "+items" not in change:
+        return change
+    change = dict(change)
+    added, removed = change.pop("+items"), set(change.pop("-items"))
+    items = [item_id for item_id in (row or {}).get("items", []) if item_id not in removed]
+    present = set(items)
+    change["items"] = items + [item_id for item_id in added if item_id not in present]
+    return change
+
+
+class HistoryStore:
+    """Checkpoints and journal segments in one directory"""
+
+    def __init__(self, directory: str, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_path = os.path.join(directory, "checkpoints.idx")
+        self._open: "OrderedDict[int, snapshot.Snapshot]" = OrderedDict()
+        self._open_lock = threading.Lock()
+
+    def checkpoint_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"checkpoint.{seq:012d}.snap")
+
+    def segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"journal.{seq:012d}.jsonl")
+
+    @contextmanager
+    def lock(self, name: str = "journal", blocking: bool = True):
+        """Held while journaling (or, by name, while building checkpoints); yields whether it was taken"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{name}.lock"), 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Index
+
+    def _count(self) -> int:
+        try:
+            return os.path.getsize(self.index_path) // INDEX_WIDTH
+        except FileNotFoundError:
+            return 0
+
+    def _entry(self, f, position: int) -> Tuple[int, str]:
+        f.seek(position * INDEX_WIDTH)
+        seq, timestamp = f.read(INDEX_WIDTH).decode().split(" ", 1)
+        return int(seq), timestamp.rstrip("\n")
+
+    def _add_entry(self, seq: int, timestamp: str) -> None:
+        with open(self.index_path, 'a') as f:
+            f.write(f"{seq:012d} {timestamp}\n")
+
+    def checkpoints_until(self, timestamp: str) -> List[Tuple[int, str]]:
+        """(seq, time) of the last checkpoint cut at or before a time and of any unbuilt ones before it"""
+        count = self._count()
+        if not count:
+            return []
+        with open(self.index_path, 'rb') as f:
+            lo, hi = 0, count
+            while lo < hi:
+                middle = (lo + hi) // 2
+                if self._entry(f, middle)[1] <= timestamp:
+                    lo = middle + 1
+                else:
+                    hi = middle
+            found = []
+            position = lo - 1
+            while position >= 0:
+                entry = self._entry(f, position)
+                found.append(entry)
+                if os.path.exists(self.checkpoint_path(entry[0])):
+                    break
+                position -= 1
+        return found[::-1]
+
+    def _last_entry(self) -> Optional[Tuple[int, str]]:
+        count = self._count()
+        if not count:
+            return None
+        with open(self.index_path, 'rb') as f:
+            return self._entry(f, count - 1)
+
+    # Writing
+
+    @staticmethod
+    def _last_seq(path: str, default: int) -> int:
+        """Sequence number of the last record in a segment, read from its end"""
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            block = 4096
+            while True:
+                f.seek(max(0, size - block))
+                tail = f.read(block).rstrip(b"\n")
+                start = tail.rfind(b"\n")
+                if start >= 0 or block >= size:
+                    break
+                block *= 4
+        return json.loads(tail[start + 1:])["seq"] if tail else default
+
+    def record(self, rows: List[Tuple[str, str, Any, Any]], load_stored: Callable[[], Dict]) -> bool:
+        """Journal the rows one commit changed (call under the store's write lock)
+
+        load_stored loads the committed data, for the first checkpoint. Returns
+        True when a checkpoint file is waiting to be built (see build_checkpoints).
+        """
+        changes = [[name, key, _row(old, new)] for name, key, old, new in rows]
+        if not changes:
+            return False
+        # Loaded before locking, so the journal lock is never held while reading the store
+        stored = load_stored() if not self._count() else None
+        with self.lock():
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            last = self._last_entry()
+            if last is None:
+                # History starts here: the first checkpoint already holds this commit,
+                # and any commit it misses is journaled after it
+                self._write_checkpoint(0, snapshot.encode(stored if stored is not None else load_stored()))
+                open(self.segment_path(0), 'a').close()
+                self._add_entry(0, timestamp)
+                return False
+
+            segment = self.segment_path(last[0])
+            seq = self._last_seq(segment, last[0]) + 1
+            with open(segment, 'a') as f:
+                f.write(json.dumps({"seq": seq, "timestamp": timestamp, "changes": changes},
+                                   separators=(',', ':')) + "\n")
+            if os.path.getsize(segment) >= self.segment_bytes:
+                open(self.segment_path(seq), 'a').close()
+                self._add_entry(seq, timestamp)
+                return True
+            return not os.path.exists(self.checkpoint_path(last[0]))
+
+    def _write_checkpoint(self, seq: int, encoded: bytes) -> None:
+        temp_path = f"{self.checkpoint_path(seq)}.tmp.{os.getpid()}"
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path(seq))
+
+    def _records(self, seq: int, mentioning: Optional[str] = None) -> List[Dict]:
+        """Records of a segment, or only those whose text mentions a string"""
+        try:
+            with open(self.segment_path(seq), 'r') as f:
+                return [json.loads(line) for line in f
+                        if line.endswith("\n") and (mentioning is None or mentioning in line)]
+        except FileNotFoundError:
+            return []
+
+    def build_checkpoints(self) -> int:
+        """Write the checkpoint files that were cut but not built yet; returns how many"""
+        with self.lock("build", blocking=False) as taken:
+            if not taken:
+                return 0  # Another worker is building them
+            last = self._last_entry()
+            pending = self.checkpoints_until(last[1]) if last else []
+            built = 0
+            for (previous, _), (seq, _) in zip(pending, pending[1:]):
+                data = self._snapshot(previous).checkout()
+                for record in self._records(previous):
+                    if record["seq"] > seq:
+                        break
+                    for name, key, change in record["changes"]:
+                        section = data[name]
+                        current = section[key].to_dict() if key in section else None
+                        row = _replay(current, change)
+                        if row is None:
+                            if key in section:
+                                del section[key]
+                        else:
+                            section[key] = _ROW_TYPES[name].from_dict(key, row)
+                self._write_checkpoint(seq, snapshot.encode(data))
+                built += 1
+            return built
+
+    # Reading
+
+    def _snapshot(self, seq: int) -> snapshot.Snapshot:
+        with self._open_lock:
+            found = self._open.get(seq)
+            if found is not None:
+                self._open.move_to_end(seq)
+                return found
+        found = snapshot.open_snapshot(self.checkpoint_path(seq))
+        with self._open_lock:
+            self._open[seq] = found
+            while len(self._open) > OPEN_CHECKPOINTS:
+                self._open.popitem(last=False)
+        return found
+
+    def row_at(self, name: str, key: str, timestamp: str) -> Optional[Tuple[Optional[Dict], Dict]]:
+        """A row as it was at a time, and how it was rebuilt; None before the history starts
+
+        The row is None if it did not exist at that time.
+        """
+        checkpoints = self.checkpoints_until(timestamp)
+        if not checkpoints:
+            return None
+        start, started_at = checkpoints[0]
+        base = self._snapshot(start).sections[name]
+        found = base.find(key)
+        row = base.materialize(found, key).to_dict() if found is not None else None
+
+        # Only records naming the key can change its row
+        replayed = 0
+        for seq, _ in checkpoints:
+            for record in self._records(seq, json.dumps(key)):
+                if record["timestamp"] > timestamp:
+                    break
+                for section, changed_key, change in record["changes"]:
+                    if section == name and changed_key == key:
+                        row = _replay(row, change)
+                        replayed += 1
+        return row, {"checkpoint": started_at, "changes_replayed": replayed}
@@ -0,0 +1,481 @@
+import os
+import sys
+import json
+import time
+import glob
+import math
+import queue
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Optional, Any, Iterable
+
+# Workload trace replay
+#
+# Turns an audit log (cargo_logs.json, or a synthetic trace in the same shape)
+# into the API requests that produced it and replays them on the original
+# schedule, sped up, from a pool of concurrent clients. Requests are sent
+# open loop: each one goes out at its scheduled time whether or not earlier
+# ones have finished, so queueing in the backend shows up as latency instead
+# of silently slowing the replay down. Requests for the same item always go
+# to the same client, which keeps a place / retrieve / waste sequence in order.
+#
+# Replays run in-process against a scratch copy of the data files in the
+# current directory (the originals are never touched), or over HTTP against a
+# running deployment with --url. The report gives latency percentiles and
+# error rates per action and how the data files grew during the run.
+#
+#   python loadtest.py --trace cargo_logs.json --speedup 60 --concurrency 8
+#   python loadtest.py --synthetic 20000 --rate 200 --url http://localhost:8000
+
+DATA_FILES = ("cargo_data.json", "cargo_data.snap", "cargo_logs.json", "cargo_logs.rollups.json",
+              "cargo_logs.????-??-??.json.gz", "cargo_events.jsonl")
+DATA_DIRS = ("cargo_history", "cargo_sandboxes")  # reported by their total size
+SYNTHETIC_MIX = {  # action -> share of a synthetic trace
+    "search_item": 0.35,
+    "view_item": 0.2,
+    "place_item": 0.2,
+    "retrieve_item": 0.15,
+    "mark_as_waste": 0.05,
+    "update_item": 0.03,
+    "return_planning": 0.02
+}
+CATEGORIES = ("food", "medical", "scientific", "general", "tools")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# Requests from log entries
+
+class Request:
+    __slots__ = ("offset", "action", "method", "path", "body", "key")
+
+    def __init__(self, offset: float, action: str, method: str, path: str, body: Any = None,
+                 key: Optional[str] = None):
+        self.offset = offset  # Seconds after the start of the trace
+        self.action = action
+        self.method = method
+        self.path = path
+        self.body = body
+        self.key = key  # Item the request touches, if any
+
+
+class TraceMapper:
+    """Turns log entries into requests, giving the items and containers a trace creates fresh IDs"""
+
+    def __init__(self, run_id: str, seed: int = 1):
+        self.run_id = run_id
+        self.random = random.Random(seed)
+        self.ids: Dict[str, str] = {}
+
+    def _new(self, original: str) -> str:
+        self.ids[original] = f"{self.run_id}-{original}"
+        return self.ids[original]
+
+    def _id(self, original: str) -> str:
+        return self.ids.get(original, original)
+
+    def _item_body(self, item_id: str, name: str) -> Dict:
+        return {
+            "item_id": item_id,
+            "name": name,
+            "volume": round(self.random.uniform(0.1, 3), 2),
+            "weight": round(self.random.uniform(0.1, 5), 2),
+            "priority": self.random.randint(1, 5),
+            "category": self.random.choice(CATEGORIES)
+        }
+
+    def requests(self, action: str, details: Dict, offset: float) -> List[Request]:
+        """The requests one logged action stands for; none for actions that cannot be replayed"""
+        if action == 'place_item':
+            item_id = self._new(details['item_id'])
+            return [Request(offset, action, 'POST', '/api/place_item',
+                            self._item_body(item_id, details.get('item_name', 'Replayed item')), item_id)]
+        if action == 'search_item':
+            query = urllib.parse.urlencode({key: details[key] for key in ('query', 'category') if details.get(key)})
+            return [Request(offset, action, 'GET', f"/api/find_item?{query}")]
+        if action == 'view_item':
+            item_id = self._id(details['item_id'])
+            return [Request(offset, action, 'GET', f"/api/item/{item_id}", key=item_id)]
+        if action == 'retrieve_item':
+            item_id = self._id(details['item_id'])
+            return [Request(offset, action, 'POST', f"/api/retrieve_item/{item_id}", key=item_id)]
+        if action == 'mark_as_waste':
+            item_id = self._id(details['item_id'])
+            return [Request(offset, action, 'POST', '/api/mark_as_waste',
+                            {"item_id": item_id, "reason": details.get('reason', 'expired')}, item_id)]
+        if action == 'update_item':
+            item_id = self._id(details['item_id'])
+            changes = {key: value for key, value in (details.get('new_data') or {}).items()
+                       if key in ('priority', 'expiration_date', 'name')}
+            return [Request(offset, action, 'PUT', f"/api/update_item/{item_id}",
+                            changes or {"priority": self.random.randint(1, 5)}, item_id)]
+        if action == 'rearrange_items':
+            plan = [dict(move, item_id=self._id(move['item_id'])) for move in details.get('plan', [])
+                    if isinstance(move, dict) and 'item_id' in move]
+            return [Request(offset, action, 'POST', '/api/rearrange_items', {"rearrangement_plan": plan})]
+        if action == 'reslot_items':
+            return [Request(offset, action, 'POST', '/api/reslotting', {"moves": len(details.get('plan', []))})]
+        if action == 'sweep_expired':
+            return [Request(offset, action, 'POST', '/api/sweep_expired', {})]
+        if action == 'return_planning':
+            return [Request(offset, action, 'GET', f"/api/return_planning/{details['waste_container_id']}")]
+        if action == 'confirm_return':
+            return [Request(offset, action, 'POST', f"/api/confirm_return/{details['waste_container_id']}")]
+        if action == 'create_undock_plan':
+            return [Request(offset, action, 'POST', '/api/undock_plan',
+                            {"module_id": details['module_id'], "undock_date": details.get('undock_date')})]
+        if action == 'add_container':
+            return [Request(offset, action, 'POST', '/api/add_container', {
+                "container_id": self._new(details['container_id']), "name": details.get('container_name', ''),
+                "total_volume": 1000, "max_weight": 1000, "type": details.get('type', 'storage')})]
+        if action == 'add_waste_container':
+            return [Request(offset, action, 'POST', '/api/add_waste_container', {
+                "container_id": self._new(details['container_id']), "name": details.get('container_name', ''),
+                "total_volume": 1000, "max_weight": 1000,
+                "waste_categories": details.get('waste_categories', ['general'])})]
+        if action == 'batch':
+            operations = []
+            for entry in details.get('actions', []):
+                for request in self.requests(entry.get('action'), entry.get('details') or {}, offset):
+                    operations.append({"method": request.method, "path": request.path, "body": request.body})
+            if not operations:
+                return []
+            return [Request(offset, action, 'POST', '/api/batch',
+                            {"operations": operations, "mode": details.get('mode', 'atomic')})]
+        return []
+
+
+def load_trace(entries: Iterable[Dict], run_id: str, seed: int = 1) -> Tuple[List[Request], Dict[str, int]]:
+    """Requests for a trace, oldest first, and how many entries of each action were skipped
+
+    Log timestamps have one-second resolution, so the entries logged within a
+    second are spread evenly across it rather than all sent at once.
+    """
+    mapper = TraceMapper(run_id, seed)
+    requests, skipped = [], {}
+    seconds: Dict[datetime, List[Dict]] = {}
+    for entry in entries:
+        try:
+            seconds.setdefault(datetime.strptime(entry['timestamp'], TIMESTAMP_FORMAT), []).append(entry)
+        except (KeyError, TypeError, ValueError):
+            skipped[entry.get('action', '?')] = skipped.get(entry.get('action', '?'), 0) + 1
+
+    start = min(seconds) if seconds else None
+    for logged in sorted(seconds):
+        within = seconds[logged]
+        for index, entry in enumerate(within):
+            offset = (logged - start).total_seconds() + index / len(within)
+            try:
+                found = mapper.requests(entry.get('action'), entry.get('details') or {}, offset)
+            except (KeyError, TypeError):
+                found = []
+            if not found:
+                skipped[entry.get('action', '?')] = skipped.get(entry.get('action', '?'), 0) + 1
+            requests.extend(found)
+    return requests, skipped
+
+
+def synthetic_trace(count: int, rate: float, existing_items: List[str], seed: int = 1) -> List[Dict]:
+    """Log-shaped entries with Poisson arrivals at rate per second, in the SYNTHETIC_MIX proportions"""
+    rng = random.Random(seed)
+    actions, weights = zip(*SYNTHETIC_MIX.items())
+    items = list(existing_items)
+    wasted = set()
+    at = datetime(2025, 1, 1)
+    entries = []
+    for number in range(count):
+        at += timedelta(seconds=rng.expovariate(rate))
+        action = rng.choices(actions, weights)[0]
+        if action != 'place_item' and action not in ('search_item', 'return_planning') and not items:
+            action = 'place_item'
+        if action == 'place_item':
+            item_id = f"synthetic_{number:07d}"
+            items.append(item_id)
+            details = {"item_id": item_id, "item_name": f"Synthetic {rng.choice(CATEGORIES)} {number}"}
+        elif action == 'search_item':
+            details = {"query": rng.choice(CATEGORIES + ("synthetic", "item 1", "kit"))}
+        elif action == 'return_planning':
+            details = {"waste_container_id": "waste_001"}
+        else:
+            item_id = rng.choice(items)
+            details = {"item_id": item_id, "reason": "expired", "new_data": {"priority": rng.randint(1, 5)}}
+            if action == 'mark_as_waste' and item_id not in wasted:
+                wasted.add(item_id)
+                items.remove(item_id)
+        entries.append({"timestamp": at.strftime(TIMESTAMP_FORMAT), "action": action, "details": details})
+    return entries
+
+
+# Sending requests
+
+class HttpClient:
+    def __init__(self, url: str, timeout: float):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def send(self, request: Request) -> int:
+        body = json.dumps(request.body).encode() if request.body is not None else None
+        outgoing = urllib.request.Request(self.url + request.path, data=body, method=request.method,
+                                          headers={"Content-Type": "application/json"} if body else {})
+        try:
+            with urllib.request.urlopen(outgoing, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+
+class LocalClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, request: Request) -> int:
+        response = self.client.open(request.path, method=request.method, json=request.body)
+        response.get_data()
+        return response.status_code
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass  # Removed while walking, like an expired sandbox
+    return size
+
+
+def data_files(directory: str) -> Dict[str, int]:
+    sizes = {}
+    for pattern in DATA_FILES:
+        for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+            try:
+                sizes[os.path.basename(path)] = os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+    for name in DATA_DIRS:
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            sizes[name + "/"] = _tree_size(path)
+    return sizes
+
+
+class Replay:
+    """Sends requests on schedule from a pool of clients and records what happened"""
+
+    def __init__(self, requests: List[Request], make_client, concurrency: int, speedup: float,
+                 watch_directory: str, sample_interval: float):
+        self.requests = requests
+        self.make_client = make_client
+        self.concurrency = max(1, concurrency)
+        self.speedup = speedup
+        self.watch_directory = watch_directory
+        self.sample_interval = sample_interval
+        self.results: List[Tuple[str, float, float, int]] = []  # (action, latency, lateness, status)
+        self.growth: List[Tuple[float, Dict[str, int]]] = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _work(self, inbox: queue.Queue, started: float) -> None:
+        client = self.make_client()
+        while True:
+            request = inbox.get()
+            if request is None:
+                return
+            due = started + request.offset / self.speedup
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            sent = time.perf_counter()
+            try:
+                status = client.send(request)
+            except Exception:
+                status = 0  # No response at all
+            finished = time.perf_counter()
+            with self._lock:
+                self.results.append((request.action, finished - sent, max(0.0, sent - due), status))
+
+    def _sample(self, started: float) -> None:
+        while not self._done.wait(self.sample_interval):
+            self.growth.append((time.perf_counter() - started, data_files(self.watch_directory)))
+
+    def run(self) -> float:
+        """Replay every request; returns the wall time taken"""
+        inboxes = [queue.Queue() for _ in range(self.concurrency)]
+        started = time.perf_counter() + 0.05  # Give the clients time to start
+        self.growth.append((0.0, data_files(self.watch_directory)))
+        workers = [threading.Thread(target=self._work, args=(inbox, started), daemon=True) for inbox in inboxes]
+        sampler = threading.Thread(target=self._sample, args=(started,), daemon=True)
+        for thread in workers + [sampler]:
+            thread.start()
+
+        # Requests for one item stay on one client, so they keep their order
+        spread = 0
+        for request in self.requests:
+            if request.key is not None:
+                index = hash(request.key) % self.concurrency
+            else:
+                index, spread = spread, (spread + 1) % self.concurrency
+            inboxes[index].put(request)
+        for inbox in inboxes:
+            inbox.put(None)
+        for thread in workers:
+            thread.join()
+
+        elapsed = time.perf_counter() - started
+        self._done.set()
+        sampler.join()
+        self.growth.append((elapsed, data_files(self.watch_directory)))
+        return elapsed
+
+
+# Reporting
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(results: List[Tuple[str, float, float, int]]) -> Dict[str, Dict]:
+    by_action: Dict[str, List] = {}
+    for result in results:
+        by_action.setdefault(result[0], []).append(result)
+    by_action["all"] = list(results)
+
+    summary = {}
+    for action, found in sorted(by_action.items()):
+        latencies = sorted(latency for _, latency, _, _ in found)
+        lateness = sorted(late for _, _, late, _ in found)
+        statuses: Dict[str, int] = {}
+        for _, _, _, status in found:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if status == "0" or int(status) >= 400)
+        summary[action] = {
+            "requests": len(found),
+            "error_rate": round(errors / len(found), 4) if found else 0,
+            "statuses": statuses,
+            "latency_ms": {name: round(percentile(latencies, fraction) * 1000, 2)
+                           for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+            "late_p99_ms": round(percentile(lateness, 0.99) * 1000, 2)
+        }
+    return summary
+
+
+def growth_report(growth: List[Tuple[float, Dict[str, int]]]) -> Dict:
+    first, last = growth[0][1], growth[-1][1]
+    names = sorted(set(first) | set(last))
+    return {
+        "files": {name: {"start_bytes": first.get(name, 0), "end_bytes": last.get(name, 0),
+                         "growth_bytes": last.get(name, 0) - first.get(name, 0)} for name in names},
+        "samples": [{"seconds": round(at, 2), "total_bytes": sum(sizes.values())} for at, sizes in growth]
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"Replayed {report['requests']} requests in {report['seconds']:.2f}s "
+          f"({report['throughput']:.1f}/s, speed-up {report['speedup']}x, {report['concurrency']} clients)")
+    if report['skipped']:
+        print("Skipped log entries: " + ", ".join(f"{action} {count}" for action, count in report['skipped'].items()))
+    print(f"\n{'action':<22}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'late p99':>10}")
+    for action, row in report['actions'].items():
+        latency = row['latency_ms']
+        print(f"{action:<22}{row['requests']:>9}{row['error_rate']:>8.1%}{latency['p50']:>9}"
+              f"{latency['p90']:>9}{latency['p99']:>9}{latency['max']:>9}{row['late_p99_ms']:>10}")
+    print(f"\n{'file':<32}{'start':>12}{'end':>12}{'growth':>12}")
+    for name, sizes in report['data_growth']['files'].items():
+        print(f"{name:<32}{sizes['start_bytes']:>12}{sizes['end_bytes']:>12}{sizes['growth_bytes']:>12}")
+
+
+# Command line
+
+def scratch_copy(source: str) -> str:
+    """A temporary directory holding copies of the data files in source"""
+    directory = tempfile.mkdtemp(prefix="cargo-replay-")
+    for pattern in DATA_FILES:
+        for path in glob.glob(os.path.join(glob.escape(source), pattern)):
+            shutil.copy2(path, directory)
+    for name in DATA_DIRS:
+        if os.path.isdir(os.path.join(source, name)):
+            shutil.copytree(os.path.join(source, name), os.path.join(directory, name))
+    return directory
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Replay a cargo log or a synthetic trace against the backend")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="audit log to replay (JSON array, as cargo_logs.json)")
+    source.add_argument("--synthetic", type=int, metavar="N", help="replay N synthetic requests instead")
+    parser.add_argument("--rate", type=float, default=50, help="synthetic requests per second before speed-up")
+    parser.add_argument("--speedup", type=float, default=1, help="replay this many times faster than recorded")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--url", help="replay over HTTP against this deployment instead of in-process")
+    parser.add_argument("--data-dir", default=".", help="data files to copy (in-process) or watch (--url)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between data file samples")
+    parser.add_argument("--timeout", type=float, default=30, help="HTTP request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+    trace_path = os.path.abspath(args.trace) if args.trace else None
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    run_id = f"replay{int(time.time())}"
+    if args.url:
+        watch_directory = args.data_dir
+        make_client = lambda: HttpClient(args.url, args.timeout)
+    else:
+        # Import the app inside a scratch copy, so it reads and writes the copies
+        watch_directory = scratch_copy(args.data_dir)
+        os.chdir(watch_directory)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import main as backend
+        backend.initialize_sample_data()
+        make_client = lambda: LocalClient(backend.app)
+
+    if args.trace:
+        with open(trace_path) as f:
+            entries = json.load(f)
+    else:
+        existing = []
+        if not args.url:
+            existing = [item_id for item_id, item in backend.load_data()['items'].items()
+                        if str(item.status) == "active"]
+        entries = synthetic_trace(args.synthetic, args.rate, existing, args.seed)
+    requests, skipped = load_trace(entries, run_id, args.seed)
+
+    replay = Replay(requests, make_client, args.concurrency, args.speedup, watch_directory, args.sample_interval)
+    seconds = replay.run()
+    if not args.url:
+        backend.log_writer.flush()
+        replay.growth[-1] = (replay.growth[-1][0], data_files(watch_directory))
+
+    report = {
+        "requests": len(requests),
+        "seconds": round(seconds, 3),
+        "throughput": len(requests) / seconds if seconds else 0,
+        "speedup": args.speedup,
+        "concurrency": args.concurrency,
+        "skipped": skipped,
+        "actions": summarize(replay.results),
+        "data_growth": growth_report(replay.growth)
+    }
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import os
+import gzip
+import json
+import glob
+import fcntl
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, List, Tuple, Optional, Iterator
+
+import audit_log
+import models
+
+# Log retention
+#
+# The active audit log only holds the most recent days. Compaction seals every
+# older day into its own gzip-compressed segment next to the log, and at the
+# same time rolls the day up into one aggregate record per action: how many
+# times it happened, per item (and for retrievals per category) counts, and the
+# sums analytics need. Raw entries in segments are then dropped per action once
+# they are older than that action's retention window; the rollups are kept for
+# the whole mission.
+#
+# Batch entries (see /api/batch) are rolled up as the actions they carried.
+
+ROLLUP_SUFFIX = ".rollups.json"
+
+
+def entry_day(entry: Dict) -> str:
+    return entry.get('timestamp', '')[:10]
+
+
+def _entry_key(entry: Dict) -> str:
+    return json.dumps(entry, sort_keys=True)
+
+
+def iter_actions(entries: List[Dict]) -> Iterator[Dict]:
+    """Entries with batch entries expanded into the actions they carried"""
+    for entry in entries:
+        if entry.get('action') == 'batch':
+            yield from entry.get('details', {}).get('actions', [])
+        else:
+            yield entry
+
+
+def _entry_items(details: Dict) -> List[str]:
+    if details.get('item_id'):
+        return [details['item_id']]
+    return [move['item_id'] for move in details.get('plan', []) if isinstance(move, dict) and 'item_id' in move]
+
+
+def summarize(entries: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+    """Daily per-action aggregates of log entries, keyed by (day, action)"""
+    records: Dict[Tuple[str, str], Dict] = {}
+    search_timestamps = {}
+    for entry in iter_actions(entries):
+        action = entry.get('action')
+        details = entry.get('details') or {}
+        day = entry_day(entry)
+        record = records.get((day, action))
+        if record is None:
+            record = records[(day, action)] = {"date": day, "action": action, "count": 0, "items": {},
+                                               "moves": 0, "retrieval_seconds": 0, "timed_retrievals": 0}
+        record["count"] += 1
+        for item_id in _entry_items(details):
+            record["items"][item_id] = record["items"].get(item_id, 0) + 1
+
+        if action == 'rearrange_items':
+            record["moves"] += len(details.get('plan', []))
+        elif action == 'search_item':
+            for result in details.get('results', []):
+                search_timestamps[result] = models.parse_datetime(entry['timestamp'])
+        elif action == 'retrieve_item':
+            if details.get('category'):
+                categories = record.setdefault("categories", {})
+                categories[details['category']] = categories.get(details['category'], 0) + 1
+            if details.get('item_id') in search_timestamps:
+                record["retrieval_seconds"] += models.parse_datetime(entry['timestamp']) - search_timestamps[details['item_id']]
+                record["timed_retrievals"] += 1
+    return records
+
+
+def combine(records: List[Dict]) -> Dict[str, Dict]:
+    """Totals per action over any mix of rollup records"""
+    totals: Dict[str, Dict] = {}
+    for record in records:
+        total = totals.setdefault(record["action"], {"count": 0, "moves": 0, "retrieval_seconds": 0,
+                                                     "timed_retrievals": 0})
+        for field in total:
+            total[field] += record.get(field, 0)
+    return totals
+
+
+class LogArchive:
+    """Compressed daily segments and rollups kept alongside an audit log file"""
+
+    def __init__(self, path: str, active_days: int, retention_days: Dict[str, int],
+                 default_retention_days: Optional[int] = None):
+        self.path = path
+        self.active_days = active_days
+        self.retention_days = retention_days
+        self.default_retention_days = default_retention_days
+        self.stem = path[:-5] if path.endswith(".json") else path
+        self.rollup_path = self.stem + ROLLUP_SUFFIX
+
+    def segment_path(self, day: str) -> str:
+        return f"{self.stem}.{day}.json.gz"
+
+    def segment_days(self) -> List[str]:
+        prefix = len(self.stem) + 1
+        return sorted(path[prefix:prefix + 10] for path in glob.glob(glob.escape(self.stem) + ".????-??-??.json.gz"))
+
+    @contextmanager
+    def lock(self):
+        """Held while compacting, so only one process compacts at a time"""
+        with open(f"{self.path}.compact.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Reading
+
+    def read_segment(self, day: str) -> List[Dict]:
+        try:
+            with gzip.open(self.segment_path(day), 'rt') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def read(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> List[Dict]:
+        """Sealed entries for the days in range, oldest first (active entries are read separately)"""
+        entries = []
+        for day in self.segment_days():
+            if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+                entries.extend(self.read_segment(day))
+        return entries
+
+    def rollups(self) -> List[Dict]:
+        if not os.path.exists(self.rollup_path):
+            return []
+        with open(self.rollup_path, 'r') as f:
+            return json.load(f)
+
+    # Compaction
+
+    def _write_json(self, path: str, value, compress: bool = False) -> None:
+        temp_path = f"{path}.tmp.{os.getpid()}"
+        opener = gzip.open if compress else open
+        with opener(temp_path, 'wt') as f:
+            json.dump(value, f)
+        os.replace(temp_path, path)
+
+    def _retention_for(self, action: str) -> Optional[int]:
+        return self.retention_days.get(action, self.default_retention_days)
+
+    def compact(self, today: date) -> Dict:
+        """Seal old days into segments and rollups, then apply retention windows"""
+        cutoff = (today - timedelta(days=self.active_days - 1)).isoformat()
+        days_sealed: List[str] = []
+        with self.lock():
+            # Segments and rollups are written before the entries leave the active log
+            sealed = audit_log.split_entries(self.path, lambda entry: entry_day(entry) < cutoff,
+                                             seal=lambda entries: days_sealed.extend(self._seal(entries)))
+            expired = self._apply_retention(today)
+        return {"entries_sealed": len(sealed), "days_sealed": days_sealed, "entries_expired": expired}
+
+    def _seal(self, entries: List[Dict]) -> List[str]:
+        """Add entries to their days' segments and rebuild those days' rollups; returns the days
+
+        Entries a segment already holds (left by a compaction that stopped before the
+        active log was rewritten) are not added again, and each day's rollups are
+        rebuilt from its whole segment, so sealing the same entries twice changes nothing.
+        """
+        by_day: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            by_day.setdefault(entry_day(entry), []).append(entry)
+
+        segments: Dict[str, List[Dict]] = {}
+        for day, day_entries in sorted(by_day.items()):
+            segment = self.read_segment(day)
+            stored = Counter(_entry_key(entry) for entry in segment)
+            for entry in day_entries:
+                key = _entry_key(entry)
+                if stored[key]:
+                    stored[key] -= 1
+                else:
+                    segment.append(entry)
+            self._write_json(self.segment_path(day), segment, compress=True)
+            segments[day] = segment
+
+        rollups = [record for record in self.rollups() if record["date"] not in segments]
+        rollups.extend(summarize([entry for day in sorted(segments) for entry in segments[day]]).values())
+        self._write_json(self.rollup_path, sorted(rollups, key=lambda r: (r["date"], r["action"])))
+        return sorted(by_day)
+
+    def _apply_retention(self, today: date) -> int:
+        """Drop raw entries older than their action's retention window; returns how many"""
+        windows = [days for days in [*self.retention_days.values(), self.default_retention_days] if days is not None]
+        if not windows:
+            return 0
+        expired = 0
+        for day in self.segment_days():
+            age = (today - date.fromisoformat(day)).days
+            if age <= min(windows):
+                continue
+            entries = self.read_segment(day)
+            kept = [entry for entry in entries
+                    if self._retention_for(entry.get('action')) is None or age <= self._retention_for(entry.get('action'))]
+            if len(kept) == len(entries):
+                continue
+            expired += len(entries) - len(kept)
+            if kept:
+                self._write_json(self.segment_path(day), kept, compress=True)
+            else:
+                os.remove(self.segment_path(day))
+        return expired
@@ -1,18 +1,173 @@
 import os
 import json
 import time
-import heapq
+import threading
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from werkzeug.exceptions import HTTPException
 from typing import Dict, List, Tuple, Any, Optional
 
+import models
+import metrics
+import audit_log
+import snapshot
+import placement
+import retrieval
+import waste
+import rearrangement
+import events
+import overlay
+import log_retention
+import sandbox
+import reslotting
+import facets
+import forecasting
+import history
+import admission
+import export
+import reservations
+import consolidation
+import mass
+
 app = Flask(__name__)
 
 # Configuration
 DATA_FILE = "cargo_data.json"
 LOG_FILE = "cargo_logs.json"
+SNAPSHOT_FILE = "cargo_data.snap"
+
+# "snapshot" keeps cargo data in a single snapshot file (see snapshot.py), only reading
+# the JSON file to migrate it; "json" keeps the original JSON file.
+STORAGE_FORMAT = "snapshot"
+MODULE_ADJACENCY = {}  # module -> neighbouring modules; defaults to neighbours in ID order
+MODULE_POSITIONS = {}  # module -> (x, y, z) of its center in metres, for the center of mass
+
+# Instrumentation: set this header to "1" to sample-profile a single request (honoured,
+# like /metrics, for loopback clients only unless METRICS_ALLOW_REMOTE is set)
+PROFILE_HEADER = "X-Cargo-Profile"
+PROFILE_SAMPLE_INTERVAL = 0.001  # seconds between stack samples
+METRICS_ALLOW_REMOTE = False  # /metrics is served to loopback clients only
+
+# Audit log durability per action; anything not listed is written synchronously.
+# Use audit_log.SAMPLE with a rate in LOG_SAMPLE_RATES to keep only a fraction.
+LOG_DURABILITY = {
+    "search_item": audit_log.BATCH,
+    "view_item": audit_log.BATCH,
+    "return_planning": audit_log.BATCH,
+    "plan_retrieval_route": audit_log.BATCH
+}
+LOG_SAMPLE_RATES = {}  # action -> fraction of entries kept (0-1)
+LOG_QUEUE_SIZE = 10000  # queued entries beyond this are dropped, never blocking a request
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = 0.5  # seconds
+
+# Log retention (see log_retention.py): `flask --app main compact-logs` seals days older
+# than LOG_ACTIVE_DAYS into compressed segments and rollups, then drops raw entries of
+# the listed actions once they are older than their window. None keeps raw entries.
+LOG_ACTIVE_DAYS = 2
+LOG_RETENTION_DAYS = {
+    "search_item": 30,
+    "view_item": 30,
+    "return_planning": 30,
+    "plan_retrieval_route": 30
+}
+LOG_DEFAULT_RETENTION_DAYS = None
+
+# Change events (see events.py), streamed to dashboards from /api/events
+EVENTS_FILE = "cargo_events.jsonl"
+EVENTS_MAX_BYTES = 16 * 1024 * 1024  # the older half of the journal is dropped beyond this
+EVENTS_STREAM_SECONDS = 300  # clients reconnect (resuming from their last version) after this
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_POLL_INTERVAL = 0.5  # seconds between checks for events committed by other workers
+EVENTS_RETRY_MS = 2000
+CHANGES_PAGE_SIZE = 5000  # events folded into one /api/changes response
+
+# /api/batch runs operations on one shared state; "atomic" batches apply all or nothing,
+# "best_effort" batches keep every operation that succeeds
+BATCH_MAX_OPERATIONS = 1000
+BATCH_EXCLUDED_PATHS = ("/api/batch", "/api/events", "/api/sandboxes",
+                        "/api/reslotting", "/api/mass_distribution")  # and everything under them
+
+# Accessibility re-slotting (see reslotting.py): moves proposed or made per run, and
+# how often each worker catches its optimizer up in the background (None: on demand only)
+RESLOT_MOVE_BUDGET = 20
+RESLOT_INTERVAL_SECONDS = None
+
+# Container consolidation (see consolidation.py): limits per plan, and the priority from
+# which items only move to containers at least as accessible as the one they leave
+CONSOLIDATION_MAX_CONTAINERS = 10
+CONSOLIDATION_MOVE_BUDGET = 200
+CONSOLIDATION_PROTECTED_PRIORITY = 4
+
+# Retrieval routes (see retrieval.py): items per task list, since sequencing compares
+# every pair of containers on the route
+RETRIEVAL_MAX_ITEMS = 200
+
+# What-if sandboxes (see sandbox.py) are kept as files that every worker process can
+# open, and dropped once idle
+SANDBOX_DIR = "cargo_sandboxes"
+SANDBOX_MAX = 50
+SANDBOX_IDLE_SECONDS = 3600
+
+# Consumption forecasting (see forecasting.py): usage rates are moving averages of
+# retrievals per day with this half-life; projections look this far ahead
+FORECAST_HALF_LIFE_DAYS = 7
+FORECAST_HORIZON_DAYS = 30
+FORECAST_AT_RISK_LIMIT = 50  # at-risk items listed per forecast
+
+# Point-in-time history (see history.py): every commit is journaled, and a checkpoint
+# of the whole station is cut each time the journal grows by this much, so a query
+# replays at most this much journal. Each checkpoint is a full copy of the data.
+HISTORY_DIR = "cargo_history"
+HISTORY_SEGMENT_BYTES = 8 * 1024 * 1024
+
+# Admission control (see admission.py): heavy analytics routes are limited across all
+# worker processes, so running plus queued ones stay below WORKER_COUNT and
+# crew-critical routes (everything not listed, including every crew mutation) always
+# find a free worker. Requests that find the queue full, or wait longer than max_wait,
+# get 503 with Retry-After. Slot files are kept next to the data files, in a directory
+# made on first use.
+WORKER_COUNT = 4  # Worker processes serving the app (gunicorn -w)
+ANALYTICS_CONCURRENCY = max(1, WORKER_COUNT // 2)
+ADMISSION_DIR = "cargo_admission"
+ADMISSION_CLASSES = {
+    "critical": admission.ClassLimits(),
+    "analytics": admission.ClassLimits(concurrency=ANALYTICS_CONCURRENCY,
+                                       queue=max(0, WORKER_COUNT - ANALYTICS_CONCURRENCY - 1), max_wait=2.0)
+}
+ADMISSION_DEFAULT_CLASS = "critical"
+ADMISSION_ROUTES = {  # endpoint -> (class, concurrency limit of its own or None)
+    "get_efficiency_metrics": ("analytics", 1),
+    "reslot_items": ("analytics", 1),
+    "consolidate_containers": ("analytics", 1),
+    "get_storage_status": ("analytics", None),
+    "get_forecast": ("analytics", None),
+    "get_logs": ("analytics", None),
+    "export_json": ("analytics", None),
+    "export_dataset": ("analytics", None)
+}
+
+log_writer = audit_log.AuditLogWriter(LOG_FILE, LOG_DURABILITY, LOG_SAMPLE_RATES,
+                                      LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+log_archive = log_retention.LogArchive(LOG_FILE, LOG_ACTIVE_DAYS, LOG_RETENTION_DAYS,
+                                       LOG_DEFAULT_RETENTION_DAYS)
+snapshot_store = snapshot.SnapshotStore(SNAPSHOT_FILE)
+event_journal = events.EventJournal(EVENTS_FILE, EVENTS_MAX_BYTES)
+sandboxes = sandbox.SandboxRegistry(SANDBOX_DIR, SANDBOX_MAX, SANDBOX_IDLE_SECONDS)
+reslotter = reslotting.Reslotter()
+placement_index = placement.PlacementIndex(MODULE_ADJACENCY)
+mass_tracker = mass.MassTracker(MODULE_POSITIONS)
+forecaster = forecasting.Forecaster(LOG_FILE, log_archive, FORECAST_HALF_LIFE_DAYS)
+history_store = history.HistoryStore(HISTORY_DIR, HISTORY_SEGMENT_BYTES)
+admission_control = admission.AdmissionController(ADMISSION_DIR, ADMISSION_CLASSES, ADMISSION_ROUTES,
+                                                  ADMISSION_DEFAULT_CLASS)
+reslot_worker = {"pid": None}  # the process whose background thread is running
+batch_context = threading.local()  # state shared by the operations of a running batch
 
 # Data Structure
+# In memory each section maps IDs to model objects (models.Item, models.Container,
+# models.WasteContainer) holding dates as day ordinals; this is the JSON shape
+# they are converted to at the API boundary and in DATA_FILE.
 # {
 #   "items": {
 #     "item_id": {
@@ -37,7 +192,12 @@ LOG_FILE = "cargo_logs.json"
 #       "current_weight": float,
 #       "items": ["item_id1", "item_id2"],
 #       "type": "storage/waste/return",
-#       "accessibility_factor": float (0-1, how easy to access)
+#       "accessibility_factor": float (0-1, how easy to access),
+#       "module": "module_id" (optional),
+#       "rack": "rack_id" (optional; zones are modules, then racks within them),
+#       "reserved_volume": float, "reserved_weight": float,
+#       "reserved_until": "YYYY-MM-DD HH:MM:SS" (only while reservations hold capacity in it:
+#                         when the first of them expires)
 #     }
 #   },
 #   "waste_containers": {
@@ -48,26 +208,71 @@ LOG_FILE = "cargo_logs.json"
 #       "max_weight": float,
 #       "current_weight": float,
 #       "waste_categories": ["organic", "plastic", "electronic", "etc"],
-#       "undock_date": "YYYY-MM-DD"
+#       "undock_date": "YYYY-MM-DD",
+#       "module": "module_id" (optional)
+#     }
+#   },
+#   "reservations": {
+#     "reservation_id": {
+#       "vehicle": "vehicle_id",
+#       "expires_at": "YYYY-MM-DD HH:MM:SS",
+#       "item_ids": ["item_id1"] or null (any item),
+#       "holds": {"container_id": {"volume": float, "weight": float}}
 #     }
 #   }
 # }
 
 def load_data() -> Dict:
     """Load cargo data from file"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {
-        "items": {},
-        "containers": {},
-        "waste_containers": {}
-    }
+    if getattr(batch_context, 'data', None) is not None:
+        return batch_context.data
+    with metrics.phase("load"):
+        if STORAGE_FORMAT == "snapshot" and snapshot_store.exists():
+            data = snapshot_store.load()
+        elif os.path.exists(DATA_FILE):
+            with open(DATA_FILE, 'r') as f:
+                data = models.from_json(json.load(f))
+        else:
+            return {
+                "items": {},
+                "containers": {},
+                "waste_containers": {}
+            }
+        # Holds are released as soon as their reservation expires, not when it is next cleaned up
+        reservations.expire(data)
+        return data
 
 def save_data(data: Dict) -> None:
-    """Save cargo data to file"""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save cargo data to file and journal the changes as events and history"""
+    if getattr(batch_context, 'data', None) is not None:
+        return  # The batch saves once, after its last operation
+    with metrics.phase("persist"):
+        # Changes are journaled under the store's write lock, so they follow commit order
+        if STORAGE_FORMAT == "snapshot":
+            rows = events.changed_rows(data)
+            snapshot_store.save(data, on_commit=lambda: journal_commit(rows, snapshot_store.load))
+            return
+        previous = None
+        if os.path.exists(DATA_FILE):
+            with open(DATA_FILE, 'r') as f:
+                previous = models.from_json(json.load(f))
+        rows = events.changed_rows(data, previous)
+        with open(DATA_FILE, 'w') as f:
+            json.dump(models.to_json(data), f, indent=2)
+        journal_commit(rows, lambda: data)
+
+def journal_commit(rows: List[Tuple[str, str, Any, Any]], load_stored) -> None:
+    """Journal the rows a commit changed as events and history"""
+    event_journal.append(events.to_events(rows))
+    if history_store.record(rows, load_stored):
+        # Checkpoint files are built away from the commit, holding no store lock
+        threading.Thread(target=build_history_checkpoints, name="history-checkpoints", daemon=True).start()
+
+def build_history_checkpoints() -> None:
+    try:
+        history_store.build_checkpoints()
+    except Exception:
+        app.logger.exception("Building history checkpoints failed")
 
 def log_action(action: str, details: Dict) -> None:
     """Log astronaut actions"""
@@ -77,20 +282,175 @@ def log_action(action: str, details: Dict) -> None:
         "details": details
     }
     
-    # Load existing logs
-    logs = []
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'r') as f:
-            logs = json.load(f)
+    if getattr(batch_context, 'entries', None) is not None:
+        batch_context.entries.append(log_entry)
+        return log_entry
     
-    logs.append(log_entry)
-    
-    # Save updated logs
-    with open(LOG_FILE, 'w') as f:
-        json.dump(logs, f, indent=2)
+    # Critical mutations are appended before returning; reads are group-committed
+    with metrics.phase("log"):
+        log_writer.write(log_entry)
     
     return log_entry
 
+def load_logs() -> List[Dict]:
+    """Load all logs, including entries still waiting to be committed"""
+    with metrics.phase("load"):
+        return log_writer.read_all()
+
+# Request instrumentation
+@app.before_request
+def start_request_metrics():
+    """Start per-request timers and, if requested, the sampling profiler"""
+    metrics.start_request(request.endpoint or "unmatched")
+    
+    if request.headers.get(PROFILE_HEADER) == "1" and _is_local_request():
+        profiler = metrics.SamplingProfiler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        profiler.start()
+        request.environ['cargo.profiler'] = profiler
+
+@app.before_request
+def start_reslot_worker():
+    """Start this worker's background re-slotting thread, if configured"""
+    if RESLOT_INTERVAL_SECONDS is None or reslot_worker["pid"] == os.getpid():
+        return
+    reslot_worker["pid"] = os.getpid()
+    reslotting.run_periodically(
+        background_reslot,
+        RESLOT_INTERVAL_SECONDS,
+        lambda error: app.logger.exception("Background re-slotting failed", exc_info=error))
+
+@app.before_request
+def admit_request():
+    """Hold limited routes to their concurrency limits, turning requests away once their queue is full"""
+    try:
+        request.environ['cargo.admission'] = admission_control.admit(request.endpoint)
+    except admission.Rejected as rejected:
+        response = jsonify({"error": f"Server busy ({rejected.reason}), please retry"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(rejected.retry_after)
+        return response
+
+@app.teardown_request
+def release_admission(error=None):
+    """Give back the admitted request's slots"""
+    ticket = request.environ.pop('cargo.admission', None)
+    if ticket is not None:
+        ticket.release()
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record latency, phase split and payload sizes for the finished request"""
+    profiler = request.environ.pop('cargo.profiler', None)
+    if profiler:
+        profiler.stop()
+        response.headers['X-Cargo-Profile-Id'] = metrics.store_profile(metrics.current_route(), profiler)
+    
+    metrics.finish_request(response.status_code, request.content_length or 0, response.content_length or 0)
+    return response
+
+@app.errorhandler(snapshot.SnapshotConflict)
+def handle_conflict(error):
+    """Another request changed the same data first; the client should retry"""
+    return jsonify({"error": f"{error}, please retry"}), 409
+
+def _is_local_request() -> bool:
+    return METRICS_ALLOW_REMOTE or request.remote_addr in ('127.0.0.1', '::1', None)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose request metrics in Prometheus text format"""
+    if not _is_local_request():
+        return jsonify({"error": "Metrics are only available locally"}), 403
+    
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profiles', methods=['GET'])
+def list_profiles():
+    """List recently captured request profiles"""
+    if not _is_local_request():
+        return jsonify({"error": "Metrics are only available locally"}), 403
+    
+    return jsonify({
+        "status": "success",
+        "profiles": metrics.list_profiles()
+    }), 200
+
+@app.route('/metrics/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Return a captured profile as collapsed stacks (flamegraph input)"""
+    if not _is_local_request():
+        return jsonify({"error": "Metrics are only available locally"}), 403
+    
+    profile = metrics.get_profile(profile_id)
+    if not profile:
+        return jsonify({"error": f"Profile {profile_id} not found"}), 404
+    
+    return Response(profile[1], mimetype='text/plain')
+
+# Live change events
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Stream committed changes as server-sent events, resuming after Last-Event-ID or ?since="""
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since) if since is not None else event_journal.latest_version()
+    except ValueError:
+        return jsonify({"error": "since must be a version number"}), 400
+    
+    def stream():
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        for batch in event_journal.follow(since, EVENTS_STREAM_SECONDS, EVENTS_HEARTBEAT_SECONDS,
+                                          EVENTS_POLL_INTERVAL):
+            if batch is None:
+                yield ": heartbeat\n\n"
+                continue
+            for event in batch:
+                yield f"id: {event['version']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Items and containers created, modified or deleted since a version, for delta sync"""
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "since must be a version number"}), 400
+    
+    # Read the journal before the data, so the state returned is at least as new as the version
+    found, oldest = event_journal.read_since(since, limit=CHANGES_PAGE_SIZE)
+    if oldest and since < oldest - 1:
+        return jsonify({
+            "status": "resync_required",
+            "message": f"Changes since version {since} are no longer kept; reload everything",
+            "oldest_version": oldest,
+            "latest_version": event_journal.latest_version()
+        }), 410
+    
+    data = load_data()
+    changes = {}
+    for name, touched in events.changed_entities(found).items():
+        section = data[name]
+        created, modified, deleted = {}, {}, []
+        for key, is_new in touched.items():
+            if key not in section:
+                deleted.append(key)
+            elif is_new:
+                created[key] = section[key].to_dict()
+            else:
+                modified[key] = section[key].to_dict()
+        changes[name] = {"created": created, "modified": modified, "deleted": deleted}
+    metrics.count_scanned(items=len(found))
+    
+    return jsonify({
+        "status": "success",
+        "since": since,
+        "version": found[-1]['version'] if found else max(since, event_journal.latest_version()),
+        "has_more": len(found) >= CHANGES_PAGE_SIZE,
+        **changes
+    }), 200
+
 # Feature 1: Efficient Placement of Items
 @app.route('/api/place_item', methods=['POST'])
 def place_item():
@@ -104,8 +464,25 @@ def place_item():
     # Assign a new ID if not provided
     item_id = item_data.get('item_id', f"item_{int(time.time())}")
     
+    expiration_date = parse_date_field(item_data, 'expiration_date')
+    if expiration_date is False:
+        return jsonify({"error": "expiration_date must be in YYYY-MM-DD format"}), 400
+    
+    # Items arriving on a resupply vehicle may take the capacity reserved for them
+    reservation_id = item_data.get('reservation_id')
+    reservation = None
+    if reservation_id:
+        reservations.expire(data)
+        reservation = reservations.get(data, reservation_id)
+        if reservation is None:
+            return jsonify({"error": f"Reservation {reservation_id} not found or expired"}), 404
+        if reservation["item_ids"] is not None and item_id not in reservation["item_ids"]:
+            return jsonify({"error": f"Item {item_id} is not part of reservation {reservation_id}"}), 400
+    
     # Check if container is specified
     specified_container = item_data.get('container_id')
+    if not specified_container and reservation is not None:
+        specified_container = reservations.best_container(data, reservation, item_data['volume'], item_data['weight'])
     
     if specified_container:
         # Check if container exists and has space
@@ -113,32 +490,25 @@ def place_item():
             return jsonify({"error": f"Container {specified_container} not found"}), 404
         
         container = data['containers'][specified_container]
+        hold = reservation["holds"].get(specified_container) if reservation is not None else None
         
-        # Check space availability
-        if container['used_volume'] + item_data['volume'] > container['total_volume']:
+        # Check space availability; capacity reserved for other arrivals is not available
+        held_volume, held_weight = container.held()
+        if hold is not None:
+            held_volume, held_weight = held_volume - hold["volume"], held_weight - hold["weight"]
+        if container.used_volume + held_volume + item_data['volume'] > container.total_volume:
             return jsonify({"error": f"Not enough space in container {specified_container}"}), 400
         
-        if container['current_weight'] + item_data['weight'] > container['max_weight']:
+        if container.current_weight + held_weight + item_data['weight'] > container.max_weight:
             return jsonify({"error": f"Weight limit exceeded in container {specified_container}"}), 400
         
         # Place the item
-        data['items'][item_id] = {
-            "name": item_data['name'],
-            "location": specified_container,
-            "priority": item_data.get('priority', 3),  # Default priority is 3 (medium)
-            "expiration_date": item_data.get('expiration_date'),
-            "volume": item_data['volume'],
-            "weight": item_data['weight'],
-            "category": item_data.get('category', 'general'),
-            "status": "active",
-            "arrival_date": datetime.now().strftime("%Y-%m-%d"),
-            "last_accessed": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        item = data['items'][item_id] = build_item(item_id, item_data, specified_container, expiration_date)
         
         # Update container
-        data['containers'][specified_container]['used_volume'] += item_data['volume']
-        data['containers'][specified_container]['current_weight'] += item_data['weight']
-        data['containers'][specified_container]['items'].append(item_id)
+        container.add_item(item)
+        if hold is not None:
+            reservations.consume(data, reservation_id, specified_container, item.volume, item.weight)
         
     else:
         # Find the best container using algorithm
@@ -157,23 +527,10 @@ def place_item():
                 return jsonify({"error": "No space available for this item, and rearrangement not possible"}), 400
         
         # Place the item in the best container
-        data['items'][item_id] = {
-            "name": item_data['name'],
-            "location": best_container,
-            "priority": item_data.get('priority', 3),
-            "expiration_date": item_data.get('expiration_date'),
-            "volume": item_data['volume'],
-            "weight": item_data['weight'],
-            "category": item_data.get('category', 'general'),
-            "status": "active",
-            "arrival_date": datetime.now().strftime("%Y-%m-%d"),
-            "last_accessed": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        item = data['items'][item_id] = build_item(item_id, item_data, best_container, expiration_date)
         
         # Update container
-        data['containers'][best_container]['used_volume'] += item_data['volume']
-        data['containers'][best_container]['current_weight'] += item_data['weight']
-        data['containers'][best_container]['items'].append(item_id)
+        data['containers'][best_container].add_item(item)
     
     save_data(data)
     
@@ -181,6 +538,7 @@ def place_item():
     log_action("place_item", {
         "item_id": item_id,
         "container_id": specified_container or best_container,
+        "reservation_id": reservation_id,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
     
@@ -191,47 +549,59 @@ def place_item():
         "container_id": specified_container or best_container
     }), 201
 
+def parse_date_field(request_data: Dict, field: str):
+    """Day ordinal for an optional YYYY-MM-DD request field; None if absent, False if malformed"""
+    value = request_data.get(field)
+    if value is None:
+        return None
+    try:
+        return models.parse_date(value)
+    except (TypeError, ValueError):
+        return False
+
+def build_item(item_id: str, item_data: Dict, location: str, expiration_date: Optional[int]) -> models.Item:
+    """Build a newly arrived, active item from placement request data"""
+    return models.Item(
+        item_id,
+        name=item_data['name'],
+        location=location,
+        priority=item_data.get('priority', 3),  # Default priority is 3 (medium)
+        expiration_date=expiration_date,
+        volume=item_data['volume'],
+        weight=item_data['weight'],
+        category=item_data.get('category', 'general'),
+        status=models.ItemStatus.ACTIVE,
+        arrival_date=models.today(),
+        last_accessed=models.now()
+    )
+
+def sync_placement_index() -> None:
+    """Catch the shared placement tree up with the stored data (hold its lock)"""
+    # Read the version first: the data loaded next already holds every event up to it
+    version = event_journal.latest_version()
+    data = load_data()
+    found = None
+    if placement_index.version is not None and not event_journal.behind(placement_index.version):
+        found, _ = event_journal.read_since(placement_index.version)
+    placement_index.sync(data, version, found)
+
 def find_best_container_for_item(data: Dict, item_data: Dict) -> Optional[str]:
-    """Algorithm to find the best container for a new item"""
-    item_volume = item_data['volume']
-    item_weight = item_data['weight']
-    item_priority = item_data.get('priority', 3)
-    
-    # Create a score for each container
-    container_scores = []
-    
-    for container_id, container in data['containers'].items():
-        # Skip waste and return containers
-        if container['type'] not in ['storage']:
-            continue
-            
-        # Skip containers that don't have enough space or weight capacity
-        if container['used_volume'] + item_volume > container['total_volume']:
-            continue
-            
-        if container['current_weight'] + item_weight > container['max_weight']:
-            continue
-        
-        # Calculate score based on:
-        # 1. Space efficiency (how well the item fits)
-        # 2. Accessibility factor
-        # 3. Priority alignment (match high priority items with accessible containers)
-        
-        # Space efficiency: containers with just enough space get higher scores
-        remaining_space = container['total_volume'] - container['used_volume']
-        space_efficiency = 1 - (remaining_space - item_volume) / container['total_volume']
-        
-        # Accessibility is important for high priority items
-        # High priority (5) items should go in more accessible containers
-        accessibility_score = container['accessibility_factor'] * (item_priority / 5)
-        
-        # Combine scores (adjust weights as needed)
-        total_score = (space_efficiency * 0.5) + (accessibility_score * 0.5)
-        
-        heapq.heappush(container_scores, (-total_score, container_id))  # Negative for max-heap
-    
-    # Return the best container or None if no suitable container
-    return container_scores[0][1] if container_scores else None
+    """Algorithm to find the best container for a new item, in its preferred zone if it has one"""
+    # Score containers on space efficiency (how well the item fits) and on
+    # accessibility matched to priority, nearest zone first (see placement.py)
+    query = (item_data['volume'], item_data['weight'], item_data.get('priority', 3), item_data.get('preferred_zone'))
+    if getattr(batch_context, 'data', None) is None:
+        with placement_index.lock:
+            sync_placement_index()
+            best = placement_index.tree.best_fit(*query)
+        # The shared tree may be ahead of this request's data; trust it only if the data agrees
+        if best is not None and best in data['containers'] and data['containers'][best].fits(*query[:2]):
+            return best
+    
+    # Batches and sandboxes work on uncommitted state, which only a tree of their own reflects
+    metrics.count_scanned(containers=len(data['containers']))
+    tree = placement.CapacityTree(data['containers'].items(), MODULE_ADJACENCY)
+    return tree.best_fit(*query)
 
 # Feature 2: Quick Retrieval of Items
 @app.route('/api/find_item', methods=['GET'])
@@ -240,18 +610,23 @@ def find_item():
     data = load_data()
     search_query = request.args.get('query', '').lower()
     category = request.args.get('category')
+    filters = facet_filters()
+    with_counts = request.args.get('facets') in ('1', 'true')
+    
+    # Narrow down by category, status, priority, module and container first,
+    # from the bitmap indexes (see facets.py)
+    candidates, counts = facets.search(data, filters, with_counts)
     
     # Find matching items
     matching_items = []
+    today = models.today()
+    metrics.count_scanned(items=len(candidates))
     
-    for item_id, item in data['items'].items():
-        if item['status'] != 'active':
-            continue
-            
-        if (search_query in item['name'].lower() or search_query in item_id.lower()) and \
-           (not category or item['category'] == category):
+    for item_id in candidates:
+        item = data['items'][item_id]
+        if search_query in item.name.lower() or search_query in item_id.lower():
             # Get container info for accessibility calculation
-            container = data['containers'][item['location']]
+            container = data['containers'].get(item.location)
             
             # Calculate retrieval score based on:
             # 1. Accessibility of container
@@ -259,42 +634,46 @@ def find_item():
             # 3. Priority of item
             # 4. Expiration date (items closer to expiry get priority)
             
-            # Basic retrieval time based on accessibility
-            retrieval_time = (1 - container['accessibility_factor']) * 10  # 0-10 minutes
-            
-            # Adjust for position in container (more recent items are easier to access)
-            item_index = container['items'].index(item_id)
-            position_factor = item_index / max(1, len(container['items']))
-            retrieval_time += position_factor * 5  # Add 0-5 minutes based on position
+            # Items no longer stored in a container (waste, taken out) have no estimate
+            retrieval_time = None
+            if container is not None and item_id in container.items:
+                # Basic retrieval time based on accessibility
+                retrieval_time = (1 - container.accessibility_factor) * 10  # 0-10 minutes
+                
+                # Adjust for position in container (more recent items are easier to access)
+                item_index = container.position(item_id)
+                position_factor = item_index / max(1, len(container.items))
+                retrieval_time += position_factor * 5  # Add 0-5 minutes based on position
+                retrieval_time = round(retrieval_time, 2)
             
             # Store item with its retrieval information
             item_info = {
                 "item_id": item_id,
-                "name": item['name'],
-                "location": item['location'],
-                "container_name": container['name'],
-                "priority": item['priority'],
-                "category": item['category'],
-                "estimated_retrieval_time_minutes": round(retrieval_time, 2),
-                "expiration_date": item['expiration_date']
+                "name": item.name,
+                "location": item.location,
+                "container_name": container.name if container is not None else None,
+                "priority": item.priority,
+                "category": item.category,
+                "estimated_retrieval_time_minutes": retrieval_time,
+                "expiration_date": models.format_date(item.expiration_date)
             }
+            if item.status != models.ItemStatus.ACTIVE:
+                item_info['status'] = str(item.status)
+            
+            # Check for expiring items
+            if item.expiration_date is not None:
+                days_to_expiry = item.expiration_date - today
+                item_info['days_to_expiry'] = days_to_expiry
+                
+                # Flag items expiring soon
+                if days_to_expiry <= 7:
+                    item_info['expiring_soon'] = True
             
             matching_items.append(item_info)
     
     # Sort items by retrieval time (fastest first)
-    matching_items.sort(key=lambda x: x['estimated_retrieval_time_minutes'])
-    
-    # Check for expiring items
-    current_date = datetime.now().date()
-    for item in matching_items:
-        if item['expiration_date']:
-            exp_date = datetime.strptime(item['expiration_date'], "%Y-%m-%d").date()
-            days_to_expiry = (exp_date - current_date).days
-            item['days_to_expiry'] = days_to_expiry
-            
-            # Flag items expiring soon
-            if days_to_expiry <= 7:
-                item['expiring_soon'] = True
+    matching_items.sort(key=lambda x: (x['estimated_retrieval_time_minutes'] is None,
+                                       x['estimated_retrieval_time_minutes'] or 0))
     
     # Log the search action
     log_action("search_item", {
@@ -304,11 +683,32 @@ def find_item():
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
     
-    return jsonify({
+    response = {
         "status": "success",
         "items": matching_items,
         "count": len(matching_items)
-    }), 200
+    }
+    if with_counts:
+        # Counts per facet value under every filter but that facet's own; the text query is not applied
+        response["facets"] = counts
+    return jsonify(response), 200
+
+def facet_filters() -> Dict[str, facets.FacetFilter]:
+    """Facet filters from the query string; a facet can be repeated or comma-separated"""
+    filters = {}
+    for facet in ('category', 'status', 'module', 'container'):
+        values = [value for entry in request.args.getlist(facet) for value in entry.split(',') if value]
+        if values:
+            filters[facet] = facets.FacetFilter(values)
+    filters.setdefault('status', facets.FacetFilter([models.ItemStatus.ACTIVE]))
+    
+    priorities = [int(value) for entry in request.args.getlist('priority')
+                  for value in entry.split(',') if value.strip().lstrip('-').isdigit()]
+    low = request.args.get('priority_min', type=int)
+    high = request.args.get('priority_max', type=int)
+    if priorities or low is not None or high is not None:
+        filters['priority'] = facets.FacetFilter(priorities or None, low, high)
+    return filters
 
 @app.route('/api/retrieve_item/<item_id>', methods=['POST'])
 def retrieve_item(item_id):
@@ -319,15 +719,16 @@ def retrieve_item(item_id):
         return jsonify({"error": f"Item {item_id} not found"}), 404
     
     item = data['items'][item_id]
-    container_id = item['location']
+    container_id = item.location
     
     # Update last accessed time
-    data['items'][item_id]['last_accessed'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    item.last_accessed = models.now()
     
     # Log retrieval
     log_action("retrieve_item", {
         "item_id": item_id,
-        "item_name": item['name'],
+        "item_name": item.name,
+        "category": item.category,
         "container_id": container_id,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
@@ -337,9 +738,109 @@ def retrieve_item(item_id):
     return jsonify({
         "status": "success",
         "message": f"Item {item_id} retrieved",
-        "item": data['items'][item_id]
+        "item": item.to_dict()
+    }), 200
+
+# Consumption forecasting
+def sync_forecaster(data: Dict) -> None:
+    """Catch the forecaster up with the audit log (hold its lock)"""
+    log_writer.flush()
+    
+    def category_of(item_id: str) -> Optional[str]:
+        # Only for entries logged before retrievals recorded the category
+        item = data['items'].get(item_id)
+        return item.category if item is not None else None
+    
+    with metrics.phase("forecast"):
+        forecaster.sync(category_of)
+
+@app.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    """Project usage, depletion and expiry risk per category from retrieval history"""
+    horizon_days = request.args.get('horizon_days', FORECAST_HORIZON_DAYS, type=int)
+    limit = request.args.get('limit', FORECAST_AT_RISK_LIMIT, type=int)
+    if horizon_days <= 0 or limit < 0:
+        return jsonify({"error": "horizon_days must be positive and limit non-negative"}), 400
+    
+    data = load_data()
+    with forecaster.lock:
+        sync_forecaster(data)
+        with metrics.phase("forecast"):
+            forecast = forecaster.forecast(data, horizon_days, limit)
+    
+    return jsonify({
+        "status": "success",
+        "horizon_days": horizon_days,
+        "half_life_days": FORECAST_HALF_LIFE_DAYS,
+        **forecast
+    }), 200
+
+@app.route('/api/forecast/<item_id>', methods=['GET'])
+def get_item_forecast(item_id):
+    """Usage rate of one item and how often it is expected to be used before it expires"""
+    data = load_data()
+    if item_id not in data['items']:
+        return jsonify({"error": f"Item {item_id} not found"}), 404
+    
+    with forecaster.lock:
+        sync_forecaster(data)
+        forecast = forecaster.item_forecast(data['items'][item_id], item_id)
+    
+    return jsonify({"status": "success", "forecast": forecast}), 200
+
+# Point-in-time history
+@app.route('/api/history/<section>/<key>', methods=['GET'])
+def get_history(section, key):
+    """An item or container as it was at a past time (?at=YYYY-MM-DD HH:MM:SS)"""
+    if section not in events.SECTION_NAMES:
+        return jsonify({"error": f"Unknown section {section}"}), 404
+    try:
+        at = models.format_datetime(models.parse_datetime(request.args.get('at', '').replace('T', ' ')))
+    except ValueError:
+        return jsonify({"error": "at must be a time as YYYY-MM-DD HH:MM:SS"}), 400
+    
+    with metrics.phase("history"):
+        found = history_store.row_at(section, key, at)
+    if found is None:
+        return jsonify({"error": f"No history as early as {at}"}), 404
+    
+    row, rebuilt = found
+    return jsonify({
+        "status": "success",
+        "section": section,
+        "id": key,
+        "at": at,
+        "exists": row is not None,
+        "record": row,
+        **rebuilt
     }), 200
 
+@app.route('/api/retrieval_route', methods=['POST'])
+def retrieval_route():
+    """Plan one trip to retrieve a task list of items, opening each container once"""
+    data = load_data()
+    route_data = request.json
+    
+    if not route_data or not isinstance(route_data.get('item_ids'), list) or \
+       not all(isinstance(item_id, str) for item_id in route_data['item_ids']):
+        return jsonify({"error": "item_ids must be a list of item IDs"}), 400
+    if len(route_data['item_ids']) > RETRIEVAL_MAX_ITEMS:
+        return jsonify({"error": f"A retrieval route can have at most {RETRIEVAL_MAX_ITEMS} items"}), 400
+    
+    item_ids = route_data['item_ids']
+    metrics.count_scanned(items=len(item_ids))
+    
+    # Containers are sequenced by module adjacency from where the crew member starts
+    plan = retrieval.plan_retrieval(data, item_ids, MODULE_ADJACENCY, route_data.get('start_module'))
+    
+    log_action("plan_retrieval_route", {
+        "items_count": plan['items_count'],
+        "containers_count": plan['containers_count'],
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return jsonify({"status": "success", **plan}), 200
+
 # Feature 3: Rearrangement Optimization
 def suggest_rearrangement(data: Dict, new_item: Dict) -> List[Dict]:
     """Suggest rearrangement of items to make space for new item"""
@@ -348,39 +849,45 @@ def suggest_rearrangement(data: Dict, new_item: Dict) -> List[Dict]:
     
     # Check each container for potential rearrangements
     potential_moves = []
+    items_scanned = 0
+    containers_scanned = 0
     
     # Try to find space by moving items between containers
     for container_id, container in data['containers'].items():
-        if container['type'] != 'storage':
+        containers_scanned += 1
+        if container.type != models.ContainerType.STORAGE:
             continue
             
         # If this container could fit the new item with some rearrangement
-        if container['total_volume'] - container['used_volume'] + item_volume <= container['total_volume'] and \
-           container['max_weight'] - container['current_weight'] + item_weight <= container['max_weight']:
+        if container.total_volume - container.used_volume + item_volume <= container.total_volume and \
+           container.max_weight - container.current_weight + item_weight <= container.max_weight:
             
             # Look for items that could be moved elsewhere
-            for item_id in container['items']:
+            for item_id in container.items:
                 item = data['items'][item_id]
+                items_scanned += 1
+                containers_scanned += len(data['containers'])
                 
                 # Check other containers that could hold this item
                 for other_container_id, other_container in data['containers'].items():
-                    if other_container_id == container_id or other_container['type'] != 'storage':
+                    if other_container_id == container_id or other_container.type != models.ContainerType.STORAGE:
                         continue
                         
                     # Check if the other container has space
-                    if other_container['used_volume'] + item['volume'] <= other_container['total_volume'] and \
-                       other_container['current_weight'] + item['weight'] <= other_container['max_weight']:
+                    if other_container.fits(item.volume, item.weight):
                         
                         # This is a potential move
                         potential_moves.append({
                             "item_id": item_id,
-                            "item_name": item['name'],
+                            "item_name": item.name,
                             "from_container": container_id,
                             "to_container": other_container_id,
-                            "volume_freed": item['volume'],
-                            "weight_freed": item['weight']
+                            "volume_freed": item.volume,
+                            "weight_freed": item.weight
                         })
     
+    metrics.count_scanned(items=items_scanned, containers=containers_scanned)
+    
     # Sort potential moves by volume freed (most efficient first)
     potential_moves.sort(key=lambda x: x['volume_freed'], reverse=True)
     
@@ -401,39 +908,37 @@ def suggest_rearrangement(data: Dict, new_item: Dict) -> List[Dict]:
 
 @app.route('/api/rearrange_items', methods=['POST'])
 def rearrange_items():
-    """Execute a rearrangement plan"""
+    """Validate a rearrangement plan as a whole, then execute it in one commit"""
     data = load_data()
-    plan = request.json.get('rearrangement_plan', [])
+    request_data = request.get_json(silent=True) or {}
+    plan = request_data.get('rearrangement_plan', [])
+    dry_run = bool(request_data.get('dry_run'))
     
-    if not plan:
+    if not plan or not isinstance(plan, list):
         return jsonify({"error": "No rearrangement plan provided"}), 400
     
-    # Execute each move in the plan
-    for move in plan:
-        item_id = move['item_id']
-        from_container = move['from_container']
-        to_container = move['to_container']
-        
-        if item_id not in data['items'] or \
-           from_container not in data['containers'] or \
-           to_container not in data['containers']:
-            return jsonify({"error": f"Invalid move: {move}"}), 400
-        
-        item = data['items'][item_id]
-        
-        # Update containers
-        data['containers'][from_container]['used_volume'] -= item['volume']
-        data['containers'][from_container]['current_weight'] -= item['weight']
-        data['containers'][from_container]['items'].remove(item_id)
-        
-        data['containers'][to_container]['used_volume'] += item['volume']
-        data['containers'][to_container]['current_weight'] += item['weight']
-        data['containers'][to_container]['items'].append(item_id)
-        
-        # Update item location
-        data['items'][item_id]['location'] = to_container
-        data['items'][item_id]['last_accessed'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Dry run every move against an overlay before touching any container
+    with metrics.phase("validate"):
+        overlay, violations = rearrangement.dry_run(data, plan)
+    metrics.count_scanned(items=len(plan), containers=len(overlay.loads))
+    
+    if violations:
+        return jsonify({
+            "status": "error",
+            "message": f"Rearrangement plan has {len(violations)} invalid moves; nothing was moved",
+            "violations": violations
+        }), 400
+    
+    if dry_run:
+        return jsonify({
+            "status": "success",
+            "message": "Rearrangement plan is valid",
+            "dry_run": True,
+            "moves_checked": len(plan),
+            "containers": rearrangement.summary(data, overlay)
+        }), 200
     
+    rearrangement.apply(data, plan)
     save_data(data)
     
     # Log the rearrangement
@@ -465,10 +970,10 @@ def mark_as_waste():
         return jsonify({"error": f"Item {item_id} not found"}), 404
     
     item = data['items'][item_id]
-    old_container_id = item['location']
+    old_container_id = item.location
     
     # Update item status
-    data['items'][item_id]['status'] = 'waste'
+    item.status = models.ItemStatus.WASTE
     
     # Find appropriate waste container
     waste_container = find_waste_container(data, item)
@@ -481,23 +986,21 @@ def mark_as_waste():
     
     # Move item from current container to waste container
     # Update old container
-    data['containers'][old_container_id]['used_volume'] -= item['volume']
-    data['containers'][old_container_id]['current_weight'] -= item['weight']
-    data['containers'][old_container_id]['items'].remove(item_id)
+    data['containers'][old_container_id].remove_item(item)
     
     # Update waste container
-    data['waste_containers'][waste_container]['used_volume'] += item['volume']
-    data['waste_containers'][waste_container]['current_weight'] += item['weight']
+    data['waste_containers'][waste_container].used_volume += item.volume
+    data['waste_containers'][waste_container].current_weight += item.weight
     
     # Update item location to indicate waste container
-    data['items'][item_id]['location'] = f"waste_{waste_container}"
+    item.location = f"waste_{waste_container}"
     
     save_data(data)
     
     # Log waste disposal
     log_action("mark_as_waste", {
         "item_id": item_id,
-        "item_name": item['name'],
+        "item_name": item.name,
         "reason": reason,
         "waste_container": waste_container,
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -509,27 +1012,27 @@ def mark_as_waste():
         "waste_container": waste_container
     }), 200
 
-def find_waste_container(data: Dict, item: Dict) -> Optional[str]:
+def find_waste_container(data: Dict, item: models.Item) -> Optional[str]:
     """Find appropriate waste container for an item"""
-    item_category = item['category']
-    item_volume = item['volume']
-    item_weight = item['weight']
+    item_category = item.category
+    item_volume = item.volume
+    item_weight = item.weight
     
     # Find suitable waste container
     suitable_containers = []
+    metrics.count_scanned(containers=len(data['waste_containers']))
     
     for container_id, container in data['waste_containers'].items():
         # Check if container accepts this waste category
-        if 'waste_categories' in container and item_category not in container['waste_categories'] and 'general' not in container['waste_categories']:
+        if not container.accepts(item_category):
             continue
             
         # Check if container has enough space and weight capacity
-        if container['used_volume'] + item_volume <= container['total_volume'] and \
-           container['current_weight'] + item_weight <= container['max_weight']:
+        if container.fits(item_volume, item_weight):
             
             # Calculate efficiency score (how well this item fits the container)
-            remaining_space = container['total_volume'] - container['used_volume']
-            space_efficiency = 1 - (remaining_space - item_volume) / container['total_volume']
+            remaining_space = container.total_volume - container.used_volume
+            space_efficiency = 1 - (remaining_space - item_volume) / container.total_volume
             
             suitable_containers.append((space_efficiency, container_id))
     
@@ -537,6 +1040,181 @@ def find_waste_container(data: Dict, item: Dict) -> Optional[str]:
     suitable_containers.sort(reverse=True)
     return suitable_containers[0][1] if suitable_containers else None
 
+def sweep_expired(before: int, dry_run: bool = False) -> Dict:
+    """Move every active item expiring before a day into waste containers, in one commit"""
+    data = load_data()
+    
+    with metrics.phase("sweep"):
+        expired = waste.expired_items(data, before)
+        assignments, unassigned = waste.pack(data, expired)
+    metrics.count_scanned(items=len(expired), containers=len(data['waste_containers']))
+    
+    sweep_report = waste.report(expired, assignments, unassigned)
+    sweep_report['before'] = models.format_date(before)
+    sweep_report['dry_run'] = dry_run
+    if dry_run or not assignments:
+        return sweep_report
+    
+    waste.apply(data, expired, assignments)
+    save_data(data)
+    
+    # Log the sweep as one disposal
+    log_action("sweep_expired", {
+        "before": sweep_report['before'],
+        "items": {item_id: waste_container_id
+                  for waste_container_id, item_ids in assignments.items() for item_id in item_ids},
+        "unassigned": unassigned,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return sweep_report
+
+@app.route('/api/sweep_expired', methods=['POST'])
+def sweep_expired_items():
+    """Mark every item expired before a date (default today) as waste and report disposal"""
+    sweep_data = request.get_json(silent=True) or {}
+    
+    before = parse_date_field(sweep_data, 'before')
+    if before is False:
+        return jsonify({"error": "before must be in YYYY-MM-DD format"}), 400
+    
+    sweep_report = sweep_expired(before or models.today(), bool(sweep_data.get('dry_run')))
+    return jsonify({"status": "success", **sweep_report}), 200
+
+@app.cli.command("sweep-expired")
+def sweep_expired_command():
+    """Daily job: flask --app main sweep-expired"""
+    sweep_report = sweep_expired(models.today())
+    print(f"Swept {sweep_report['items_swept']} expired items into "
+          f"{len(sweep_report['waste_containers'])} waste containers; "
+          f"{len(sweep_report['unassigned'])} could not be placed")
+
+@app.cli.command("compact-logs")
+def compact_logs_command():
+    """Daily job: flask --app main compact-logs"""
+    log_writer.flush()
+    compaction = log_archive.compact(datetime.now().date())
+    print(f"Sealed {compaction['entries_sealed']} log entries from {len(compaction['days_sealed'])} days; "
+          f"expired {compaction['entries_expired']} raw entries past retention")
+
+# Accessibility re-slotting
+def sync_reslotter() -> Dict:
+    """Catch the re-slotting optimizer up with the current data and return that data (hold its lock)"""
+    # Read the version first: the data loaded next already holds every event up to it
+    version = event_journal.latest_version()
+    data = load_data()
+    found = None
+    if reslotter.version is not None and not event_journal.behind(reslotter.version):
+        found, _ = event_journal.read_since(reslotter.version)
+    with metrics.phase("reslot"):
+        reslotter.sync(data, version, found)
+    return data
+
+def background_reslot() -> None:
+    with reslotter.lock:
+        sync_reslotter()
+
+def reslot(budget: int, min_gain: float = 0.0, apply: bool = False) -> Tuple[int, Dict]:
+    """Propose the re-slotting moves that raise priority-weighted accessibility most; optionally make them"""
+    with reslotter.lock:
+        data = sync_reslotter()
+        with metrics.phase("reslot"):
+            proposal = reslotter.propose(data, budget, min_gain)
+    metrics.count_scanned(items=len(reslotter.items), containers=len(reslotter.tree))
+    
+    proposal['applied'] = False
+    if not apply or not proposal['moves']:
+        return 200, proposal
+    
+    # The proposal is checked like any other plan before it is made
+    plan = [{key: move[key] for key in ('item_id', 'from_container', 'to_container')}
+            for move in proposal['moves']]
+    _, violations = rearrangement.dry_run(data, plan)
+    if violations:
+        return 409, {"error": "The station changed while the moves were chosen; try again",
+                     "violations": violations}
+    
+    rearrangement.apply(data, plan)
+    save_data(data)
+    proposal['applied'] = True
+    
+    log_action("reslot_items", {
+        "plan": plan,
+        "score": proposal['score'],
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return 200, proposal
+
+@app.route('/api/reslotting', methods=['GET', 'POST'])
+def reslot_items():
+    """Propose (GET) or make (POST) the moves that best put high-priority items in accessible containers"""
+    reslot_data = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    
+    try:
+        budget = int(reslot_data.get('moves', RESLOT_MOVE_BUDGET))
+        min_gain = float(reslot_data.get('min_gain', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "moves must be an integer and min_gain a number"}), 400
+    if budget < 0:
+        return jsonify({"error": "moves must not be negative"}), 400
+    
+    status, proposal = reslot(budget, min_gain, apply=request.method == 'POST')
+    if status >= 400:
+        return jsonify(proposal), status
+    return jsonify({"status": "success", **proposal}), status
+
+@app.cli.command("reslot")
+def reslot_command():
+    """Make the best re-slotting moves: flask --app main reslot"""
+    status, proposal = reslot(RESLOT_MOVE_BUDGET, apply=True)
+    if status >= 400:
+        print(proposal['error'])
+        return
+    print(f"Made {len(proposal['moves'])} moves; priority-weighted accessibility "
+          f"{proposal['score']['current']} -> {proposal['score']['proposed']}")
+
+@app.route('/api/consolidation', methods=['GET', 'POST'])
+def consolidate_containers():
+    """Propose (GET) or make (POST) the moves that empty whole storage containers for return or reuse"""
+    consolidation_data = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    
+    try:
+        max_containers = int(consolidation_data.get('containers', CONSOLIDATION_MAX_CONTAINERS))
+        max_moves = int(consolidation_data.get('moves', CONSOLIDATION_MOVE_BUDGET))
+        protected_priority = int(consolidation_data.get('protected_priority', CONSOLIDATION_PROTECTED_PRIORITY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "containers, moves and protected_priority must be integers"}), 400
+    if max_containers < 0 or max_moves < 0:
+        return jsonify({"error": "containers and moves must not be negative"}), 400
+    
+    data = load_data()
+    with metrics.phase("consolidate"):
+        proposal = consolidation.plan(data, max_containers, max_moves, protected_priority)
+    metrics.count_scanned(containers=len(data['containers']), items=proposal['total_moves'])
+    
+    proposal['applied'] = False
+    if request.method == 'GET' or not proposal['moves']:
+        return jsonify({"status": "success", **proposal}), 200
+    
+    # The proposal is checked like any other plan before it is made
+    _, violations = rearrangement.dry_run(data, proposal['moves'])
+    if violations:
+        return jsonify({"error": "Consolidation plan is no longer valid; try again",
+                        "violations": violations}), 409
+    
+    rearrangement.apply(data, proposal['moves'])
+    save_data(data)
+    proposal['applied'] = True
+    
+    log_action("consolidate_containers", {
+        "plan": proposal['moves'],
+        "freed_containers": [entry['container_id'] for entry in proposal['freed_containers']],
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return jsonify({"status": "success", **proposal}), 200
+
 # Feature 5: Cargo Return Planning
 @app.route('/api/return_planning/<waste_container_id>', methods=['GET'])
 def return_planning(waste_container_id):
@@ -552,32 +1230,34 @@ def return_planning(waste_container_id):
     waste_items = []
     total_volume = 0
     total_weight = 0
+    metrics.count_scanned(items=len(data['items']))
     
+    location = f"waste_{waste_container_id}"
     for item_id, item in data['items'].items():
-        if item['location'] == f"waste_{waste_container_id}":
+        if item.location == location:
             waste_items.append({
                 "item_id": item_id,
-                "name": item['name'],
-                "category": item['category'],
-                "volume": item['volume'],
-                "weight": item['weight'],
-                "status": item['status']
+                "name": item.name,
+                "category": item.category,
+                "volume": item.volume,
+                "weight": item.weight,
+                "status": item.status
             })
             
-            total_volume += item['volume']
-            total_weight += item['weight']
+            total_volume += item.volume
+            total_weight += item.weight
     
     # Generate return plan
     return_plan = {
         "container_id": waste_container_id,
-        "container_name": container['name'],
-        "undock_date": container.get('undock_date', 'Not scheduled'),
+        "container_name": container.name,
+        "undock_date": models.format_date(container.undock_date) or 'Not scheduled',
         "waste_items": waste_items,
         "total_items": len(waste_items),
         "total_volume": total_volume,
         "total_weight": total_weight,
-        "volume_utilization": (total_volume / container['total_volume']) * 100 if container['total_volume'] > 0 else 0,
-        "weight_utilization": (total_weight / container['max_weight']) * 100 if container['max_weight'] > 0 else 0,
+        "volume_utilization": (total_volume / container.total_volume) * 100 if container.total_volume > 0 else 0,
+        "weight_utilization": (total_weight / container.max_weight) * 100 if container.max_weight > 0 else 0,
         "space_reclamation": {
             "volume_reclaimed": total_volume,
             "weight_reclaimed": total_weight
@@ -608,9 +1288,11 @@ def confirm_return(waste_container_id):
     
     # Get all waste items in this container
     items_to_remove = []
+    metrics.count_scanned(items=len(data['items']))
     
+    location = f"waste_{waste_container_id}"
     for item_id, item in data['items'].items():
-        if item['location'] == f"waste_{waste_container_id}":
+        if item.location == location:
             items_to_remove.append(item_id)
     
     # Remove items and container
@@ -628,7 +1310,7 @@ def confirm_return(waste_container_id):
     # Log the return confirmation
     log_action("confirm_return", {
         "waste_container_id": waste_container_id,
-        "container_name": container_info['name'],
+        "container_name": container_info.name,
         "items_removed": len(items_to_remove),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
@@ -649,11 +1331,8 @@ def get_logs():
     action_type = request.args.get('action_type')
     limit = int(request.args.get('limit', 100))
     
-    # Load logs
-    logs = []
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'r') as f:
-            logs = json.load(f)
+    # Load logs, reading only the sealed days in range
+    logs = log_archive.read(start_date, end_date) + load_logs()
     
     # Apply filters
     filtered_logs = logs
@@ -697,16 +1376,16 @@ def add_container():
         return jsonify({"error": f"Container ID {container_id} already exists"}), 400
     
     # Add new container
-    data['containers'][container_id] = {
-        "name": container_data['name'],
-        "total_volume": float(container_data['total_volume']),
-        "used_volume": 0.0,
-        "max_weight": float(container_data['max_weight']),
-        "current_weight": 0.0,
-        "items": [],
-        "type": container_data.get('type', 'storage'),
-        "accessibility_factor": float(container_data.get('accessibility_factor', 0.5))
-    }
+    container = data['containers'][container_id] = models.Container(
+        container_id,
+        name=container_data['name'],
+        total_volume=float(container_data['total_volume']),
+        max_weight=float(container_data['max_weight']),
+        type=container_data.get('type', 'storage'),
+        accessibility_factor=float(container_data.get('accessibility_factor', 0.5)),
+        module=container_data.get('module'),
+        rack=container_data.get('rack')
+    )
     
     save_data(data)
     
@@ -721,7 +1400,7 @@ def add_container():
     return jsonify({
         "status": "success",
         "message": f"Container {container_id} added successfully",
-        "container": data['containers'][container_id]
+        "container": container.to_dict()
     }), 201
 
 @app.route('/api/add_waste_container', methods=['POST'])
@@ -738,16 +1417,20 @@ def add_waste_container():
     if container_id in data['waste_containers']:
         return jsonify({"error": f"Waste container ID {container_id} already exists"}), 400
     
+    undock_date = parse_date_field(container_data, 'undock_date')
+    if undock_date is False:
+        return jsonify({"error": "undock_date must be in YYYY-MM-DD format"}), 400
+    
     # Add new waste container
-    data['waste_containers'][container_id] = {
-        "name": container_data['name'],
-        "total_volume": float(container_data['total_volume']),
-        "used_volume": 0.0,
-        "max_weight": float(container_data['max_weight']),
-        "current_weight": 0.0,
-        "waste_categories": container_data.get('waste_categories', ['general']),
-        "undock_date": container_data.get('undock_date')
-    }
+    container = data['waste_containers'][container_id] = models.WasteContainer(
+        container_id,
+        name=container_data['name'],
+        total_volume=float(container_data['total_volume']),
+        max_weight=float(container_data['max_weight']),
+        waste_categories=container_data.get('waste_categories', ['general']),
+        undock_date=undock_date,
+        module=container_data.get('module')
+    )
     
     save_data(data)
     
@@ -762,7 +1445,7 @@ def add_waste_container():
     return jsonify({
         "status": "success",
         "message": f"Waste container {container_id} added successfully",
-        "container": data['waste_containers'][container_id]
+        "container": container.to_dict()
     }), 201
 
 @app.route('/api/get_storage_status', methods=['GET'])
@@ -788,69 +1471,71 @@ def get_storage_status():
     items_expiring_soon = 0
     
     # Get today's date for expiration calculation
-    today = datetime.now().date()
+    today = models.today()
+    
+    metrics.count_scanned(items=len(data['items']),
+                          containers=len(data['containers']) + len(data['waste_containers']))
     
     # Calculate container statistics
     storage_containers = []
     for container_id, container in data['containers'].items():
-        total_storage_volume += container['total_volume']
-        used_storage_volume += container['used_volume']
-        total_storage_weight_capacity += container['max_weight']
-        current_storage_weight += container['current_weight']
+        total_storage_volume += container.total_volume
+        used_storage_volume += container.used_volume
+        total_storage_weight_capacity += container.max_weight
+        current_storage_weight += container.current_weight
         
         # Calculate utilization percentages
-        volume_utilization = (container['used_volume'] / container['total_volume']) * 100 if container['total_volume'] > 0 else 0
-        weight_utilization = (container['current_weight'] / container['max_weight']) * 100 if container['max_weight'] > 0 else 0
+        volume_utilization = (container.used_volume / container.total_volume) * 100 if container.total_volume > 0 else 0
+        weight_utilization = (container.current_weight / container.max_weight) * 100 if container.max_weight > 0 else 0
         
         storage_containers.append({
             "container_id": container_id,
-            "name": container['name'],
-            "type": container['type'],
+            "name": container.name,
+            "type": container.type,
             "volume_utilization": round(volume_utilization, 2),
             "weight_utilization": round(weight_utilization, 2),
-            "item_count": len(container['items']),
-            "accessibility_factor": container['accessibility_factor']
+            "item_count": len(container.items),
+            "accessibility_factor": container.accessibility_factor
         })
     
     # Calculate waste container statistics
     waste_containers = []
     for container_id, container in data['waste_containers'].items():
-        total_waste_volume += container['total_volume']
-        used_waste_volume += container['used_volume']
-        total_waste_weight_capacity += container['max_weight']
-        current_waste_weight += container['current_weight']
+        total_waste_volume += container.total_volume
+        used_waste_volume += container.used_volume
+        total_waste_weight_capacity += container.max_weight
+        current_waste_weight += container.current_weight
         
         # Calculate utilization percentages
-        volume_utilization = (container['used_volume'] / container['total_volume']) * 100 if container['total_volume'] > 0 else 0
-        weight_utilization = (container['current_weight'] / container['max_weight']) * 100 if container['max_weight'] > 0 else 0
+        volume_utilization = (container.used_volume / container.total_volume) * 100 if container.total_volume > 0 else 0
+        weight_utilization = (container.current_weight / container.max_weight) * 100 if container.max_weight > 0 else 0
         
         waste_containers.append({
             "container_id": container_id,
-            "name": container['name'],
+            "name": container.name,
             "volume_utilization": round(volume_utilization, 2),
             "weight_utilization": round(weight_utilization, 2),
-            "waste_categories": container.get('waste_categories', ['general']),
-            "undock_date": container.get('undock_date')
+            "waste_categories": list(container.waste_categories),
+            "undock_date": models.format_date(container.undock_date)
         })
     
     # Calculate item statistics
-    for item_id, item in data['items'].items():
-        if item['status'] == 'active':
+    for item in data['items'].values():
+        if item.status == models.ItemStatus.ACTIVE:
             total_active_items += 1
             
             # Count by category
-            category = item.get('category', 'general')
+            category = item.category
             if category not in items_by_category:
                 items_by_category[category] = 0
             items_by_category[category] += 1
             
             # Check for expiring items
-            if item.get('expiration_date'):
-                exp_date = datetime.strptime(item['expiration_date'], "%Y-%m-%d").date()
-                days_to_expiry = (exp_date - today).days
+            if item.expiration_date is not None:
+                days_to_expiry = item.expiration_date - today
                 if days_to_expiry <= 7 and days_to_expiry >= 0:
                     items_expiring_soon += 1
-        elif item['status'] == 'waste':
+        elif item.status == models.ItemStatus.WASTE:
             total_waste_items += 1
     
     # Generate summary statistics
@@ -896,28 +1581,28 @@ def get_expiring_items():
     data = load_data()
     days = int(request.args.get('days', 7))  # Default to 7 days
     
-    today = datetime.now().date()
+    today = models.today()
     expiring_items = []
+    metrics.count_scanned(items=len(data['items']))
     
     for item_id, item in data['items'].items():
-        if item['status'] != 'active' or not item.get('expiration_date'):
+        if item.status != models.ItemStatus.ACTIVE or item.expiration_date is None:
             continue
             
-        exp_date = datetime.strptime(item['expiration_date'], "%Y-%m-%d").date()
-        days_to_expiry = (exp_date - today).days
+        days_to_expiry = item.expiration_date - today
         
         if 0 <= days_to_expiry <= days:
-            container = data['containers'][item['location']]
+            container = data['containers'][item.location]
             
             expiring_items.append({
                 "item_id": item_id,
-                "name": item['name'],
+                "name": item.name,
                 "days_to_expiry": days_to_expiry,
-                "expiration_date": item['expiration_date'],
-                "location": item['location'],
-                "container_name": container['name'],
-                "priority": item['priority'],
-                "category": item['category']
+                "expiration_date": models.format_date(item.expiration_date),
+                "location": item.location,
+                "container_name": container.name,
+                "priority": item.priority,
+                "category": item.category
             })
     
     # Sort by days to expiry (ascending)
@@ -941,48 +1626,44 @@ def get_item(item_id):
     
     # Get container information
     container_info = None
-    if item['status'] == 'active':
-        if item['location'] in data['containers']:
-            container = data['containers'][item['location']]
+    if item.status == models.ItemStatus.ACTIVE:
+        if item.location in data['containers']:
+            container = data['containers'][item.location]
             container_info = {
-                "container_id": item['location'],
-                "name": container['name'],
-                "type": container['type'],
-                "accessibility_factor": container['accessibility_factor']
+                "container_id": item.location,
+                "name": container.name,
+                "type": container.type,
+                "accessibility_factor": container.accessibility_factor
             }
-    elif item['status'] == 'waste':
+    elif item.status == models.ItemStatus.WASTE:
         # Extract waste container ID from the location (format: "waste_container_id")
-        waste_container_id = item['location'].replace("waste_", "")
+        waste_container_id = item.location.replace("waste_", "")
         if waste_container_id in data['waste_containers']:
             container = data['waste_containers'][waste_container_id]
             container_info = {
                 "container_id": waste_container_id,
-                "name": container['name'],
+                "name": container.name,
                 "type": "waste",
-                "undock_date": container.get('undock_date')
+                "undock_date": models.format_date(container.undock_date)
             }
     
     # If the item has an expiration date, calculate days until expiry
-    days_to_expiry = None
-    if item.get('expiration_date'):
-        exp_date = datetime.strptime(item['expiration_date'], "%Y-%m-%d").date()
-        today = datetime.now().date()
-        days_to_expiry = (exp_date - today).days
+    days_to_expiry = item.days_to_expiry(models.today())
     
     # Compile item details
     item_details = {
         "item_id": item_id,
-        "name": item['name'],
-        "status": item['status'],
-        "location": item['location'],
+        "name": item.name,
+        "status": item.status,
+        "location": item.location,
         "container": container_info,
-        "priority": item['priority'],
-        "category": item['category'],
-        "volume": item['volume'],
-        "weight": item['weight'],
-        "arrival_date": item['arrival_date'],
-        "last_accessed": item['last_accessed'],
-        "expiration_date": item.get('expiration_date'),
+        "priority": item.priority,
+        "category": item.category,
+        "volume": item.volume,
+        "weight": item.weight,
+        "arrival_date": models.format_date(item.arrival_date),
+        "last_accessed": models.format_datetime(item.last_accessed),
+        "expiration_date": models.format_date(item.expiration_date),
         "days_to_expiry": days_to_expiry
     }
     
@@ -1007,42 +1688,50 @@ def update_item(item_id):
         return jsonify({"error": f"Item {item_id} not found"}), 404
     
     item = data['items'][item_id]
-    old_data = item.copy()  # For logging
+    old_data = item.to_dict()  # For logging
+    
+    expiration_date = parse_date_field(update_data, 'expiration_date')
+    if expiration_date is False:
+        return jsonify({"error": "expiration_date must be in YYYY-MM-DD format"}), 400
     
     # Check if container is being changed
     new_container = update_data.get('location')
-    old_container = item['location']
+    old_container = item.location
     
-    if new_container and new_container != old_container and item['status'] == 'active':
+    if new_container and new_container != old_container and item.status == models.ItemStatus.ACTIVE:
         # Ensure new container exists
         if new_container not in data['containers']:
             return jsonify({"error": f"Container {new_container} not found"}), 404
         
-        # Check if new container has enough space
+        # Check if new container has enough space, beyond what is reserved in it
         container = data['containers'][new_container]
-        if container['used_volume'] + item['volume'] > container['total_volume']:
+        held_volume, held_weight = container.held()
+        if container.used_volume + held_volume + item.volume > container.total_volume:
             return jsonify({"error": f"Not enough space in container {new_container}"}), 400
         
-        if container['current_weight'] + item['weight'] > container['max_weight']:
+        if container.current_weight + held_weight + item.weight > container.max_weight:
             return jsonify({"error": f"Weight limit exceeded in container {new_container}"}), 400
         
         # Update old container
-        data['containers'][old_container]['used_volume'] -= item['volume']
-        data['containers'][old_container]['current_weight'] -= item['weight']
-        data['containers'][old_container]['items'].remove(item_id)
+        if old_container in data['containers']:
+            data['containers'][old_container].remove_item(item)
         
         # Update new container
-        data['containers'][new_container]['used_volume'] += item['volume']
-        data['containers'][new_container]['current_weight'] += item['weight']
-        data['containers'][new_container]['items'].append(item_id)
+        container.add_item(item)
+        item.location = new_container
     
     # Update allowed fields
-    for field in ['name', 'priority', 'expiration_date', 'category']:
-        if field in update_data:
-            data['items'][item_id][field] = update_data[field]
+    if 'name' in update_data:
+        item.name = update_data['name']
+    if 'priority' in update_data:
+        item.priority = update_data['priority']
+    if 'expiration_date' in update_data:
+        item.expiration_date = expiration_date
+    if 'category' in update_data:
+        item.category = models.intern(update_data['category'])
     
     # Always update last_accessed time
-    data['items'][item_id]['last_accessed'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    item.last_accessed = models.now()
     
     save_data(data)
     
@@ -1050,14 +1739,75 @@ def update_item(item_id):
     log_action("update_item", {
         "item_id": item_id,
         "old_data": old_data,
-        "new_data": data['items'][item_id],
+        "new_data": item.to_dict(),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
     
     return jsonify({
         "status": "success",
         "message": f"Item {item_id} updated successfully",
-        "item": data['items'][item_id]
+        "item": item.to_dict()
+    }), 200
+
+# Mass distribution across modules (see mass.py)
+def sync_mass_tracker() -> Dict:
+    """Catch the mass tracker up with the current data and return that data (hold its lock)"""
+    # Read the version first: the data loaded next already holds every event up to it
+    version = event_journal.latest_version()
+    data = load_data()
+    found = None
+    if mass_tracker.version is not None and not event_journal.behind(mass_tracker.version):
+        found, _ = event_journal.read_since(mass_tracker.version)
+    mass_tracker.sync(data, version, found)
+    return data
+
+@app.route('/api/mass_distribution', methods=['GET'])
+def get_mass_distribution():
+    """Mass per module and zone, and the station's center of mass"""
+    with mass_tracker.lock:
+        sync_mass_tracker()
+        distribution = mass_tracker.distribution()
+        version = mass_tracker.version
+    
+    return jsonify({"status": "success", "version": version, **distribution}), 200
+
+@app.route('/api/mass_distribution/projection', methods=['POST'])
+def project_mass_distribution():
+    """Mass distribution after a pending rearrangement plan and batch of placements, without making them"""
+    request_data = request.get_json(silent=True) or {}
+    plan = request_data.get('rearrangement_plan') or []
+    placements = request_data.get('placements') or []
+    if not isinstance(plan, list) or not isinstance(placements, list) or not (plan or placements):
+        return jsonify({"error": "Provide a rearrangement_plan and/or placements"}), 400
+    
+    with mass_tracker.lock:
+        data = sync_mass_tracker()
+        _, violations = rearrangement.dry_run(data, plan)
+        added = []
+        for index, placement_data in enumerate(placements):
+            container_id = placement_data.get('container_id') if isinstance(placement_data, dict) else None
+            weight = placement_data.get('weight') if isinstance(placement_data, dict) else None
+            if container_id not in data['containers']:
+                violations.append({"placement": index, "error": f"Container {container_id} not found"})
+            elif not isinstance(weight, (int, float)) or weight < 0:
+                violations.append({"placement": index, "error": "weight must be a non-negative number"})
+            else:
+                added.append((container_id, weight))
+        if violations:
+            return jsonify({
+                "status": "error",
+                "message": f"{len(violations)} moves or placements are invalid",
+                "violations": violations
+            }), 400
+        
+        current = mass_tracker.distribution()
+        projected = mass_tracker.project(data, plan, added)
+    
+    return jsonify({
+        "status": "success",
+        "current": current,
+        "projected": projected,
+        "change": mass.compare(current, projected)
     }), 200
 
 # Feature 7: Efficiency Monitoring
@@ -1066,57 +1816,45 @@ def get_efficiency_metrics():
     """Get system efficiency metrics"""
     data = load_data()
     
-    # Load logs for time-based analysis
-    logs = []
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'r') as f:
-            logs = json.load(f)
+    # Daily rollups of sealed logs plus a summary of the active log, per action
+    log_totals = log_retention.combine(
+        log_archive.rollups() + list(log_retention.summarize(load_logs()).values()))
+    rearrangements = log_totals.get('rearrange_items', {})
+    retrievals = log_totals.get('retrieve_item', {})
     
     # Calculate space utilization efficiency
-    total_storage_volume = sum(container['total_volume'] for container in data['containers'].values())
-    used_storage_volume = sum(container['used_volume'] for container in data['containers'].values())
+    total_storage_volume = sum(container.total_volume for container in data['containers'].values())
+    used_storage_volume = sum(container.used_volume for container in data['containers'].values())
     
     space_utilization = (used_storage_volume / total_storage_volume * 100) if total_storage_volume > 0 else 0
     
     # Calculate retrieval efficiency (average time between searches and retrievals)
-    retrieval_times = []
-    search_timestamps = {}
-    
-    for log in logs:
-        if log['action'] == 'search_item':
-            for result in log['details'].get('results', []):
-                search_timestamps[result] = datetime.strptime(log['timestamp'], "%Y-%m-%d %H:%M:%S")
-        elif log['action'] == 'retrieve_item':
-            item_id = log['details']['item_id']
-            if item_id in search_timestamps:
-                search_time = search_timestamps[item_id]
-                retrieval_time = datetime.strptime(log['timestamp'], "%Y-%m-%d %H:%M:%S")
-                time_diff = (retrieval_time - search_time).total_seconds()
-                retrieval_times.append(time_diff)
-    
-    avg_retrieval_time = sum(retrieval_times) / len(retrieval_times) if retrieval_times else 0
+    timed_retrievals = retrievals.get('timed_retrievals', 0)
+    avg_retrieval_time = retrievals['retrieval_seconds'] / timed_retrievals if timed_retrievals else 0
     
     # Calculate waste management efficiency
     waste_utilization = 0
     if data['waste_containers']:
-        total_waste_volume = sum(container['total_volume'] for container in data['waste_containers'].values())
-        used_waste_volume = sum(container['used_volume'] for container in data['waste_containers'].values())
+        total_waste_volume = sum(container.total_volume for container in data['waste_containers'].values())
+        used_waste_volume = sum(container.used_volume for container in data['waste_containers'].values())
         waste_utilization = (used_waste_volume / total_waste_volume * 100) if total_waste_volume > 0 else 0
     
     # Calculate rearrangement efficiency
-    rearrangement_logs = [log for log in logs if log['action'] == 'rearrange_items']
-    avg_moves_per_rearrangement = sum(len(log['details']['plan']) for log in rearrangement_logs) / len(rearrangement_logs) if rearrangement_logs else 0
+    total_rearrangements = rearrangements.get('count', 0)
+    avg_moves_per_rearrangement = rearrangements['moves'] / total_rearrangements if total_rearrangements else 0
     
     # Calculate expiration management efficiency
     expired_items = 0
-    for item_id, item in data['items'].items():
-        if item.get('expiration_date'):
-            exp_date = datetime.strptime(item['expiration_date'], "%Y-%m-%d").date()
-            today = datetime.now().date()
-            if exp_date < today and item['status'] == 'active':
+    total_items = 0
+    today = models.today()
+    metrics.count_scanned(items=len(data['items']),
+                          containers=len(data['containers']) + len(data['waste_containers']))
+    for item in data['items'].values():
+        if item.status == models.ItemStatus.ACTIVE:
+            total_items += 1
+            if item.expiration_date is not None and item.expiration_date < today:
                 expired_items += 1
-    
-    total_items = len([i for i in data['items'].values() if i['status'] == 'active'])
+
     expiration_efficiency = 100 - (expired_items / total_items * 100) if total_items > 0 else 100
     
     # Compile efficiency metrics
@@ -1126,7 +1864,7 @@ def get_efficiency_metrics():
         "waste_management_efficiency": round(waste_utilization, 2),
         "rearrangement_efficiency": {
             "avg_moves_per_rearrangement": round(avg_moves_per_rearrangement, 2),
-            "total_rearrangements": len(rearrangement_logs)
+            "total_rearrangements": total_rearrangements
         },
         "expiration_management": {
             "efficiency_percentage": round(expiration_efficiency, 2),
@@ -1154,14 +1892,20 @@ def create_undock_plan():
     undock_date = plan_data.get('undock_date', (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d"))
     plan_type = plan_data.get('type', 'waste')  # 'waste' or 'return'
     
+    undock_ordinal = parse_date_field({'undock_date': undock_date}, 'undock_date')
+    if not undock_ordinal:
+        return jsonify({"error": "undock_date must be in YYYY-MM-DD format"}), 400
+    
     # If it's a waste container, mark the undock date
     if plan_type == 'waste' and module_id in data['waste_containers']:
-        data['waste_containers'][module_id]['undock_date'] = undock_date
+        data['waste_containers'][module_id].undock_date = undock_ordinal
         
         # Get all waste items in this container
         waste_items = []
+        location = f"waste_{module_id}"
+        metrics.count_scanned(items=len(data['items']))
         for item_id, item in data['items'].items():
-            if item['location'] == f"waste_{module_id}":
+            if item.location == location:
                 waste_items.append(item_id)
         
         save_data(data)
@@ -1184,9 +1928,314 @@ def create_undock_plan():
     else:
         return jsonify({"error": f"Module {module_id} not found or type mismatch"}), 404
 
+# Export cargo data in the original JSON format
+@app.route('/api/export/json', methods=['GET'])
+def export_json():
+    """Download the full cargo data as JSON"""
+    data = load_data()
+    
+    response = jsonify(models.to_json(data))
+    response.headers['Content-Disposition'] = 'attachment; filename=cargo_data.json'
+    return response, 200
+
+# Streaming exports for mission reports (see export.py)
+EXPORT_MIMETYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+@app.route('/api/export/<dataset>.<fmt>', methods=['GET'])
+def export_dataset(dataset, fmt):
+    """Stream items, containers, the waste manifest or a range of logs as CSV or Parquet"""
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unknown format {fmt}; use one of {', '.join(export.FORMATS)}"}), 404
+    if fmt == "parquet" and not export.parquet_available():
+        return jsonify({"error": "Parquet export needs pyarrow installed"}), 501
+    
+    if dataset == "logs":
+        start_date, end_date = request.args.get('start_date'), request.args.get('end_date')
+        for value in (start_date, end_date):
+            if value is not None:
+                try:
+                    models.parse_date(value)
+                except ValueError:
+                    return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+        log_writer.flush()
+        columns, rows = export.logs(log_archive, lambda: audit_log.read_entries(LOG_FILE),
+                                    start_date, end_date, request.args.get('action_type'))
+    elif dataset in ("items", "containers", "waste_manifest"):
+        data = load_data()
+        if dataset == "items":
+            columns, rows = export.items(data)
+        elif dataset == "containers":
+            columns, rows = export.containers(data)
+        else:
+            columns, rows = export.waste_manifest(data, request.args.get('waste_container_id'))
+    else:
+        return jsonify({"error": f"Unknown dataset {dataset}"}), 404
+    
+    chunks = export.to_parquet(columns, rows) if fmt == "parquet" else export.to_csv(columns, rows)
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={dataset}.{fmt}'
+    return response
+
+# Batched operations
+def run_batch_operation(operation: Any) -> Tuple[int, Any]:
+    """Dispatch one batch operation to its route; (status code, response body)"""
+    if not isinstance(operation, dict) or not isinstance(operation.get('path'), str):
+        return 400, {"error": "Operation needs a path"}
+    
+    method = str(operation.get('method', 'POST')).upper()
+    path = operation['path']
+    route = path.split('?')[0].rstrip('/')
+    if not path.startswith('/api/') or any(route == excluded or route.startswith(excluded + '/')
+                                           for excluded in BATCH_EXCLUDED_PATHS):
+        return 400, {"error": f"{path} cannot be used in a batch"}
+    
+    with app.test_request_context(path, method=method, json=operation.get('body')):
+        try:
+            response = app.make_response(app.dispatch_request())
+        except HTTPException as error:
+            return error.code, {"error": error.description}
+        except Exception as error:
+            app.logger.exception("Batch operation %s %s failed", method, path)
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+    return response.status_code, response.get_json(silent=True)
+
+@app.route('/api/batch', methods=['POST'])
+def batch_operations():
+    """Run an ordered list of API operations against one state, saving and logging once"""
+    batch_data = request.get_json(silent=True) or {}
+    operations = batch_data.get('operations')
+    mode = batch_data.get('mode', 'atomic')
+    
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({"error": f"A batch can have at most {BATCH_MAX_OPERATIONS} operations"}), 400
+    if mode not in ('atomic', 'best_effort'):
+        return jsonify({"error": "mode must be 'atomic' or 'best_effort'"}), 400
+    
+    data = load_data()
+    results = []
+    entries = []
+    failed = None
+    try:
+        for index, operation in enumerate(operations):
+            if failed is not None:
+                results.append({"index": index, "status": None, "skipped": True})
+                continue
+            
+            # Best-effort operations each get a private overlay, kept only if they succeed
+            state = overlay.overlay(data) if mode == 'best_effort' else data
+            batch_context.data, batch_context.entries = state, []
+            status, body = run_batch_operation(operation)
+            
+            if status < 400:
+                if state is not data:
+                    overlay.merge(data, state)
+                entries.extend(batch_context.entries)
+            elif mode == 'atomic':
+                failed = index
+            results.append({"index": index, "status": status, "response": body})
+    finally:
+        batch_context.data = batch_context.entries = None
+    
+    if failed is not None:
+        return jsonify({
+            "status": "error",
+            "message": f"Operation {failed} failed; nothing in the batch was applied",
+            "results": results
+        }), 400
+    
+    save_data(data)
+    
+    # One log entry for the whole batch, carrying each operation's own entry
+    succeeded = sum(1 for result in results if result['status'] < 400)
+    log_action("batch", {
+        "mode": mode,
+        "operations": len(operations),
+        "succeeded": succeeded,
+        "actions": entries,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return jsonify({
+        "status": "success",
+        "mode": mode,
+        "succeeded": succeeded,
+        "failed": len(operations) - succeeded,
+        "results": results
+    }), 200
+
+# Capacity reservations for resupply vehicles
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    """Hold volume and weight in storage containers for an incoming vehicle until an expiry time"""
+    data = load_data()
+    reservation_data = request.get_json(silent=True) or {}
+    
+    try:
+        expires_at = models.parse_datetime(str(reservation_data.get('expires_at', '')).replace('T', ' '))
+    except ValueError:
+        return jsonify({"error": "expires_at must be in YYYY-MM-DD HH:MM:SS format"}), 400
+    
+    holds = {}
+    for hold in reservation_data.get('holds') or []:
+        if not isinstance(hold, dict) or 'container_id' not in hold:
+            return jsonify({"error": "Each hold needs a container_id"}), 400
+        try:
+            volume, weight = float(hold.get('volume', 0)), float(hold.get('weight', 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Hold volume and weight must be numbers"}), 400
+        previous = holds.get(hold['container_id'], (0.0, 0.0))
+        holds[hold['container_id']] = (previous[0] + volume, previous[1] + weight)
+    if not holds:
+        return jsonify({"error": "A reservation needs at least one hold"}), 400
+    
+    item_ids = reservation_data.get('item_ids')
+    if item_ids is not None and not isinstance(item_ids, list):
+        return jsonify({"error": "item_ids must be a list"}), 400
+    
+    reservation_id = reservation_data.get('reservation_id', f"reservation_{int(time.time())}")
+    reservations.expire(data)
+    if reservation_id in data.get('reservations', {}):
+        return jsonify({"error": f"Reservation {reservation_id} already exists"}), 409
+    error = reservations.create(data, reservation_id, reservation_data.get('vehicle'), expires_at, holds, item_ids)
+    if error is not None:
+        return jsonify({"error": error}), 404 if error.endswith("not found") else 400
+    
+    save_data(data)
+    
+    reservation = reservations.describe(reservation_id, data['reservations'][reservation_id])
+    log_action("create_reservation", {
+        "reservation_id": reservation_id,
+        "vehicle": reservation["vehicle"],
+        "expires_at": reservation["expires_at"],
+        "containers": sorted(holds),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return jsonify({
+        "status": "success",
+        "message": f"Reservation {reservation_id} created",
+        "reservation": reservation
+    }), 201
+
+@app.route('/api/reservations', methods=['GET'])
+def list_reservations():
+    """List the reservations that have not expired"""
+    active = reservations.active(load_data())
+    return jsonify({
+        "status": "success",
+        "reservations": [reservations.describe(key, reservation) for key, reservation in sorted(active.items())]
+    }), 200
+
+@app.route('/api/reservations/<reservation_id>', methods=['GET'])
+def get_reservation(reservation_id):
+    """What a reservation still holds, by container"""
+    reservation = reservations.get(load_data(), reservation_id)
+    if reservation is None:
+        return jsonify({"error": f"Reservation {reservation_id} not found or expired"}), 404
+    
+    return jsonify({"status": "success", "reservation": reservations.describe(reservation_id, reservation)}), 200
+
+@app.route('/api/reservations/<reservation_id>', methods=['DELETE'])
+def cancel_reservation(reservation_id):
+    """Release what a reservation holds"""
+    data = load_data()
+    
+    reservations.expire(data)
+    if not reservations.cancel(data, reservation_id):
+        return jsonify({"error": f"Reservation {reservation_id} not found or expired"}), 404
+    
+    save_data(data)
+    
+    log_action("cancel_reservation", {
+        "reservation_id": reservation_id,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    
+    return jsonify({"status": "success", "message": f"Reservation {reservation_id} cancelled"}), 200
+
+# What-if sandboxes
+@app.route('/api/sandboxes', methods=['POST'])
+def create_sandbox():
+    """Fork the current state into a sandbox that API operations can change without saving"""
+    sandbox_data = request.get_json(silent=True) or {}
+    
+    # A single snapshot file is linked as the sandbox's base instead of being copied
+    source = snapshot_store.path if STORAGE_FORMAT == "snapshot" and snapshot_store.exists() else None
+    created = sandboxes.create(load_data(), sandbox_data.get('name'), source)
+    if created is None:
+        return jsonify({"error": f"At most {SANDBOX_MAX} sandboxes can exist at once"}), 400
+    
+    return jsonify({
+        "status": "success",
+        "message": f"Sandbox {created.sandbox_id} created",
+        "sandbox": created.to_dict()
+    }), 201
+
+@app.route('/api/sandboxes', methods=['GET'])
+def list_sandboxes():
+    """List the sandboxes"""
+    return jsonify({
+        "status": "success",
+        "sandboxes": sandboxes.all()
+    }), 200
+
+@app.route('/api/sandboxes/<sandbox_id>', methods=['GET'])
+def sandbox_report(sandbox_id):
+    """Diff and utilization of a sandbox against the state it was forked from"""
+    with sandboxes.open(sandbox_id) as found:
+        if found is None:
+            return jsonify({"error": f"Sandbox {sandbox_id} not found"}), 404
+        return jsonify({"status": "success", **sandbox.report(found)}), 200
+
+@app.route('/api/sandboxes/<sandbox_id>', methods=['DELETE'])
+def delete_sandbox(sandbox_id):
+    """Discard a sandbox"""
+    if not sandboxes.remove(sandbox_id):
+        return jsonify({"error": f"Sandbox {sandbox_id} not found"}), 404
+    
+    return jsonify({"status": "success", "message": f"Sandbox {sandbox_id} discarded"}), 200
+
+@app.route('/api/sandboxes/<sandbox_id>/operations', methods=['POST'])
+def run_sandbox_operations(sandbox_id):
+    """Run API operations, in order, against a sandbox; each one is kept only if it succeeds"""
+    operations = (request.get_json(silent=True) or {}).get('operations')
+    
+    results = []
+    with sandboxes.open(sandbox_id) as found:
+        if found is None:
+            return jsonify({"error": f"Sandbox {sandbox_id} not found"}), 404
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "operations must be a non-empty list"}), 400
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return jsonify({"error": f"At most {BATCH_MAX_OPERATIONS} operations can be run at once"}), 400
+        
+        try:
+            for index, operation in enumerate(operations):
+                state = overlay.overlay(found.state)
+                batch_context.data, batch_context.entries = state, []
+                status, body = run_batch_operation(operation)
+                if status < 400:
+                    overlay.merge(found.state, state)
+                    found.entries.extend(batch_context.entries)
+                    found.operations += 1
+                results.append({"index": index, "status": status, "response": body})
+        finally:
+            batch_context.data = batch_context.entries = None
+    
+    succeeded = sum(1 for result in results if result['status'] < 400)
+    return jsonify({
+        "status": "success",
+        "sandbox": found.to_dict(),
+        "succeeded": succeeded,
+        "failed": len(operations) - succeeded,
+        "results": results
+    }), 200
+
 # Initialize DB with some sample data if it doesn't exist
 def initialize_sample_data():
-    if not os.path.exists(DATA_FILE):
+    if not os.path.exists(DATA_FILE) and not snapshot_store.exists():
         sample_data = {
             "items": {
                 "item_001": {
@@ -1249,9 +2298,14 @@ def initialize_sample_data():
             }
         }
         
-        with open(DATA_FILE, 'w') as f:
-            json.dump(sample_data, f, indent=2)
+        save_data(models.from_json(sample_data))
 
+# The app is plain WSGI. ASGI servers run it through their stock WSGI adapters, e.g.
+#
+#   uvicorn --interface wsgi main:app
+#
+# or wrapped in asgiref's WsgiToAsgi or a2wsgi's WSGIMiddleware. Handlers still block
+# on disk there, one request per adapter thread; queued audit entries are flushed at exit.
 if __name__ == "__main__":
     # Initialize sample data if needed
     initialize_sample_data()
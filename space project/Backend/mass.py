@@ -0,0 +1,164 @@
+import threading
+from typing import Dict, List, Tuple, Optional
+
+# Mass distribution
+#
+# The mass aboard is the current weight of every storage and waste container,
+# which already includes the items in them. The tracker keeps each
+# container's weight and zone (module, then rack) and running totals per
+# module and per zone, plus the station's first moment over the modules whose
+# positions are configured, from which the center of mass is one division.
+#
+# Like the re-slotting optimizer, the tracker follows the change events: a
+# placement, move, waste transfer or return changes the weights of the
+# containers involved, and each container event moves that container's
+# weight from its old totals to its new ones in O(1). A tracker that fell
+# behind the journal starts over from the containers. Projections apply a
+# plan's moves and placements as deltas to copies of the module and zone
+# totals, so they cost O(moves + modules) whatever the number of items.
+
+SECTIONS = ('containers', 'waste_containers')
+AXES = ("x", "y", "z")
+TOLERANCE = 1e-9  # Less mass than this in positioned modules gives no center of mass
+
+
+def _zone(container) -> Tuple[str, str]:
+    return container.module or "", getattr(container, 'rack', None) or ""
+
+
+class MassTracker:
+    """Running mass totals per module and zone, and the station's center of mass"""
+
+    def __init__(self, positions: Dict[str, Tuple[float, float, float]]):
+        self.lock = threading.Lock()
+        self.positions = positions  # module -> (x, y, z) of its center, in metres
+        self.version: Optional[int] = None  # Journal version the totals reflect
+        self.containers: Dict[Tuple[str, str], Tuple[str, str, float]] = {}  # (section, ID) -> (module, rack, weight)
+        self.modules: Dict[str, float] = {}
+        self.zones: Dict[Tuple[str, str], float] = {}
+        self.counts: Dict = {}  # Containers per module and per (module, rack)
+        self.moment = [0.0, 0.0, 0.0]  # Sum of mass * position over positioned modules
+        self.positioned = 0.0  # Mass in positioned modules
+
+    # State
+
+    def _add(self, module: str, rack: str, weight: float, count: int) -> None:
+        self.modules[module] = self.modules.get(module, 0.0) + weight
+        self.zones[module, rack] = self.zones.get((module, rack), 0.0) + weight
+        self.counts[module, rack] = self.counts.get((module, rack), 0) + count
+        self.counts[module] = self.counts.get(module, 0) + count
+        position = self.positions.get(module)
+        if position is not None:
+            for axis in range(3):
+                self.moment[axis] += weight * position[axis]
+            self.positioned += weight
+        if not self.counts[module, rack]:
+            # The zone's last container is gone; its total was only rounding error
+            del self.counts[module, rack]
+            del self.zones[module, rack]
+        if not self.counts[module]:
+            del self.counts[module]
+            del self.modules[module]
+
+    def _set(self, section: str, key: str, container) -> None:
+        """Replace a container's contribution with its current weight and zone, O(1)"""
+        previous = self.containers.pop((section, key), None)
+        if previous is not None:
+            self._add(previous[0], previous[1], -previous[2], -1)
+        if container is not None:
+            module, rack = _zone(container)
+            self.containers[section, key] = (module, rack, container.current_weight)
+            self._add(module, rack, container.current_weight, 1)
+
+    def rebuild(self, data: Dict, version: Optional[int]) -> None:
+        """Start over from loaded data"""
+        self.containers, self.modules, self.zones, self.counts = {}, {}, {}, {}
+        self.moment, self.positioned = [0.0, 0.0, 0.0], 0.0
+        for section in SECTIONS:
+            for key, container in data[section].items():
+                self._set(section, key, container)
+        self.version = version
+
+    def sync(self, data: Dict, version: Optional[int], found: Optional[List[Dict]]) -> None:
+        """Catch up with data, given the change events since the last sync (None to rebuild)"""
+        if self.version is None or found is None:
+            self.rebuild(data, version)
+            return
+        for event in found:
+            section = event.get("entity")
+            if section in SECTIONS:
+                self._set(section, event["id"], data[section].get(event["id"]))
+        self.version = version
+
+    # Reports
+
+    def _center(self, moment: List[float], positioned: float) -> Optional[Dict]:
+        if positioned <= TOLERANCE:
+            return None
+        return {axis: round(moment[index] / positioned, 4) for index, axis in enumerate(AXES)}
+
+    def distribution(self, modules: Optional[Dict[str, float]] = None,
+                     zones: Optional[Dict[Tuple[str, str], float]] = None) -> Dict:
+        """Mass per module (with its zones) and the center of mass, of the tracked totals or of given ones"""
+        if modules is None:
+            modules, zones = self.modules, self.zones
+            moment, positioned = self.moment, self.positioned
+        else:
+            moment, positioned = [0.0, 0.0, 0.0], 0.0
+            for module, weight in modules.items():
+                position = self.positions.get(module)
+                if position is not None:
+                    for axis in range(3):
+                        moment[axis] += weight * position[axis]
+                    positioned += weight
+        total = sum(modules.values())
+
+        racks: Dict[str, List[Dict]] = {}
+        for (module, rack), weight in sorted(zones.items()):
+            if rack:
+                racks.setdefault(module, []).append({"rack": rack, "mass": round(weight, 4)})
+        return {
+            "total_mass": round(total, 4),
+            "modules": [{
+                "module": module or None,
+                "mass": round(weight, 4),
+                "share": round(weight / total * 100, 2) if total > 0 else 0.0,
+                "position": dict(zip(AXES, self.positions[module])) if module in self.positions else None,
+                "zones": racks.get(module, [])
+            } for module, weight in sorted(modules.items())],
+            "center_of_mass": self._center(moment, positioned),
+            "unpositioned_mass": round(total - positioned, 4)
+        }
+
+    def project(self, data: Dict, moves: List[Dict], placements: List[Tuple[str, float]]) -> Dict:
+        """Distribution after a valid rearrangement plan and placements of (container ID, weight)"""
+        modules, zones = dict(self.modules), dict(self.zones)
+
+        def shift(container, weight: float) -> None:
+            module, rack = _zone(container)
+            modules[module] = modules.get(module, 0.0) + weight
+            zones[module, rack] = zones.get((module, rack), 0.0) + weight
+
+        for move in moves:
+            weight = data['items'][move['item_id']].weight
+            shift(data['containers'][move['from_container']], -weight)
+            shift(data['containers'][move['to_container']], weight)
+        for container_id, weight in placements:
+            shift(data['containers'][container_id], weight)
+        return self.distribution(modules, zones)
+
+
+def compare(current: Dict, projected: Dict) -> Dict:
+    """Change in mass per module and the shift of the center of mass, between two distributions"""
+    before = {entry["module"]: entry["mass"] for entry in current["modules"]}
+    after = {entry["module"]: entry["mass"] for entry in projected["modules"]}
+    changes = [{"module": module, "mass_change": round(after.get(module, 0.0) - before.get(module, 0.0), 4)}
+               for module in sorted(set(before) | set(after), key=lambda name: name or "")]
+    shift = None
+    if current["center_of_mass"] and projected["center_of_mass"]:
+        shift = {axis: round(projected["center_of_mass"][axis] - current["center_of_mass"][axis], 4) for axis in AXES}
+    return {
+        "modules": [change for change in changes if change["mass_change"] != 0],
+        "total_mass_change": round(projected["total_mass"] - current["total_mass"], 4),
+        "center_of_mass_shift": shift
+    }
@@ -0,0 +1,250 @@
+import sys
+import time
+import threading
+import itertools
+from collections import deque, Counter
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional
+
+# Bucket boundaries (seconds) for request and phase latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Bucket boundaries (bytes) for request and response payload sizes
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Phases timed explicitly; "compute" is whatever is left of the request
+PHASES = ("load", "compute", "persist", "log")
+
+
+class Histogram:
+    """Cumulative histogram with Prometheus-style buckets"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-wide store of request metrics, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        described = set()
+
+        def header(name):
+            if name in described or name not in self._help:
+                return
+            kind, help_text = self._help[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), histogram in histograms:
+            header(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+            cumulative += histogram.counts[-1]
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+registry.describe("cargo_request_duration_seconds", "histogram", "Request latency by route")
+registry.describe("cargo_phase_duration_seconds", "histogram", "Time spent per request phase (load, compute, persist, log)")
+registry.describe("cargo_request_payload_bytes", "histogram", "Request body size by route")
+registry.describe("cargo_response_payload_bytes", "histogram", "Response body size by route")
+registry.describe("cargo_requests_total", "counter", "Requests served by route and status code")
+registry.describe("cargo_items_scanned_total", "counter", "Items examined by route")
+registry.describe("cargo_containers_scanned_total", "counter", "Containers examined by route")
+
+
+# Per-request bookkeeping (one request per worker thread at a time)
+_local = threading.local()
+
+
+def start_request(route: str) -> None:
+    """Begin timing a request for the given route"""
+    _local.route = route
+    _local.started = time.perf_counter()
+    _local.phase_totals = {}
+    _local.phase_depth = 0
+
+
+def current_route() -> str:
+    return getattr(_local, "route", None) or "none"
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block of work as one phase of the current request"""
+    # Nested phases (e.g. a save triggered while logging) are charged to the outer one
+    depth = getattr(_local, "phase_depth", 0)
+    _local.phase_depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.phase_depth = depth
+        if depth == 0:
+            elapsed = time.perf_counter() - started
+            totals = getattr(_local, "phase_totals", None)
+            if totals is not None:
+                totals[name] = totals.get(name, 0.0) + elapsed
+            registry.observe("cargo_phase_duration_seconds", elapsed, route=current_route(), phase=name)
+
+
+def count_scanned(items: int = 0, containers: int = 0) -> None:
+    """Record how many items and containers the current request examined"""
+    route = current_route()
+    if items:
+        registry.inc("cargo_items_scanned_total", items, route=route)
+    if containers:
+        registry.inc("cargo_containers_scanned_total", containers, route=route)
+
+
+def finish_request(status_code: int, request_bytes: int, response_bytes: int) -> None:
+    """Record latency, residual compute time and payload sizes for the current request"""
+    started = getattr(_local, "started", None)
+    if started is None:
+        return
+    route = current_route()
+    elapsed = time.perf_counter() - started
+    measured = sum(getattr(_local, "phase_totals", {}).values())
+
+    registry.observe("cargo_request_duration_seconds", elapsed, route=route)
+    registry.observe("cargo_phase_duration_seconds", max(0.0, elapsed - measured), route=route, phase="compute")
+    registry.observe("cargo_request_payload_bytes", request_bytes, SIZE_BUCKETS, route=route)
+    registry.observe("cargo_response_payload_bytes", response_bytes, SIZE_BUCKETS, route=route)
+    registry.inc("cargo_requests_total", route=route, status=str(status_code))
+
+    _local.started = None
+    _local.route = None
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval and aggregates collapsed stacks"""
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format understood by flamegraph tools"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+# Finished profiles, kept in a small ring so they can be fetched after the request
+_profiles: deque = deque(maxlen=32)
+_profile_ids = itertools.count(1)
+_profiles_lock = threading.Lock()
+
+
+def store_profile(route: str, profiler: SamplingProfiler) -> str:
+    profile_id = str(next(_profile_ids))
+    with _profiles_lock:
+        _profiles.append((profile_id, route, profiler.collapsed()))
+    return profile_id
+
+
+def get_profile(profile_id: str) -> Optional[Tuple[str, str]]:
+    with _profiles_lock:
+        for stored_id, route, collapsed in _profiles:
+            if stored_id == profile_id:
+                return route, collapsed
+    return None
+
+
+def list_profiles() -> List[Dict]:
+    with _profiles_lock:
+        return [{"profile_id": stored_id, "route": route} for stored_id, route, _ in _profiles]
@@ -0,0 +1,472 @@
+import sys
+from enum import StrEnum
+from datetime import date, datetime
+from operator import attrgetter
+from typing import Dict, Tuple, Optional, Iterable
+
+# Typed in-memory model for cargo data
+#
+# Items and containers are __slots__ classes. Dates are held as day ordinals
+# and timestamps as seconds since day 1, so comparisons in hot loops are plain
+# integer arithmetic. Status and container type are enums and categories are
+# interned strings. Container membership is an insertion-ordered set (a dict
+# with None values). The JSON shapes used by the API and the legacy data file
+# are produced only at the boundary, by to_dict() and from_dict().
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SECONDS_PER_DAY = 86400
+
+
+class ItemStatus(StrEnum):
+    ACTIVE = "active"
+    USED = "used"
+    EXPIRED = "expired"
+    WASTE = "waste"
+
+
+class ContainerType(StrEnum):
+    STORAGE = "storage"
+    WASTE = "waste"
+    RETURN = "return"
+
+
+def parse_enum(enum_type, value):
+    """Enum member for value; unknown values are kept as interned strings"""
+    if type(value) is not str:
+        return value
+    member = enum_type._value2member_map_.get(value)
+    return member if member is not None else sys.intern(value)
+
+
+def intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+# Date conversion (cached in both directions; dates repeat heavily)
+
+_date_ordinals: Dict[str, int] = {}
+_date_strings: Dict[int, str] = {}
+
+
+def parse_date(value: str) -> int:
+    """"YYYY-MM-DD" -> day ordinal"""
+    ordinal = _date_ordinals.get(value)
+    if ordinal is None:
+        ordinal = datetime.strptime(value, DATE_FORMAT).toordinal()
+        if len(_date_ordinals) < 100000:
+            _date_ordinals[value] = ordinal
+    return ordinal
+
+
+def format_date(ordinal: Optional[int]) -> Optional[str]:
+    if ordinal is None:
+        return None
+    text = _date_strings.get(ordinal)
+    if text is None:
+        text = date.fromordinal(ordinal).strftime(DATE_FORMAT)
+        if len(_date_strings) < 100000:
+            _date_strings[ordinal] = text
+    return text
+
+
+def parse_datetime(value: str) -> int:
+    """"YYYY-MM-DD HH:MM:SS" -> seconds since day 1"""
+    # Fast path for the canonical form
+    if len(value) == 19 and value[10] == " " and value[13] == ":" and value[16] == ":":
+        hour, minute, second = value[11:13], value[14:16], value[17:19]
+        if hour.isdigit() and minute.isdigit() and second.isdigit():
+            hour, minute, second = int(hour), int(minute), int(second)
+            if hour < 24 and minute < 60 and second < 60:
+                return parse_date(value[:10]) * SECONDS_PER_DAY + hour * 3600 + minute * 60 + second
+    parsed = datetime.strptime(value, DATETIME_FORMAT)
+    return parsed.toordinal() * SECONDS_PER_DAY + parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+def format_datetime(seconds: Optional[int]) -> Optional[str]:
+    if seconds is None:
+        return None
+    day, second = divmod(seconds, SECONDS_PER_DAY)
+    return f"{format_date(day)} {second // 3600:02d}:{second % 3600 // 60:02d}:{second % 60:02d}"
+
+
+def today() -> int:
+    return date.today().toordinal()
+
+
+def now() -> int:
+    current = datetime.now()
+    return current.toordinal() * SECONDS_PER_DAY + current.hour * 3600 + current.minute * 60 + current.second
+
+
+def _parse_field(record: Dict, key: str, parser, extras: Dict):
+    """Parse an optional date field; unparseable values are kept verbatim in extras"""
+    value = record.get(key)
+    if value is None:
+        return None
+    try:
+        return parser(value)
+    except (TypeError, ValueError):
+        extras[key] = value
+        return None
+
+
+def _number(record: Dict, key: str, default, extras: Dict, cast=float):
+    value = record.get(key, default)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return cast(value)
+    extras[key] = value
+    return default
+
+
+class Item:
+    """An item on the station; location is a container ID or "waste_<id>" """
+
+    __slots__ = ("item_id", "name", "location", "priority", "expiration_date", "volume", "weight",
+                 "category", "status", "arrival_date", "last_accessed", "extras")
+
+    # Persisted fields and their storage kinds (see snapshot.py)
+    COLUMNS = (
+        ("name", "str"),
+        ("location", "str"),
+        ("priority", "i32"),
+        ("expiration_date", "date"),
+        ("volume", "f64"),
+        ("weight", "f64"),
+        ("category", "str"),
+        ("status", "str"),
+        ("arrival_date", "date"),
+        ("last_accessed", "datetime")
+    )
+
+    def __init__(self, item_id: str, name: str = None, location: str = None, priority: int = 3,
+                 expiration_date: Optional[int] = None, volume: float = 0.0, weight: float = 0.0,
+                 category: str = "general", status=ItemStatus.ACTIVE, arrival_date: Optional[int] = None,
+                 last_accessed: Optional[int] = None, extras: Optional[Dict] = None):
+        self.item_id = item_id
+        self.name = name
+        self.location = location
+        self.priority = priority
+        self.expiration_date = expiration_date
+        self.volume = volume
+        self.weight = weight
+        self.category = intern(category)
+        self.status = parse_enum(ItemStatus, status)
+        self.arrival_date = arrival_date
+        self.last_accessed = last_accessed
+        self.extras = extras or None
+
+    @classmethod
+    def from_dict(cls, item_id: str, record: Dict) -> "Item":
+        extras = {key: value for key, value in record.items() if key not in _ITEM_KEYS}
+        return cls(
+            item_id,
+            name=record.get('name'),
+            location=record.get('location'),
+            priority=_number(record, 'priority', 3, extras, int),
+            expiration_date=_parse_field(record, 'expiration_date', parse_date, extras),
+            volume=_number(record, 'volume', 0.0, extras),
+            weight=_number(record, 'weight', 0.0, extras),
+            category=record.get('category', 'general'),
+            status=record.get('status', ItemStatus.ACTIVE),
+            arrival_date=_parse_field(record, 'arrival_date', parse_date, extras),
+            last_accessed=_parse_field(record, 'last_accessed', parse_datetime, extras),
+            extras=extras
+        )
+
+    def to_dict(self) -> Dict:
+        record = {
+            "name": self.name,
+            "location": self.location,
+            "priority": self.priority,
+            "expiration_date": format_date(self.expiration_date),
+            "volume": self.volume,
+            "weight": self.weight,
+            "category": self.category,
+            "status": str(self.status) if self.status is not None else None,
+            "arrival_date": format_date(self.arrival_date),
+            "last_accessed": format_datetime(self.last_accessed)
+        }
+        if self.extras:
+            record.update(self.extras)
+        return record
+
+    def copy(self) -> "Item":
+        # Overlays copy items by the thousand, so every slot is spelled out
+        clone = Item.__new__(Item)
+        clone.item_id = self.item_id
+        clone.name = self.name
+        clone.location = self.location
+        clone.priority = self.priority
+        clone.expiration_date = self.expiration_date
+        clone.volume = self.volume
+        clone.weight = self.weight
+        clone.category = self.category
+        clone.status = self.status
+        clone.arrival_date = self.arrival_date
+        clone.last_accessed = self.last_accessed
+        clone.extras = dict(self.extras) if self.extras else self.extras
+        return clone
+
+    def days_to_expiry(self, today_ordinal: int) -> Optional[int]:
+        if self.expiration_date is None:
+            return None
+        return self.expiration_date - today_ordinal
+
+
+class Container:
+    """A storage (or return) container; items is an insertion-ordered set of item IDs"""
+
+    __slots__ = ("container_id", "name", "total_volume", "used_volume", "max_weight", "current_weight",
+                 "items", "type", "accessibility_factor", "module", "rack", "reserved_volume", "reserved_weight",
+                 "reserved_until", "extras")
+
+    COLUMNS = (
+        ("name", "str"),
+        ("total_volume", "f64"),
+        ("used_volume", "f64"),
+        ("max_weight", "f64"),
+        ("current_weight", "f64"),
+        ("items", "strlist"),
+        ("type", "str"),
+        ("accessibility_factor", "f64"),
+        ("module", "str"),
+        ("rack", "str"),
+        ("reserved_volume", "f64"),
+        ("reserved_weight", "f64"),
+        ("reserved_until", "datetime")
+    )
+
+    def __init__(self, container_id: str, name: str = None, total_volume: float = 0.0, used_volume: float = 0.0,
+                 max_weight: float = 0.0, current_weight: float = 0.0, items: Iterable[str] = (),
+                 type=ContainerType.STORAGE, accessibility_factor: float = 0.5, module: Optional[str] = None,
+                 rack: Optional[str] = None, reserved_volume: float = 0.0, reserved_weight: float = 0.0,
+                 reserved_until: Optional[int] = None, extras: Optional[Dict] = None):
+        self.container_id = container_id
+        self.name = name
+        self.total_volume = total_volume
+        self.used_volume = used_volume
+        self.max_weight = max_weight
+        self.current_weight = current_weight
+        self.items: Dict[str, None] = dict.fromkeys(items)
+        self.type = parse_enum(ContainerType, type)
+        self.accessibility_factor = accessibility_factor
+        self.module = intern(module)
+        self.rack = intern(rack)
+        # Held for reservations (see reservations.py) until the first of them expires
+        self.reserved_volume = reserved_volume
+        self.reserved_weight = reserved_weight
+        self.reserved_until = reserved_until
+        self.extras = extras or None
+
+    @classmethod
+    def from_dict(cls, container_id: str, record: Dict) -> "Container":
+        extras = {key: value for key, value in record.items() if key not in _CONTAINER_KEYS}
+        items = record.get('items', [])
+        if not isinstance(items, list):
+            extras['items'] = items
+            items = []
+        return cls(
+            container_id,
+            name=record.get('name'),
+            total_volume=_number(record, 'total_volume', 0.0, extras),
+            used_volume=_number(record, 'used_volume', 0.0, extras),
+            max_weight=_number(record, 'max_weight', 0.0, extras),
+            current_weight=_number(record, 'current_weight', 0.0, extras),
+            items=items,
+            type=record.get('type', ContainerType.STORAGE),
+            accessibility_factor=_number(record, 'accessibility_factor', 0.5, extras),
+            module=record.get('module'),
+            rack=record.get('rack'),
+            reserved_volume=_number(record, 'reserved_volume', 0.0, extras),
+            reserved_weight=_number(record, 'reserved_weight', 0.0, extras),
+            reserved_until=_parse_field(record, 'reserved_until', parse_datetime, extras),
+            extras=extras
+        )
+
+    def to_dict(self) -> Dict:
+        record = {
+            "name": self.name,
+            "total_volume": self.total_volume,
+            "used_volume": self.used_volume,
+            "max_weight": self.max_weight,
+            "current_weight": self.current_weight,
+            "items": list(self.items),
+            "type": str(self.type) if self.type is not None else None,
+            "accessibility_factor": self.accessibility_factor
+        }
+        if self.module is not None:
+            record["module"] = self.module
+        if self.rack is not None:
+            record["rack"] = self.rack
+        if self.reserved_until is not None:
+            record["reserved_volume"] = self.reserved_volume
+            record["reserved_weight"] = self.reserved_weight
+            record["reserved_until"] = format_datetime(self.reserved_until)
+        if self.extras:
+            record.update(self.extras)
+        return record
+
+    def copy(self) -> "Container":
+        clone = Container.__new__(Container)
+        for slot in Container.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        clone.items = dict(self.items)
+        if self.extras:
+            clone.extras = dict(self.extras)
+        return clone
+
+    def held(self) -> Tuple[float, float]:
+        """Volume and weight held for reservations, until the first of them expires (see reservations.expire)"""
+        if self.reserved_until is None or self.reserved_until <= now():
+            return 0.0, 0.0
+        return self.reserved_volume, self.reserved_weight
+
+    def fits(self, volume: float, weight: float) -> bool:
+        held_volume, held_weight = self.held()
+        return self.used_volume + held_volume + volume <= self.total_volume and \
+            self.current_weight + held_weight + weight <= self.max_weight
+
+    def position(self, item_id: str) -> int:
+        """Index of an item in placement order"""
+        for index, member in enumerate(self.items):
+            if member == item_id:
+                return index
+        raise ValueError(f"{item_id} is not in container {self.container_id}")
+
+    def add_item(self, item: Item) -> None:
+        """Add an item and its volume and weight; an item already here is left as it is"""
+        if item.item_id in self.items:
+            return
+        self.used_volume += item.volume
+        self.current_weight += item.weight
+        self.items[item.item_id] = None
+
+    def remove_item(self, item: Item) -> None:
+        """Take out an item and its volume and weight; an item not here changes nothing"""
+        if item.item_id not in self.items:
+            return
+        self.used_volume -= item.volume
+        self.current_weight -= item.weight
+        del self.items[item.item_id]
+
+
+class WasteContainer:
+    """A container collecting waste until it is undocked"""
+
+    __slots__ = ("container_id", "name", "total_volume", "used_volume", "max_weight", "current_weight",
+                 "waste_categories", "undock_date", "module", "extras")
+
+    COLUMNS = (
+        ("name", "str"),
+        ("total_volume", "f64"),
+        ("used_volume", "f64"),
+        ("max_weight", "f64"),
+        ("current_weight", "f64"),
+        ("waste_categories", "strlist"),
+        ("undock_date", "date"),
+        ("module", "str")
+    )
+
+    def __init__(self, container_id: str, name: str = None, total_volume: float = 0.0, used_volume: float = 0.0,
+                 max_weight: float = 0.0, current_weight: float = 0.0, waste_categories: Iterable[str] = ("general",),
+                 undock_date: Optional[int] = None, module: Optional[str] = None, extras: Optional[Dict] = None):
+        self.container_id = container_id
+        self.name = name
+        self.total_volume = total_volume
+        self.used_volume = used_volume
+        self.max_weight = max_weight
+        self.current_weight = current_weight
+        self.waste_categories = tuple(intern(category) for category in waste_categories)
+        self.undock_date = undock_date
+        self.module = intern(module)
+        self.extras = extras or None
+
+    @classmethod
+    def from_dict(cls, container_id: str, record: Dict) -> "WasteContainer":
+        extras = {key: value for key, value in record.items() if key not in _WASTE_CONTAINER_KEYS}
+        categories = record.get('waste_categories', ['general'])
+        if not isinstance(categories, list):
+            extras['waste_categories'] = categories
+            categories = []
+        return cls(
+            container_id,
+            name=record.get('name'),
+            total_volume=_number(record, 'total_volume', 0.0, extras),
+            used_volume=_number(record, 'used_volume', 0.0, extras),
+            max_weight=_number(record, 'max_weight', 0.0, extras),
+            current_weight=_number(record, 'current_weight', 0.0, extras),
+            waste_categories=categories,
+            undock_date=_parse_field(record, 'undock_date', parse_date, extras),
+            module=record.get('module'),
+            extras=extras
+        )
+
+    def to_dict(self) -> Dict:
+        record = {
+            "name": self.name,
+            "total_volume": self.total_volume,
+            "used_volume": self.used_volume,
+            "max_weight": self.max_weight,
+            "current_weight": self.current_weight,
+            "waste_categories": list(self.waste_categories),
+            "undock_date": format_date(self.undock_date)
+        }
+        if self.module is not None:
+            record["module"] = self.module
+        if self.extras:
+            record.update(self.extras)
+        return record
+
+    def copy(self) -> "WasteContainer":
+        clone = WasteContainer.__new__(WasteContainer)
+        for slot in WasteContainer.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        if self.extras:
+            clone.extras = dict(self.extras)
+        return clone
+
+    def accepts(self, category: str) -> bool:
+        return category in self.waste_categories or "general" in self.waste_categories
+
+    def fits(self, volume: float, weight: float) -> bool:
+        return self.used_volume + volume <= self.total_volume and self.current_weight + weight <= self.max_weight
+
+
+_ITEM_KEYS = {field for field, _ in Item.COLUMNS}
+_CONTAINER_KEYS = {field for field, _ in Container.COLUMNS}
+_WASTE_CONTAINER_KEYS = {field for field, _ in WasteContainer.COLUMNS}
+
+# Sections of the cargo data and the class of their rows
+SECTION_TYPES = (
+    ("items", Item),
+    ("containers", Container),
+    ("waste_containers", WasteContainer)
+)
+
+_SLOT_VALUES = {row_type: attrgetter(*row_type.__slots__) for _, row_type in SECTION_TYPES}
+
+
+def same(row, other) -> bool:
+    """Whether two rows of the same section hold equal values in every slot"""
+    values = _SLOT_VALUES[type(row)]
+    return values(row) == values(other)
+
+
+def from_json(raw: Dict) -> Dict:
+    """Convert data in the JSON file shape into model objects"""
+    data = {key: value for key, value in raw.items() if key not in dict(SECTION_TYPES)}
+    for section, row_type in SECTION_TYPES:
+        data[section] = {key: row_type.from_dict(key, record) for key, record in raw.get(section, {}).items()}
+    return data
+
+
+def to_json(data: Dict) -> Dict:
+    """Convert model objects back into the JSON file shape"""
+    raw = {}
+    for key, value in data.items():
+        if key in dict(SECTION_TYPES):
+            raw[key] = {row_key: row.to_dict() for row_key, row in value.items()}
+        else:
+            raw[key] = value
+    return raw
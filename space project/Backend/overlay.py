@@ -0,0 +1,137 @@
+from collections.abc import MutableMapping, ItemsView, ValuesView
+from typing import Dict, List, Any, Iterator, Tuple
+
+import models
+
+# Copy-on-read overlays
+#
+# An overlay stands in for a loaded section and keeps every change private:
+# a row is copied the first time it is read, so callers can mutate what they
+# get back in place without touching the underlying row. Deletions and new
+# rows are recorded in the overlay too. merge() applies the overlay to the
+# section underneath; dropping the overlay discards it. Overlays stack, and
+# work over snapshot and plain-dict sections alike.
+
+SECTION_NAMES = tuple(name for name, _ in models.SECTION_TYPES)
+
+
+class Overlay(MutableMapping):
+    """Private, mergeable view of a section"""
+
+    def __init__(self, base):
+        self.base = base
+        self.rows: Dict[str, Any] = {}  # Rows read (copied) or written through the overlay
+        self.added: set = set()  # Keys not present in the base
+        self.deleted: set = set()  # Base keys removed through the overlay
+
+    def __getitem__(self, key):
+        row = self.rows.get(key)
+        if row is not None:
+            return row
+        if key in self.deleted:
+            raise KeyError(key)
+        row = self.rows[key] = self.base[key].copy()
+        return row
+
+    def __setitem__(self, key, value):
+        if key not in self.rows and (key in self.deleted or key not in self.base):
+            if key in self.deleted:
+                self.deleted.discard(key)
+            else:
+                self.added.add(key)
+        self.rows[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.rows.pop(key, None)
+        if key in self.added:
+            self.added.discard(key)
+        else:
+            self.deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self.rows:
+            return True
+        return key not in self.deleted and key in self.base
+
+    def __iter__(self) -> Iterator[str]:
+        deleted = self.deleted
+        for key in self.base:
+            if key not in deleted:
+                yield key
+        yield from [key for key in self.rows if key in self.added]
+
+    def __len__(self):
+        return len(self.base) - len(self.deleted) + len(self.added)
+
+    def items(self):
+        return _OverlayItems(self)
+
+    def values(self):
+        return _OverlayValues(self)
+
+    def iter_rows(self) -> Iterator[Tuple[str, Any]]:
+        rows = self.rows
+        deleted = self.deleted
+        for key, row in self.base.items():
+            if key in deleted:
+                continue
+            mine = rows.get(key)
+            if mine is None:
+                mine = rows[key] = row.copy()
+            yield key, mine
+        yield from [(key, row) for key, row in rows.items() if key in self.added]
+
+    def changes(self) -> List[Tuple[str, Any, Any]]:
+        """(key, base row or None, overlay row or None) for every row that differs from the base
+
+        Rows that were only read are dropped from the overlay, so it holds
+        just what really changed and later reads copy them afresh.
+        """
+        found = []
+        for key, row in list(self.rows.items()):
+            if key in self.added:
+                found.append((key, None, row))
+                continue
+            old = self.base[key]
+            if models.same(old, row):
+                del self.rows[key]
+            else:
+                found.append((key, old, row))
+        found.extend((key, self.base[key], None) for key in self.deleted)
+        return found
+
+    def merge(self) -> None:
+        """Apply every change made through the overlay to the section underneath"""
+        for key in self.deleted:
+            del self.base[key]
+        for key, row in self.rows.items():
+            self.base[key] = row
+        self.rows, self.added, self.deleted = {}, set(), set()
+
+
+class _OverlayItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_rows()
+
+
+class _OverlayValues(ValuesView):
+    def __iter__(self):
+        return (row for _, row in self._mapping.iter_rows())
+
+
+def overlay(data: Dict) -> Dict:
+    """A private view of loaded data; pass it to merge() to keep its changes"""
+    layered = {name: Overlay(data[name]) for name in SECTION_NAMES}
+    layered.update({key: value for key, value in data.items() if key not in SECTION_NAMES})
+    return layered
+
+
+def merge(data: Dict, layered: Dict) -> None:
+    """Apply an overlay made by overlay(data) back onto data"""
+    for name in SECTION_NAMES:
+        layered[name].merge()
+    for key, value in layered.items():
+        if key not in SECTION_NAMES:
+            data[key] = value
@@ -0,0 +1,285 @@
+import threading
+from typing import Dict, List, Tuple, Optional, Iterable
+
+import models
+
+# Zone-aware placement
+#
+# Zones nest as module -> rack -> container. Storage containers are laid out
+# in (module, rack, container ID) order, so every module and every rack covers
+# a contiguous range of leaves in one segment tree. Each tree node keeps the
+# largest free volume, largest free weight and highest accessibility factor
+# below it. A best-fit query for a zone walks only that zone's range and skips
+# any subtree where no container could hold the item, or where even the most
+# accessible container could not beat the best fit found so far. Updating a
+# container after a placement refreshes the nodes on its path to the root.
+# Capacity held for reservations (see reservations.py) counts as used.
+#
+# Placements share one tree per process (PlacementIndex), kept in step with
+# the change events like the re-slotting optimizer: each container event
+# refreshes that container's leaf, and only containers being added, removed,
+# re-zoned or re-rated rebuild the tree. A container whose reservations expire
+# has its leaf refreshed at the next sync, since expiry makes no event.
+
+NEGATIVE = float("-inf")
+TOLERANCE = 1e-9  # Pruning is conservative; leaves check capacity exactly
+
+
+def placement_score(container: models.Container, volume: float, priority: int) -> float:
+    """Higher is better: tight fit, and accessible containers for high priority items"""
+    # Space efficiency: containers with just enough space get higher scores
+    remaining_space = container.total_volume - container.used_volume - container.held()[0]
+    space_efficiency = 1 - (remaining_space - volume) / container.total_volume
+
+    # High priority (5) items should go in more accessible containers
+    accessibility_score = container.accessibility_factor * (priority / 5)
+
+    return (space_efficiency * 0.5) + (accessibility_score * 0.5)
+
+
+def parse_zone(zone: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """"module" or "module/rack" -> (module, rack)"""
+    if not zone:
+        return None, None
+    module, _, rack = zone.partition("/")
+    return module or None, rack or None
+
+
+def neighbouring_modules(module: str, modules: Iterable[str], adjacency: Dict[str, List[str]]) -> List[str]:
+    """Modules next to a module: from the station layout if given, else neighbours in ID order"""
+    if module in adjacency:
+        return adjacency[module]
+    names = sorted(name for name in modules if name)
+    if module not in names:
+        return []
+    index = names.index(module)
+    return names[max(0, index - 1):index] + names[index + 1:index + 2]
+
+
+class CapacityTree:
+    """Segment tree of free capacity over storage containers, grouped by zone"""
+
+    def __init__(self, containers: Iterable[Tuple[str, models.Container]],
+                 adjacency: Optional[Dict[str, List[str]]] = None):
+        storage = [(container.module or "", container.rack or "", container_id, container)
+                   for container_id, container in containers
+                   if container.type == models.ContainerType.STORAGE]
+        storage.sort(key=lambda entry: entry[:3])
+
+        self.ids = [entry[2] for entry in storage]
+        self.containers = [entry[3] for entry in storage]
+        self.position = {container_id: index for index, container_id in enumerate(self.ids)}
+        self.adjacency = adjacency or {}
+
+        # Zone ranges: module -> [lo, hi), (module, rack) -> [lo, hi)
+        self.modules: Dict[str, List[int]] = {}
+        self.racks: Dict[Tuple[str, str], List[int]] = {}
+        for index, (module, rack, _, _) in enumerate(storage):
+            self.modules.setdefault(module, [index, index])[1] = index + 1
+            self.racks.setdefault((module, rack), [index, index])[1] = index + 1
+
+        size = 1
+        while size < len(storage):
+            size *= 2
+        self.size = size
+        self.free_volume = [NEGATIVE] * (2 * size)
+        self.free_weight = [NEGATIVE] * (2 * size)
+        self.access = [NEGATIVE] * (2 * size)
+        for index, container in enumerate(self.containers):
+            self._set_leaf(index, container)
+        for node in range(size - 1, 0, -1):
+            self._pull(node)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _set_leaf(self, index: int, container: models.Container) -> None:
+        node = self.size + index
+        held_volume, held_weight = container.held()
+        self.free_volume[node] = container.total_volume - container.used_volume - held_volume
+        self.free_weight[node] = container.max_weight - container.current_weight - held_weight
+        self.access[node] = container.accessibility_factor
+
+    def _pull(self, node: int) -> None:
+        left, right = 2 * node, 2 * node + 1
+        self.free_volume[node] = max(self.free_volume[left], self.free_volume[right])
+        self.free_weight[node] = max(self.free_weight[left], self.free_weight[right])
+        self.access[node] = max(self.access[left], self.access[right])
+
+    def update(self, container_id: str) -> None:
+        """Refresh a container's capacity after items were added or removed, O(log n)"""
+        index = self.position.get(container_id)
+        if index is None:
+            return
+        self._set_leaf(index, self.containers[index])
+        node = (self.size + index) // 2
+        while node:
+            self._pull(node)
+            node //= 2
+
+    def best_in_range(self, lo: int, hi: int, volume: float, weight: float, priority: int,
+                      best: Tuple[float, Optional[str]] = (NEGATIVE, None)) -> Tuple[float, Optional[str]]:
+        """Best (score, container ID) among leaves [lo, hi), or best if none beats it"""
+        best_score, best_id = best
+        if lo >= hi:
+            return best_score, best_id
+        # Upper bound on a subtree's score: perfect fit in its most accessible container
+        priority_weight = 0.5 * priority / 5
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, node_lo, node_hi = stack.pop()
+            if node_hi <= lo or node_lo >= hi:
+                continue
+            if self.free_volume[node] + TOLERANCE < volume or self.free_weight[node] + TOLERANCE < weight:
+                continue
+            if 0.5 + self.access[node] * priority_weight < best_score:
+                continue
+            if node >= self.size:
+                index = node - self.size
+                container = self.containers[index]
+                if not container.fits(volume, weight):
+                    continue
+                score = placement_score(container, volume, priority)
+                container_id = self.ids[index]
+                if score > best_score or (score == best_score and container_id < best_id):
+                    best_score, best_id = score, container_id
+                continue
+            middle = (node_lo + node_hi) // 2
+            # Visit the more accessible half first so its result prunes the other
+            halves = [(2 * node, node_lo, middle), (2 * node + 1, middle, node_hi)]
+            if self.access[2 * node] > self.access[2 * node + 1]:
+                halves.reverse()
+            stack.extend(halves)
+        return best_score, best_id
+
+    def most_accessible(self, volume: float, weight: float, above: float = NEGATIVE,
+                        exclude: Optional[str] = None) -> Tuple[float, Optional[str]]:
+        """(accessibility, container ID) of the most accessible container an item fits in
+
+        Only containers more accessible than `above` are considered; (above, None) if there is none.
+        """
+        best_access, best_id = above, None
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, node_lo, node_hi = stack.pop()
+            if self.access[node] <= best_access:
+                continue
+            if self.free_volume[node] + TOLERANCE < volume or self.free_weight[node] + TOLERANCE < weight:
+                continue
+            if node >= self.size:
+                index = node - self.size
+                container = self.containers[index]
+                if self.ids[index] == exclude or not container.fits(volume, weight):
+                    continue
+                best_access, best_id = container.accessibility_factor, self.ids[index]
+                continue
+            middle = (node_lo + node_hi) // 2
+            halves = [(2 * node, node_lo, middle), (2 * node + 1, middle, node_hi)]
+            if self.access[2 * node] > self.access[2 * node + 1]:
+                halves.reverse()
+            stack.extend(halves)
+        return best_access, best_id
+
+    def search_order(self, zone: Optional[str]) -> List[List[Tuple[int, int]]]:
+        """Leaf ranges to try, nearest zone first; each step excludes the ranges already tried"""
+        module, rack = parse_zone(zone)
+        if module is None or module not in self.modules:
+            return [[(0, len(self.ids))]]
+
+        steps = []
+        module_lo, module_hi = self.modules[module]
+        rack_range = self.racks.get((module, rack)) if rack is not None else None
+        if rack_range:
+            steps.append([tuple(rack_range)])
+            steps.append([(module_lo, rack_range[0]), (rack_range[1], module_hi)])
+        else:
+            steps.append([(module_lo, module_hi)])
+
+        # Neighbouring modules, breadth first, then the rest of the station
+        visited = {module}
+        frontier = [module]
+        while frontier:
+            neighbours = []
+            for current in frontier:
+                for neighbour in neighbouring_modules(current, self.modules, self.adjacency):
+                    if neighbour not in visited and neighbour in self.modules:
+                        visited.add(neighbour)
+                        neighbours.append(neighbour)
+            if neighbours:
+                steps.append([tuple(self.modules[neighbour]) for neighbour in neighbours])
+            frontier = neighbours
+        rest = [tuple(bounds) for name, bounds in self.modules.items() if name not in visited]
+        if rest:
+            steps.append(rest)
+        return steps
+
+    def best_fit(self, volume: float, weight: float, priority: int = 3,
+                 zone: Optional[str] = None) -> Optional[str]:
+        """Best container for an item, preferring the given zone and then the nearest zones"""
+        for ranges in self.search_order(zone):
+            best = (NEGATIVE, None)
+            for lo, hi in ranges:
+                best = self.best_in_range(lo, hi, volume, weight, priority, best)
+            if best[1] is not None:
+                return best[1]
+        return None
+
+
+class PlacementIndex:
+    """A capacity tree over private copies of the storage containers, updated from the change events"""
+
+    def __init__(self, adjacency: Optional[Dict[str, List[str]]] = None):
+        self.lock = threading.Lock()
+        self.adjacency = adjacency
+        self.version: Optional[int] = None  # Journal version the tree reflects
+        self.tree: Optional[CapacityTree] = None
+        self.held_until: Dict[str, int] = {}  # container ID -> first expiry of the reservations its leaf counts
+
+    def rebuild(self, data: Dict, version: Optional[int]) -> None:
+        """Start over from loaded data"""
+        self.tree = CapacityTree(((container_id, container.copy())
+                                  for container_id, container in data['containers'].items()), self.adjacency)
+        self.held_until = {container_id: container.reserved_until
+                           for container_id, container in zip(self.tree.ids, self.tree.containers)
+                           if container.held() != (0.0, 0.0)}
+        self.version = version
+
+    def sync(self, data: Dict, version: Optional[int], found: Optional[List[Dict]]) -> None:
+        """Catch up with data, given the change events since the last sync (None to rebuild)"""
+        if self.tree is None or found is None or self._layout_changed(data, found):
+            self.rebuild(data, version)
+            return
+        for event in found:
+            if event.get("entity") == 'containers' and event["id"] in self.tree.position:
+                self.update(event["id"], data['containers'][event["id"]])
+        current = models.now()
+        # Loaded data has already released the holds of expired reservations
+        for container_id in [key for key, until in self.held_until.items() if until <= current]:
+            self.update(container_id, data['containers'][container_id])
+        self.version = version
+
+    def update(self, container_id: str, container: models.Container) -> None:
+        """Take a container's current load into the tree, O(log n)"""
+        stored = self.tree.containers[self.tree.position[container_id]] = container.copy()
+        self.tree.update(container_id)
+        if stored.held() != (0.0, 0.0):
+            self.held_until[container_id] = stored.reserved_until
+        else:
+            self.held_until.pop(container_id, None)
+
+    def _layout_changed(self, data: Dict, found: List[Dict]) -> bool:
+        """Whether storage containers were added, removed, re-zoned or re-rated, which changes the tree itself"""
+        for event in found:
+            if event.get("entity") != 'containers':
+                continue
+            container = data['containers'].get(event["id"])
+            index = self.tree.position.get(event["id"])
+            if container is None or index is None:
+                if index is not None or (container is not None and container.type == models.ContainerType.STORAGE):
+                    return True
+                continue
+            stored = self.tree.containers[index]
+            if (container.type, container.module, container.rack, container.accessibility_factor) != \
+               (stored.type, stored.module, stored.rack, stored.accessibility_factor):
+                return True
+        return False
@@ -0,0 +1,115 @@
+from typing import Dict, List, Tuple, Any
+
+import models
+
+# Rearrangement plan execution
+#
+# A plan is validated as a whole before anything is changed. The dry run keeps
+# a delta overlay (the running volume and weight of each container touched and
+# the current location of each item moved) instead of mutating the models, so
+# each move is checked in constant time, in plan order: an item has to be
+# where the plan says it is at that point, and the destination has to have
+# room once the earlier moves have freed or used space. Every violation is
+# reported, not just the first. Only a plan without violations is applied,
+# and the caller saves it in one write.
+
+
+class PlanOverlay:
+    """Container loads and item locations as they would be part way through a plan"""
+
+    def __init__(self, data: Dict):
+        self.data = data
+        self.locations: Dict[str, str] = {}
+        self.loads: Dict[str, List[float]] = {}  # container ID -> [used volume, current weight]
+
+    def location(self, item: models.Item) -> str:
+        return self.locations.get(item.item_id, item.location)
+
+    def load(self, container_id: str) -> List[float]:
+        load = self.loads.get(container_id)
+        if load is None:
+            container = self.data['containers'][container_id]
+            load = self.loads[container_id] = [container.used_volume, container.current_weight]
+        return load
+
+    def move(self, item: models.Item, from_container: str, to_container: str) -> None:
+        source, target = self.load(from_container), self.load(to_container)
+        source[0] -= item.volume
+        source[1] -= item.weight
+        target[0] += item.volume
+        target[1] += item.weight
+        self.locations[item.item_id] = to_container
+
+
+def check_move(data: Dict, overlay: PlanOverlay, move: Any) -> Tuple[Any, str]:
+    """(item, None) if a move is valid at this point of the plan, else (None, reason)"""
+    if not isinstance(move, dict) or not all(isinstance(move.get(field), str)
+                                             for field in ('item_id', 'from_container', 'to_container')):
+        return None, "Move needs item_id, from_container and to_container"
+    item_id, from_container, to_container = move['item_id'], move['from_container'], move['to_container']
+
+    if item_id not in data['items']:
+        return None, f"Item {item_id} not found"
+    for container_id in (from_container, to_container):
+        if container_id not in data['containers']:
+            return None, f"Container {container_id} not found"
+
+    item = data['items'][item_id]
+    if item.status != models.ItemStatus.ACTIVE:
+        return None, f"Item {item_id} is {item.status}, not active"
+    location = overlay.location(item)
+    if location != from_container:
+        return None, f"Item {item_id} is in {location} at this point of the plan, not {from_container}"
+    if to_container == from_container:
+        return None, f"Item {item_id} is already in {to_container}"
+
+    destination = data['containers'][to_container]
+    if destination.type != models.ContainerType.STORAGE:
+        return None, f"Container {to_container} is not a storage container"
+    used_volume, current_weight = overlay.load(to_container)
+    held_volume, held_weight = destination.held()
+    if used_volume + held_volume + item.volume > destination.total_volume:
+        return None, f"Not enough space in container {to_container}"
+    if current_weight + held_weight + item.weight > destination.max_weight:
+        return None, f"Weight limit exceeded in container {to_container}"
+    return item, None
+
+
+def dry_run(data: Dict, plan: List) -> Tuple[PlanOverlay, List[Dict]]:
+    """Check every move of a plan in order without changing data; returns the overlay and violations"""
+    overlay = PlanOverlay(data)
+    violations = []
+    for index, move in enumerate(plan):
+        item, reason = check_move(data, overlay, move)
+        if reason:
+            violations.append({"move": index, "item_id": move.get('item_id') if isinstance(move, dict) else None,
+                               "error": reason})
+            continue
+        overlay.move(item, move['from_container'], move['to_container'])
+    return overlay, violations
+
+
+def apply(data: Dict, plan: List) -> None:
+    """Carry out a plan that passed its dry run"""
+    now = models.now()
+    for move in plan:
+        item = data['items'][move['item_id']]
+        data['containers'][move['from_container']].remove_item(item)
+        data['containers'][move['to_container']].add_item(item)
+        item.location = move['to_container']
+        item.last_accessed = now
+
+
+def summary(data: Dict, overlay: PlanOverlay) -> List[Dict]:
+    """Resulting fill of every container the plan touches"""
+    containers = []
+    for container_id, (used_volume, current_weight) in sorted(overlay.loads.items()):
+        container = data['containers'][container_id]
+        containers.append({
+            "container_id": container_id,
+            "used_volume": round(used_volume, 4),
+            "total_volume": container.total_volume,
+            "current_weight": round(current_weight, 4),
+            "max_weight": container.max_weight
+        })
+    return containers
@@ -0,0 +1,169 @@
+from typing import Dict, List, Tuple, Optional
+
+import models
+
+# Capacity reservations
+#
+# A reservation holds volume and weight in specific storage containers for a
+# resupply vehicle until it expires. Reservations are kept in the data as the
+# top-level "reservations" entry, by reservation ID:
+#
+#   {"vehicle": ..., "created_at": ..., "expires_at": "YYYY-MM-DD HH:MM:SS",
+#    "item_ids": [...] or null, "holds": {container_id: {"volume": v, "weight": w}}}
+#
+# Each container also carries the total it holds and when the first reservation
+# holding it expires (Container.reserved_*), so capacity checks read only the
+# container itself: ordinary placements cost no more than before, and a
+# container with no reservations takes the same path as always. Totals are
+# recomputed from the reservations whenever one is created, consumed,
+# cancelled or expired. Loading the data expires reservations, so a container
+# whose first reservation has passed is recomputed from the ones still live.
+#
+# Placing an item against a reservation uses up the reservation's hold in the
+# container it goes into, and a reservation is dropped once nothing is held.
+# The entry is replaced, never changed in place, so overlays stay private.
+
+TOLERANCE = 1e-9  # Holds smaller than this are used up
+
+
+def _expiry(reservation: Dict) -> int:
+    return models.parse_datetime(reservation["expires_at"])
+
+
+def get(data: Dict, reservation_id: str) -> Optional[Dict]:
+    """An unexpired reservation, or None"""
+    reservation = data.get('reservations', {}).get(reservation_id)
+    if reservation is None or _expiry(reservation) <= models.now():
+        return None
+    return reservation
+
+
+def active(data: Dict) -> Dict[str, Dict]:
+    current = models.now()
+    return {reservation_id: reservation for reservation_id, reservation in data.get('reservations', {}).items()
+            if _expiry(reservation) > current}
+
+
+def _refresh(data: Dict, reservations: Dict[str, Dict], container_ids) -> None:
+    """Recompute the held totals of containers from the reservations"""
+    for container_id in container_ids:
+        if container_id not in data['containers']:
+            continue
+        volume = weight = 0.0
+        until = None
+        for reservation in reservations.values():
+            hold = reservation["holds"].get(container_id)
+            if hold is not None:
+                volume += hold["volume"]
+                weight += hold["weight"]
+                until = _expiry(reservation) if until is None else min(until, _expiry(reservation))
+        container = data['containers'][container_id]
+        if (container.reserved_volume, container.reserved_weight, container.reserved_until) != (volume, weight, until):
+            container.reserved_volume, container.reserved_weight, container.reserved_until = volume, weight, until
+
+
+def _replace(data: Dict, reservations: Dict[str, Dict], container_ids) -> None:
+    data['reservations'] = reservations
+    _refresh(data, reservations, container_ids)
+
+
+def expire(data: Dict) -> List[str]:
+    """Drop expired reservations, releasing what they held; returns their IDs"""
+    current = models.now()
+    stored = data.get('reservations', {})
+    expired = [reservation_id for reservation_id, reservation in stored.items() if _expiry(reservation) <= current]
+    if expired:
+        released = {container_id for reservation_id in expired for container_id in stored[reservation_id]["holds"]}
+        _replace(data, {key: value for key, value in stored.items() if key not in expired}, released)
+    return expired
+
+
+def create(data: Dict, reservation_id: str, vehicle: Optional[str], expires_at: int,
+           holds: Dict[str, Tuple[float, float]], item_ids: Optional[List[str]]) -> Optional[str]:
+    """Hold capacity in containers until expires_at; returns an error message, or None"""
+    stored = data.get('reservations', {})
+    if reservation_id in stored:
+        return f"Reservation {reservation_id} already exists"
+    if expires_at <= models.now():
+        return "expires_at must be in the future"
+    for container_id, (volume, weight) in holds.items():
+        container = data['containers'].get(container_id)
+        if container is None:
+            return f"Container {container_id} not found"
+        if container.type != models.ContainerType.STORAGE:
+            return f"Container {container_id} is not a storage container"
+        if volume < 0 or weight < 0 or volume + weight <= 0:
+            return f"Hold in container {container_id} must be positive"
+        if not container.fits(volume, weight):
+            return f"Not enough free capacity in container {container_id}"
+
+    reservation = {
+        "vehicle": vehicle,
+        "created_at": models.format_datetime(models.now()),
+        "expires_at": models.format_datetime(expires_at),
+        "item_ids": item_ids,
+        "holds": {container_id: {"volume": volume, "weight": weight}
+                  for container_id, (volume, weight) in holds.items()}
+    }
+    _replace(data, {**stored, reservation_id: reservation}, holds)
+    return None
+
+
+def cancel(data: Dict, reservation_id: str) -> bool:
+    """Release a reservation; False if there is none by that ID"""
+    stored = data.get('reservations', {})
+    if reservation_id not in stored:
+        return False
+    _replace(data, {key: value for key, value in stored.items() if key != reservation_id},
+             stored[reservation_id]["holds"])
+    return True
+
+
+def fits(container: models.Container, hold: Optional[Dict], volume: float, weight: float) -> bool:
+    """Whether an item fits in a container, counting a reservation's own hold there as free"""
+    if hold is None:
+        return container.fits(volume, weight)
+    held_volume, held_weight = container.held()
+    return container.used_volume + held_volume - hold["volume"] + volume <= container.total_volume and \
+        container.current_weight + held_weight - hold["weight"] + weight <= container.max_weight
+
+
+def best_container(data: Dict, reservation: Dict, volume: float, weight: float) -> Optional[str]:
+    """The reserved container an item fits best: the smallest hold that still takes it"""
+    best, best_room = None, None
+    for container_id, hold in sorted(reservation["holds"].items()):
+        container = data['containers'].get(container_id)
+        if container is None or not fits(container, hold, volume, weight):
+            continue
+        room = hold["volume"] - volume
+        if room < 0:
+            room = float("inf")  # Fits only by using unreserved space as well
+        if best is None or room < best_room:
+            best, best_room = container_id, room
+    return best
+
+
+def consume(data: Dict, reservation_id: str, container_id: str, volume: float, weight: float) -> None:
+    """Use up a reservation's hold in a container by an item placed there"""
+    stored = data['reservations']
+    reservation = stored[reservation_id]
+    hold = reservation["holds"].get(container_id)
+    if hold is None:
+        return
+    left = {"volume": max(0.0, hold["volume"] - volume), "weight": max(0.0, hold["weight"] - weight)}
+    holds = {key: value for key, value in reservation["holds"].items() if key != container_id}
+    if left["volume"] > TOLERANCE or left["weight"] > TOLERANCE:
+        holds[container_id] = left
+    remaining = {key: value for key, value in stored.items() if key != reservation_id}
+    if holds:
+        remaining[reservation_id] = {**reservation, "holds": holds}
+    _replace(data, remaining, [container_id])
+
+
+def describe(reservation_id: str, reservation: Dict) -> Dict:
+    return {
+        "reservation_id": reservation_id,
+        **reservation,
+        "reserved_volume": sum(hold["volume"] for hold in reservation["holds"].values()),
+        "reserved_weight": sum(hold["weight"] for hold in reservation["holds"].values())
+    }
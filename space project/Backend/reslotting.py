@@ -0,0 +1,233 @@
+import time
+import heapq
+import threading
+from typing import Dict, List, Tuple, Optional, Callable
+
+import models
+import placement
+
+# Accessibility re-slotting
+#
+# The station is scored on priority-weighted accessibility: the mean
+# accessibility factor of the containers active items are in, weighted by
+# item priority. Moving an item of priority p from a container of
+# accessibility a to one of accessibility b changes the score's numerator by
+# p * (b - a), so every item has one best move: into the most accessible
+# container that has room for it (see CapacityTree.most_accessible).
+#
+# Each item's best move is kept in a max-heap by gain. Gains only depend on
+# accessibility, so a container filling up can only invalidate moves into it,
+# which is checked when a move reaches the top. A container gaining room can
+# make moves better, but only for items held back by capacity: those sit in a
+# second heap keyed by the best gain they could ever have, and are re-checked
+# lazily, only while that bound beats the best move on offer. Between runs
+# the heaps are kept and only the items and containers named by change
+# events since the last run are refreshed.
+
+TOLERANCE = 1e-9
+
+
+class Reslotter:
+    """Best re-slotting moves for every item, updated incrementally"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version: Optional[int] = None  # Journal version the state reflects
+        self.tree: Optional[placement.CapacityTree] = None  # Over private copies of the containers
+        self.items: Dict[str, List] = {}  # item ID -> [location, priority, volume, weight]
+        self.heap: List[Tuple[float, int, str, str]] = []  # (-gain, stamp, item ID, target)
+        self.limited: List[Tuple[float, int, str]] = []  # (-best possible gain, stamp, item ID)
+        self.parked: List[Tuple[float, int, str]] = []  # Limited items already checked since the last opening
+        self.stamps: Dict[str, int] = {}  # item ID -> stamp of its live heap entries
+        self.checked: Dict[str, int] = {}  # item ID -> opening count when its move was worked out
+        self.openings = 0  # Times a container gained room
+        self.next_stamp = 0
+        self.top_access = placement.NEGATIVE
+        self.weighted_access = 0.0  # Sum of priority * accessibility over tracked items
+        self.total_priority = 0
+
+    # State
+
+    def rebuild(self, data: Dict, version: Optional[int]) -> None:
+        """Start over from loaded data"""
+        self.tree = placement.CapacityTree(((container_id, container.copy())
+                                            for container_id, container in data['containers'].items()))
+        self.top_access = max(self.tree.access[1], 0.0) if len(self.tree) else 0.0
+        self.items, self.heap, self.limited, self.parked = {}, [], [], []
+        self.stamps, self.checked = {}, {}
+        self.weighted_access, self.total_priority = 0.0, 0
+        for item_id, item in data['items'].items():
+            self._track(item_id, item)
+        self.version = version
+
+    def sync(self, data: Dict, version: Optional[int], found: Optional[List[Dict]]) -> None:
+        """Catch up with data, given the change events since the last sync (None to rebuild)"""
+        if self.tree is None or found is None or self._layout_changed(data, found):
+            self.rebuild(data, version)
+            return
+        for event in found:
+            entity, key = event.get("entity"), event.get("id")
+            if entity == 'containers':
+                self._container_changed(key, data['containers'][key])
+            elif entity == 'items':
+                self._track(key, data['items'].get(key))
+        self.version = version
+
+    def _layout_changed(self, data: Dict, found: List[Dict]) -> bool:
+        """Whether containers were added, removed or re-rated, which changes the tree itself"""
+        for event in found:
+            if event.get("entity") != 'containers':
+                continue
+            container = data['containers'].get(event["id"])
+            index = self.tree.position.get(event["id"])
+            if container is None or index is None or \
+               container.accessibility_factor != self.tree.containers[index].accessibility_factor:
+                return True
+        return False
+
+    def _access(self, container_id: str) -> float:
+        return self.tree.containers[self.tree.position[container_id]].accessibility_factor
+
+    def _track(self, item_id: str, item: Optional[models.Item]) -> None:
+        """Record an item's current state and work out its best move"""
+        previous = self.items.pop(item_id, None)
+        if previous is not None:
+            self.weighted_access -= previous[1] * self._access(previous[0])
+            self.total_priority -= previous[1]
+        self.stamps.pop(item_id, None)
+        self.checked.pop(item_id, None)
+        if item is None or item.status != models.ItemStatus.ACTIVE or item.location not in self.tree.position:
+            return
+        self.items[item_id] = [item.location, item.priority, item.volume, item.weight]
+        self.weighted_access += item.priority * self._access(item.location)
+        self.total_priority += item.priority
+        self._refresh(item_id)
+
+    def _refresh(self, item_id: str) -> None:
+        location, priority, volume, weight = self.items[item_id]
+        self.next_stamp += 1
+        stamp = self.stamps[item_id] = self.next_stamp
+        self.checked[item_id] = self.openings
+
+        access = self._access(location)
+        target_access, target = self.tree.most_accessible(volume, weight, above=access, exclude=location)
+        gain = priority * (target_access - access) if target is not None else 0.0
+        if gain > TOLERANCE:
+            heapq.heappush(self.heap, (-gain, stamp, item_id, target))
+        bound = priority * (self.top_access - access)
+        if bound > gain + TOLERANCE:
+            heapq.heappush(self.limited, (-bound, stamp, item_id))
+
+    def _container_changed(self, container_id: str, container: models.Container) -> None:
+        index = self.tree.position[container_id]
+        mine = self.tree.containers[index]
+        gained = (container.used_volume < mine.used_volume - TOLERANCE or
+                  container.current_weight < mine.current_weight - TOLERANCE)
+        mine.used_volume, mine.current_weight = container.used_volume, container.current_weight
+        self.tree.update(container_id)
+        if gained:
+            self._opened()
+
+    def _opened(self) -> None:
+        # Items held back by capacity may have better moves now
+        self.openings += 1
+        if self.parked:
+            self.limited.extend(self.parked)
+            self.parked = []
+            heapq.heapify(self.limited)
+
+    def score(self) -> float:
+        return self.weighted_access / self.total_priority if self.total_priority else 0.0
+
+    # Choosing moves
+
+    def _best(self) -> Optional[Tuple[float, str, str]]:
+        """(gain, item ID, target) of the best valid move, without removing it"""
+        heap, limited, stamps = self.heap, self.limited, self.stamps
+        while True:
+            while heap:
+                _, stamp, item_id, target = heap[0]
+                if stamps.get(item_id) != stamp:
+                    heapq.heappop(heap)
+                    continue
+                _, _, volume, weight = self.items[item_id]
+                container = self.tree.containers[self.tree.position[target]]
+                if not container.fits(volume, weight):
+                    heapq.heappop(heap)
+                    self._refresh(item_id)
+                    continue
+                break
+            while limited and stamps.get(limited[0][2]) != limited[0][1]:
+                heapq.heappop(limited)
+
+            best_gain = -heap[0][0] if heap else 0.0
+            if limited and -limited[0][0] > best_gain + TOLERANCE:
+                _, _, item_id = limited[0]
+                if self.checked[item_id] < self.openings:
+                    self._refresh(item_id)  # Its stamp changes, dropping the old entries
+                else:
+                    self.parked.append(heapq.heappop(limited))
+                continue
+            if not heap:
+                return None
+            return best_gain, heap[0][2], heap[0][3]
+
+    def _move(self, item_id: str, target: str) -> None:
+        state = self.items[item_id]
+        location, priority, volume, weight = state
+        source, destination = (self.tree.containers[self.tree.position[container_id]]
+                               for container_id in (location, target))
+        source.used_volume -= volume
+        source.current_weight -= weight
+        destination.used_volume += volume
+        destination.current_weight += weight
+        self.tree.update(location)
+        self.tree.update(target)
+        self.weighted_access += priority * (self._access(target) - self._access(location))
+        state[0] = target
+        self._opened()
+        self._refresh(item_id)
+
+    def propose(self, data: Dict, budget: int, min_gain: float = 0.0) -> Dict:
+        """The moves, at most budget of them, that raise the score the most, in order
+
+        Moves are chosen greedily, each against the station as the earlier
+        ones leave it. Nothing is changed: the state is restored from data.
+        """
+        before = self.score()
+        moves = []
+        touched_items, touched_containers = set(), set()
+        while len(moves) < budget:
+            best = self._best()
+            if best is None or best[0] <= min_gain + TOLERANCE:
+                break
+            gain, item_id, target = best
+            source = self.items[item_id][0]
+            moves.append({"item_id": item_id, "from_container": source, "to_container": target,
+                          "priority": self.items[item_id][1], "gain": round(gain, 4)})
+            touched_items.add(item_id)
+            touched_containers.update((source, target))
+            self._move(item_id, target)
+        after = self.score()
+
+        # Undo the simulated moves
+        for container_id in touched_containers:
+            self._container_changed(container_id, data['containers'][container_id])
+        for item_id in touched_items:
+            self._track(item_id, data['items'].get(item_id))
+        return {"score": {"current": round(before, 4), "proposed": round(after, 4)}, "moves": moves}
+
+
+def run_periodically(job: Callable[[], None], interval: float, on_error: Callable[[Exception], None]) -> threading.Thread:
+    """Call job every interval seconds on a daemon thread"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                job()
+            except Exception as error:
+                on_error(error)
+
+    thread = threading.Thread(target=loop, name="reslotting", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,192 @@
+from collections import deque
+from typing import Dict, List, Tuple, Optional
+
+import models
+import placement
+
+# Multi-item retrieval routes
+#
+# A task list is grouped by container so that each container is opened once,
+# digging down to the deepest requested item. Opening a container costs the
+# same whatever the order, so sequencing only has to minimise travel between
+# containers: hops between modules, plus a short move between racks within a
+# module. The route is an open tour starting at the crew member's module,
+# built nearest-neighbour first (more accessible containers win ties) and then
+# improved with 2-opt until no segment reversal shortens it.
+
+MODULE_HOP_MINUTES = 2.0  # Moving to an adjacent module
+RACK_MOVE_MINUTES = 0.5  # Moving between racks (or containers without one) in a module
+MAX_IMPROVEMENT_PASSES = 20
+
+
+def open_minutes(container: models.Container) -> float:
+    """Time to get into a container, as estimated by find_item"""
+    return (1 - container.accessibility_factor) * 10  # 0-10 minutes
+
+
+def dig_minutes(container: models.Container, item_id: str) -> float:
+    """Time to reach an item inside an open container; older items sit deeper"""
+    return container.position(item_id) / max(1, len(container.items)) * 5  # 0-5 minutes
+
+
+def module_hops(modules: List[str], adjacency: Dict[str, List[str]]) -> Dict[str, Dict[str, int]]:
+    """Hop counts from each of the given modules; passages are walkable both ways"""
+    links: Dict[str, set] = {}
+    pending, seen = list(set(modules)), set(modules)
+    while pending:
+        module = pending.pop()
+        for neighbour in placement.neighbouring_modules(module, modules, adjacency):
+            links.setdefault(module, set()).add(neighbour)
+            links.setdefault(neighbour, set()).add(module)
+            if neighbour not in seen:
+                seen.add(neighbour)
+                pending.append(neighbour)
+
+    hops = {}
+    for source in set(modules):
+        distance = {source: 0}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            for neighbour in links.get(current, ()):
+                if neighbour not in distance:
+                    distance[neighbour] = distance[current] + 1
+                    queue.append(neighbour)
+        hops[source] = distance
+    return hops
+
+
+class RoutePlanner:
+    """Orders containers to visit so that total travel time is short"""
+
+    def __init__(self, stops: List[Tuple[str, models.Container]], adjacency: Dict[str, List[str]],
+                 start_module: Optional[str] = None):
+        self.stops = stops
+        self.start_module = start_module
+        modules = [container.module or "" for _, container in stops]
+        if start_module is not None:
+            modules.append(start_module)
+        self.hops = module_hops(modules, adjacency)
+        self.unreachable = len(self.hops)  # Modules with no known path are as far as the station is long
+
+    def travel(self, origin: Optional[Tuple[str, Optional[str]]], target: Tuple[str, Optional[str]]) -> float:
+        """Minutes from one (module, rack) to another; None is the starting point"""
+        if origin is None:
+            if self.start_module is None:
+                return 0.0
+            origin = (self.start_module, None)
+        if origin[0] != target[0]:
+            return self.hops[origin[0]].get(target[0], self.unreachable) * MODULE_HOP_MINUTES
+        if origin[1] != target[1] or origin[1] is None:
+            return RACK_MOVE_MINUTES
+        return 0.0
+
+    def place(self, index: int) -> Tuple[str, Optional[str]]:
+        container = self.stops[index][1]
+        return container.module or "", container.rack
+
+    def plan(self) -> List[int]:
+        """Stop indexes in visiting order"""
+        count = len(self.stops)
+        if count <= 1:
+            return list(range(count))
+        places = [self.place(index) for index in range(count)]
+        distance = [[self.travel(places[a], places[b]) for b in range(count)] for a in range(count)]
+        start = [self.travel(None, places[b]) for b in range(count)]
+        opening = [open_minutes(container) for _, container in self.stops]
+
+        # Nearest neighbour, preferring the more accessible container on ties
+        remaining = set(range(count))
+        current = min(remaining, key=lambda index: (start[index], opening[index], self.stops[index][0]))
+        order = [current]
+        remaining.discard(current)
+        while remaining:
+            row = distance[current]
+            current = min(remaining, key=lambda index: (row[index], opening[index], self.stops[index][0]))
+            order.append(current)
+            remaining.discard(current)
+
+        # 2-opt on the open path: reverse order[i..j] when that shortens it
+        def cost_before(position):
+            return start[order[position]] if position == 0 else distance[order[position - 1]][order[position]]
+
+        for _ in range(MAX_IMPROVEMENT_PASSES):
+            improved = False
+            for i in range(count - 1):
+                before_i = cost_before(i)
+                previous = order[i - 1] if i > 0 else None
+                for j in range(i + 1, count):
+                    first, last = order[i], order[j]
+                    after = distance[last][order[j + 1]] if j + 1 < count else 0.0
+                    reversed_before = start[last] if previous is None else distance[previous][last]
+                    reversed_after = distance[first][order[j + 1]] if j + 1 < count else 0.0
+                    if reversed_before + reversed_after < before_i + after - 1e-9:
+                        order[i:j + 1] = reversed(order[i:j + 1])
+                        before_i = cost_before(i)
+                        improved = True
+            if not improved:
+                break
+        return order
+
+
+def plan_retrieval(data: Dict, item_ids: List[str], adjacency: Dict[str, List[str]],
+                   start_module: Optional[str] = None) -> Dict:
+    """Group requested items by container and order the containers into a route"""
+    by_container: Dict[str, List[str]] = {}
+    not_found, unavailable = [], []
+    for item_id in dict.fromkeys(item_ids):
+        item = data['items'].get(item_id)
+        if item is None:
+            not_found.append(item_id)
+        elif item.status != models.ItemStatus.ACTIVE or item.location not in data['containers'] or \
+                item_id not in data['containers'][item.location].items:
+            unavailable.append(item_id)  # Not stored, or its container does not list it
+        else:
+            by_container.setdefault(item.location, []).append(item_id)
+
+    stops = [(container_id, data['containers'][container_id]) for container_id in by_container]
+    planner = RoutePlanner(stops, adjacency, start_module)
+    order = planner.plan()
+
+    route, total, previous = [], 0.0, None
+    for step, index in enumerate(order, 1):
+        container_id, container = stops[index]
+        location = planner.place(index)
+        travel = planner.travel(previous, location)
+        previous = location
+
+        # Take the outermost (most recently stored) items first
+        wanted = sorted(by_container[container_id], key=container.position, reverse=True)
+        handling = open_minutes(container) + max(dig_minutes(container, item_id) for item_id in wanted)
+        total += travel + handling
+        route.append({
+            "step": step,
+            "container_id": container_id,
+            "container_name": container.name,
+            "module": container.module,
+            "rack": container.rack,
+            "items": [{"item_id": item_id, "name": data['items'][item_id].name} for item_id in wanted],
+            "travel_minutes": round(travel, 2),
+            "retrieval_minutes": round(handling, 2)
+        })
+
+    # The same list fetched one item at a time, in the order given
+    unbatched, previous = 0.0, None
+    for item_id in dict.fromkeys(item_ids):
+        item = data['items'].get(item_id)
+        if item is None or item_id not in by_container.get(item.location, ()):
+            continue
+        container = data['containers'][item.location]
+        location = (container.module or "", container.rack)
+        unbatched += planner.travel(previous, location) + open_minutes(container) + dig_minutes(container, item_id)
+        previous = location
+
+    return {
+        "route": route,
+        "containers_count": len(route),
+        "items_count": sum(len(stop["items"]) for stop in route),
+        "total_estimated_minutes": round(total, 2),
+        "unbatched_estimated_minutes": round(unbatched, 2),
+        "not_found": not_found,
+        "unavailable": unavailable
+    }
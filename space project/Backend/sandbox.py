@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Iterator, Optional, Tuple
+
+import models
+import events
+import overlay
+import snapshot
+
+# What-if sandboxes
+#
+# A sandbox forks the state it was created from as copy-on-read overlays (see
+# overlay.py) over the loaded checkout. Snapshot checkouts are immutable views
+# of a mapped file, so forking costs the same whatever the size of the
+# inventory, and later commits to the station leave the sandbox's base alone.
+# API operations run against the sandbox just as they run in a batch; their
+# changes stay in the overlays and are never saved. Between operations the
+# overlays drop the rows that were only read, so each sandbox only holds what
+# it changed, and its diff and utilization report are worked out from those
+# changes rather than from a second copy of the station.
+#
+# Sandboxes are kept in a directory that every worker process reads, so any
+# worker can serve any sandbox:
+#
+#   <id>.snap   the base, a hard link to the snapshot file the sandbox was
+#               forked from (snapshot files are replaced, never rewritten), or
+#               the forked data encoded as a snapshot when there is no such file
+#   <id>.json   the overlay: the rows the sandbox changed, its top-level data,
+#               the log entries of its operations and its base totals; the
+#               file's modification time is when the sandbox was last used
+#   <id>.lock   held while a request works on the sandbox, so operations on one
+#               sandbox run one at a time across workers
+#
+# A sandbox is only discarded under its lock: expiry skips any sandbox whose
+# lock is taken, and checks again under the lock that it is still idle. The
+# lock file goes last, still locked; whoever was waiting on it then finds it
+# replaced and locks the file now at that path instead.
+#
+# Opening a sandbox maps its base and replays its changed rows onto the
+# overlays, so it costs as much as the sandbox changed, not the station.
+class Sandbox:
+    """A private, unsaved fork of the station state"""
+
+    def __init__(self, sandbox_id: str, name: str, base: Dict):
+        self.sandbox_id = sandbox_id
+        self.name = name
+        self.base = base
+        self.state = overlay.overlay(base)
+        self.entries: List[Dict] = []  # Log entries of the operations run so far
+        self.operations = 0
+        self.created = time.time()
+        self.last_used = self.created
+        self._base_totals: Optional[Dict] = None
+
+    def settle(self) -> List[Tuple[str, str, object, object]]:
+        """(section, key, base row or None, sandbox row or None) for every change so far
+
+        Call between operations: rows only read are dropped from the overlays,
+        and the base forgets the rows it decoded for them.
+        """
+        changes = [(name, key, old, new) for name in overlay.SECTION_NAMES
+                   for key, old, new in self.state[name].changes()]
+        for name in overlay.SECTION_NAMES:
+            if hasattr(self.base[name], 'release'):
+                self.base[name].release()
+        return changes
+
+    def base_totals(self) -> Dict:
+        # The base never changes, so its totals are worked out once
+        if self._base_totals is None:
+            self._base_totals = _totals(self.base)
+        return self._base_totals
+
+    def to_dict(self) -> Dict:
+        return _summary(self.sandbox_id, self.name, self.operations, self.created, self.last_used)
+
+
+def _summary(sandbox_id: str, name: str, operations: int, created: float, last_used: float) -> Dict:
+    return {
+        "sandbox_id": sandbox_id,
+        "name": name,
+        "operations": operations,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)),
+        "last_used": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used))
+    }
+
+
+def _totals(data: Dict) -> Dict:
+    totals = {}
+    for name in ('containers', 'waste_containers'):
+        used_volume = total_volume = current_weight = 0.0
+        for container in data[name].values():
+            used_volume += container.used_volume
+            total_volume += container.total_volume
+            current_weight += container.current_weight
+        totals[name] = {"used_volume": used_volume, "total_volume": total_volume, "current_weight": current_weight}
+    totals['active_items'] = snapshot.count(data['items'], (("status", "==", models.ItemStatus.ACTIVE),))
+    return totals
+
+
+def _fill(totals: Dict) -> Dict:
+    return {
+        "used_volume": round(totals["used_volume"], 4),
+        "total_volume": round(totals["total_volume"], 4),
+        "current_weight": round(totals["current_weight"], 4),
+        "utilization": round(totals["used_volume"] / totals["total_volume"] * 100, 2) if totals["total_volume"] else 0
+    }
+
+
+def report(sandbox: Sandbox) -> Dict:
+    """Everything the sandbox changed against its base, and utilization before and after"""
+    before = sandbox.base_totals()
+    changes = sandbox.settle()
+
+    diff = {name: {"created": [], "modified": [], "deleted": []} for name in overlay.SECTION_NAMES}
+    found = []
+    for name, key, old, new in changes:
+        kind = "created" if old is None else "deleted" if new is None else "modified"
+        diff[name][kind].append({"id": key, "before": old.to_dict() if old is not None else None,
+                                 "after": new.to_dict() if new is not None else None})
+        event_type, details = events.describe(name, key, old, new)
+        found.append({"type": event_type, "entity": name, "id": key, "data": details})
+
+    # Sandbox totals are the base totals moved by each changed row
+    after = {name: dict(value) if isinstance(value, dict) else value for name, value in before.items()}
+    containers = []
+    for name, key, old, new in changes:
+        if name == 'items':
+            was_active = old is not None and old.status == models.ItemStatus.ACTIVE
+            is_active = new is not None and new.status == models.ItemStatus.ACTIVE
+            after['active_items'] += is_active - was_active
+            continue
+        for row, sign in ((old, -1), (new, 1)):
+            if row is not None:
+                for field in ("used_volume", "total_volume", "current_weight"):
+                    after[name][field] += sign * getattr(row, field)
+        containers.append({
+            "section": name,
+            "container_id": key,
+            "base": _fill(_load(old)) if old is not None else None,
+            "sandbox": _fill(_load(new)) if new is not None else None
+        })
+
+    return {
+        **sandbox.to_dict(),
+        "events": found,
+        "diff": diff,
+        "utilization": {
+            name: {"base": _fill(before[name]), "sandbox": _fill(after[name])}
+            for name in ('containers', 'waste_containers')
+        },
+        "active_items": {"base": before['active_items'], "sandbox": after['active_items']},
+        "containers": containers
+    }
+
+
+def _load(container) -> Dict:
+    return {"used_volume": container.used_volume, "total_volume": container.total_volume,
+            "current_weight": container.current_weight}
+
+
+def _encode(sandbox: Sandbox) -> Dict:
+    """The overlay file of a sandbox (call after settle())"""
+    rows = {name: {} for name in overlay.SECTION_NAMES}
+    for name in overlay.SECTION_NAMES:
+        for key, _, new in sandbox.state[name].changes():
+            rows[name][key] = new.to_dict() if new is not None else None
+    base_top = {key: value for key, value in sandbox.base.items() if key not in overlay.SECTION_NAMES}
+    top = {key: value for key, value in sandbox.state.items()
+           if key not in overlay.SECTION_NAMES and
+           json.dumps(value, sort_keys=True) != json.dumps(base_top.get(key), sort_keys=True)}
+    return {
+        "name": sandbox.name,
+        "created": sandbox.created,
+        "operations": sandbox.operations,
+        "entries": sandbox.entries,
+        "rows": rows,
+        "top": top,
+        "base_totals": sandbox._base_totals
+    }
+
+
+def _decode(sandbox_id: str, record: Dict, base: Dict, last_used: float) -> Sandbox:
+    """A sandbox from its base and overlay file"""
+    found = Sandbox(sandbox_id, record["name"], base)
+    found.created, found.last_used = record["created"], last_used
+    found.operations, found.entries = record["operations"], record["entries"]
+    found._base_totals = record.get("base_totals")
+    for name, row_type in models.SECTION_TYPES:
+        section = found.state[name]
+        for key, row in record["rows"].get(name, {}).items():
+            if row is not None:
+                section[key] = row_type.from_dict(key, row)
+            elif key in section:
+                del section[key]
+    found.state.update(record["top"])
+    return found
+
+
+class SandboxRegistry:
+    """Sandboxes shared by every worker process through files, dropped once idle for too long"""
+
+    def __init__(self, directory: str, max_sandboxes: int, idle_seconds: float):
+        self.directory = directory
+        self.max_sandboxes = max_sandboxes
+        self.idle_seconds = idle_seconds
+        # This process's mappings of sandbox bases, by file identity: sandboxes forked from the
+        # same snapshot file link the same inode, so they share one mapping
+        self._snapshots: Dict[Tuple, snapshot.Snapshot] = {}
+        self._bases: Dict[str, Tuple] = {}  # sandbox ID -> identity of its base
+        self._lock = threading.Lock()
+
+    def _path(self, sandbox_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{sandbox_id}.{suffix}")
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [name[:-5] for name in names if name.endswith(".json")]
+
+    def _acquire(self, name: str, blocking: bool = True):
+        """The lock file opened and locked, retrying if it was removed meanwhile; None if it is taken and not blocking"""
+        path = os.path.join(self.directory, name)
+        while True:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+            try:
+                if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    @contextmanager
+    def _file_lock(self, name: str) -> Iterator[None]:
+        f = self._acquire(name)
+        try:
+            yield
+        finally:
+            f.close()  # Closing releases the lock
+
+    def _last_used(self, sandbox_id: str) -> Optional[float]:
+        try:
+            return os.stat(self._path(sandbox_id, "json")).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _discard(self, sandbox_id: str) -> None:
+        """Remove a sandbox's files (call with its lock held)"""
+        for suffix in ("json", "snap", "lock"):
+            try:
+                os.remove(self._path(sandbox_id, suffix))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._bases.pop(sandbox_id, None)
+
+    def _base(self, sandbox_id: str) -> Dict:
+        """A checkout of a sandbox's base"""
+        path = self._path(sandbox_id, "snap")
+        stat = os.stat(path)
+        identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            mapped = self._snapshots.get(identity)
+            if mapped is None:
+                mapped = self._snapshots[identity] = snapshot.open_snapshot(path)
+            self._bases[sandbox_id] = identity
+        return mapped.checkout()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.idle_seconds
+        for sandbox_id in self._ids():
+            last_used = self._last_used(sandbox_id)
+            if last_used is None or last_used >= cutoff:
+                continue
+            f = self._acquire(f"{sandbox_id}.lock", blocking=False)
+            if f is None:
+                continue  # A request is working on it
+            try:
+                # Used again since it was listed?
+                last_used = self._last_used(sandbox_id)
+                if last_used is not None and last_used < cutoff:
+                    self._discard(sandbox_id)
+            finally:
+                f.close()
+        # Let go of the bases of sandboxes other workers discarded
+        remaining = set(self._ids())
+        with self._lock:
+            for sandbox_id in [sandbox_id for sandbox_id in self._bases if sandbox_id not in remaining]:
+                del self._bases[sandbox_id]
+            in_use = set(self._bases.values())
+            for identity in [identity for identity in self._snapshots if identity not in in_use]:
+                del self._snapshots[identity]
+
+    def _write(self, sandbox: Sandbox) -> None:
+        path = self._path(sandbox.sandbox_id, "json")
+        temp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, 'w') as f:
+            json.dump(_encode(sandbox), f)
+        os.replace(temp_path, path)
+        sandbox.last_used = self._last_used(sandbox.sandbox_id) or time.time()
+
+    def create(self, base: Dict, name: Optional[str] = None, source: Optional[str] = None) -> Optional[Sandbox]:
+        """Fork a sandbox from loaded data, or from the snapshot file source; None when the limit is reached"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._file_lock("registry.lock"):
+            self._expire()
+            if len(self._ids()) >= self.max_sandboxes:
+                return None
+            sandbox_id = uuid.uuid4().hex[:12]
+            base_path = self._path(sandbox_id, "snap")
+            try:
+                os.link(source, base_path)  # The file as it is now, whatever replaces it later
+            except (TypeError, OSError):
+                with open(base_path, 'wb') as f:
+                    f.write(snapshot.encode(base))
+            created = Sandbox(sandbox_id, name or sandbox_id, self._base(sandbox_id))
+            self._write(created)
+        return created
+
+    @contextmanager
+    def open(self, sandbox_id: str) -> Iterator[Optional[Sandbox]]:
+        """A sandbox to work on, locked against every other request until the block ends; None if there is none"""
+        if sandbox_id not in self._ids():
+            yield None
+            return
+        self._expire()
+        with self._file_lock(f"{sandbox_id}.lock"):
+            try:
+                with open(self._path(sandbox_id, "json")) as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                self._discard(sandbox_id)  # Discarded meanwhile; drop the lock file just made
+                yield None
+                return
+            found = _decode(sandbox_id, record, self._base(sandbox_id), self._last_used(sandbox_id))
+            yield found
+            # Nothing discards the sandbox while its lock is held
+            found.settle()
+            self._write(found)
+
+    def remove(self, sandbox_id: str) -> bool:
+        if sandbox_id not in self._ids():
+            return False
+        with self._file_lock(f"{sandbox_id}.lock"):
+            found = self._last_used(sandbox_id) is not None
+            self._discard(sandbox_id)
+        return found
+
+    def all(self) -> List[Dict]:
+        """Summaries of every sandbox, oldest first"""
+        self._expire()
+        found = []
+        for sandbox_id in self._ids():
+            try:
+                with open(self._path(sandbox_id, "json")) as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                continue
+            found.append((record["created"], _summary(sandbox_id, record["name"], record["operations"],
+                                                      record["created"], self._last_used(sandbox_id) or record["created"])))
+        return [summary for _, summary in sorted(found, key=lambda entry: entry[0])]
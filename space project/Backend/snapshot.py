@@ -0,0 +1,1024 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import sys
+import fcntl
+import operator
+import threading
+from contextlib import contextmanager
+from array import array
+from collections.abc import MutableMapping, ItemsView, ValuesView
+from typing import Dict, List, Tuple, Any, Optional, Iterator, Iterable, Callable
+
+import models
+
+# Compact binary snapshot of the cargo data
+#
+# Layout:
+#   header   magic "CSNP", format version (u16), reserved (u16), CRC-32 of payload (u32),
+#            payload length (u64), all little-endian
+#   payload  u32 metadata length, metadata JSON, then 8-byte aligned fixed-width columns
+#            in the writer's byte order (recorded in the metadata)
+#
+# Every field a model class lists in COLUMNS (see models.py) is stored as a
+# column: strings as u32 indexes into an interned string table, numbers as
+# i32/f64, dates as day ordinals and timestamps as seconds since day 1 (the same
+# representation the models hold in memory). Anything outside the schema (extra
+# fields, values of an unexpected type) is kept losslessly in the metadata
+# "extras".
+#
+# Row ids and the string table are indexed by open-addressing hash tables
+# (CRC-32 keyed, linear probing) stored in the file as well, and deleted rows
+# are left as tombstones (id 0) until the file is compacted. Loading therefore
+# maps the file and decodes nothing up front: each request gets an overlay over
+# the shared, read-only columns, a row becomes a model object only when it is accessed,
+# and saving re-encodes just the rows that were touched.
+
+
+MAGIC = b"CSNP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIQ")
+META_LENGTH = struct.Struct("<I")
+
+# Sections and the model class of their rows; each class lists its stored fields in COLUMNS
+SECTIONS = tuple((name, row_type, row_type.COLUMNS) for name, row_type in models.SECTION_TYPES)
+
+TYPECODES = {"str": "I", "i32": "i", "f64": "d", "date": "i", "datetime": "q"}
+NO_DATE = 0  # Day ordinals start at 1
+NO_DATETIME = -1
+
+# Rewrite the whole file (dropping tombstones and unused strings) once this share of rows is dead
+COMPACTION_RATIO = 0.25
+COMPACTION_MIN_ROWS = 1000
+
+# Rows decoded per batch when a whole section is scanned
+SCAN_CHUNK_ROWS = 4096
+
+# Comparisons usable in select() conditions; None never satisfies an ordering
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+             ">": operator.gt, ">=": operator.ge}
+ORDERING = {"<", "<=", ">", ">="}
+
+assert array('I').itemsize == 4 and array('i').itemsize == 4 and array('q').itemsize == 8
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is corrupt or written by an unsupported version"""
+
+
+class SnapshotConflict(Exception):
+    """Raised when rows changed by a request were also changed by a concurrent save"""
+
+
+# Hash indexes: tables of u32 values where 0 marks an empty slot
+
+def _hash(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def _capacity(count: int) -> int:
+    capacity = 16
+    while capacity < 2 * count:
+        capacity *= 2
+    return capacity
+
+
+def _hash_insert(table: array, text: str, value: int) -> None:
+    mask = len(table) - 1
+    slot = _hash(text) & mask
+    while table[slot]:
+        slot = (slot + 1) & mask
+    table[slot] = value
+
+
+def _hash_lookup(table, text: str, resolve) -> int:
+    """Find the value whose resolved key equals text; 0 if absent"""
+    mask = len(table) - 1
+    slot = _hash(text) & mask
+    while True:
+        value = table[slot]
+        if value == 0 or resolve(value) == text:
+            return value
+        slot = (slot + 1) & mask
+
+
+def _hash_build(entries: Iterable[Tuple[str, int]], count: int) -> array:
+    table = array('I', [0]) * _capacity(count)
+    for text, value in entries:
+        _hash_insert(table, text, value)
+    return table
+
+
+def _hash_extend(base_table, count: int, new_entries: List[Tuple[str, int]], all_entries) -> array:
+    """Copy a stored table and add entries, rebuilding it once it is half full"""
+    if len(base_table) < _capacity(count):
+        return _hash_build(all_entries(), count)
+    table = array('I')
+    table.frombytes(_as_bytes(base_table))
+    for text, value in new_entries:
+        _hash_insert(table, text, value)
+    return table
+
+
+def _as_bytes(column) -> memoryview:
+    """Raw bytes of an array or typed memoryview"""
+    return memoryview(column).cast('B')
+
+
+# String table
+
+class StringTable:
+    """Interned strings read lazily from a UTF-8 blob; index 0 is None"""
+
+    def __init__(self, blob, offsets, table):
+        self.blob = blob
+        self.offsets = offsets  # End offset of each string; offsets[0] == 0
+        self.table = table
+        self.count = len(offsets)  # Including the None slot
+        self._decoded: List[Optional[str]] = [None] * self.count
+        self._all: Optional[List[Optional[str]]] = None
+
+    def get(self, idx: int) -> Optional[str]:
+        if idx == 0:
+            return None
+        text = self._decoded[idx]
+        if text is None:
+            text = self._decoded[idx] = bytes(self.blob[self.offsets[idx - 1]:self.offsets[idx]]).decode('utf-8')
+        return text
+
+    def find(self, text: str) -> int:
+        """Index of text in the table, or 0"""
+        return _hash_lookup(self.table, text, self.get)
+
+    def all(self) -> List[Optional[str]]:
+        """Every string, decoded in one pass (used when scanning whole sections)"""
+        if self._all is None:
+            blob = bytes(self.blob)
+            text = blob.decode('utf-8')
+            offsets = self.offsets.tolist()
+            if len(text) == len(blob):
+                # ASCII only, so byte offsets are character offsets
+                strings = [text[offsets[i]:offsets[i + 1]] for i in range(self.count - 1)]
+            else:
+                strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.count - 1)]
+            strings.insert(0, None)
+            self._all = self._decoded = strings
+        return self._all
+
+
+class _StringBuilder:
+    """Interns strings for a new snapshot, optionally extending an existing table"""
+
+    def __init__(self, base: Optional[StringTable] = None):
+        self.base = base
+        self.added: Dict[str, int] = {}
+        self.added_list: List[str] = []
+        self.first_new = base.count if base else 1
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        idx = self.added.get(value)
+        if idx is None:
+            idx = self.base.find(value) if self.base else 0
+            if not idx:
+                idx = self.first_new + len(self.added_list)
+                self.added_list.append(value)
+            self.added[value] = idx
+        return idx
+
+    def columns(self) -> Tuple[array, bytes, array]:
+        offsets = array('I')
+        if self.base:
+            offsets.frombytes(_as_bytes(self.base.offsets))
+            prefix = bytes(self.base.blob[:offsets[-1]])
+        else:
+            offsets.append(0)
+            prefix = b""
+        total = offsets[-1]
+        encoded = [value.encode('utf-8') for value in self.added_list]
+        for blob in encoded:
+            total += len(blob)
+            offsets.append(total)
+
+        new_entries = [(value, self.first_new + i) for i, value in enumerate(self.added_list)]
+        count = self.first_new + len(self.added_list)
+        if self.base:
+            def all_entries():
+                strings = self.base.all()
+                return [(strings[i], i) for i in range(1, self.base.count)] + new_entries
+            table = _hash_extend(self.base.table, count, new_entries, all_entries)
+        else:
+            table = _hash_build(new_entries, count)
+        return offsets, prefix + b"".join(encoded), table
+
+
+# Value encoding
+
+def _encode_value(kind: str, value: Any, strings: _StringBuilder) -> Tuple[bool, Any]:
+    """Encode one value into its column representation; (False, default) if it does not fit"""
+    try:
+        if kind == "str":
+            if value is None or isinstance(value, str):
+                return True, strings.add(value)
+            return False, 0
+        if kind == "i32":
+            if isinstance(value, int) and not isinstance(value, bool) and -2**31 <= value < 2**31:
+                return True, value
+            return False, 0
+        if kind == "f64":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return True, float(value)
+            return False, 0.0
+        if kind == "date":
+            if value is None:
+                return True, NO_DATE
+            if isinstance(value, int) and 0 < value < 2**31:
+                return True, value
+            return False, NO_DATE
+        if kind == "datetime":
+            if value is None:
+                return True, NO_DATETIME
+            if isinstance(value, int) and 0 <= value < 2**63:
+                return True, value
+            return False, NO_DATETIME
+    except (TypeError, ValueError):
+        pass
+    return False, 0
+
+
+def _encode_row(row: Any, fields, strings: _StringBuilder) -> Tuple[List, Dict]:
+    """Encode one model object into per-field column values plus its extras"""
+    values = []
+    extras = dict(row.extras) if row.extras else {}
+    for field, kind in fields:
+        value = getattr(row, field)
+        if kind == "strlist":
+            entries = list(value) if isinstance(value, (list, tuple, dict)) else value
+            if isinstance(entries, list) and all(isinstance(e, str) for e in entries):
+                values.append([strings.add(e) for e in entries])
+            else:
+                values.append([])
+                extras[field] = entries
+            continue
+        ok, encoded = _encode_value(kind, value, strings)
+        if not ok:
+            extras[field] = value
+        values.append(encoded)
+    return values, extras
+
+
+# Reading
+
+class BaseSection:
+    """Read-only columns for one section of a mapped snapshot"""
+
+    def __init__(self, name: str, row_type, fields, rows: int, live: int, columns: Dict, extras: Dict[int, Dict],
+                 strings: StringTable):
+        self.name = name
+        self.row_type = row_type
+        self.fields = fields
+        self.rows = rows  # Including tombstones
+        self.live = live
+        self.columns = columns  # Column name -> typed memoryview
+        self.ids = columns[f"{name}.id"]
+        self.table = columns[f"{name}.hash"]
+        self.extras = extras
+        self.strings = strings
+        # (field, kind, column, offsets) for the fields present in this file
+        self._plan = []
+        for field, kind in fields:
+            column = columns.get(f"{name}.{field}")
+            if column is not None:
+                self._plan.append((field, kind, column, columns.get(f"{name}.{field}.offsets")))
+        # Model constructors take the stored fields positionally, in COLUMNS order
+        self._positional = len(self._plan) == len(fields)
+
+    def find(self, key: str) -> Optional[int]:
+        """Row number of a live key, or None"""
+        ids = self.ids
+        get = self.strings.get
+        value = _hash_lookup(self.table, key, lambda value: get(ids[value - 1]))
+        return value - 1 if value else None
+
+    def keys(self) -> Iterator[str]:
+        """Live keys in row order"""
+        strings = self.strings.all()
+        return (strings[idx] for idx in self.ids if idx)
+
+    def materialize(self, row: int, key: str):
+        """Decode one row into a model object"""
+        return self.build(row, key, self.decode(row))
+
+    def decode(self, row: int) -> List:
+        """Stored values of one row, in plan order"""
+        get = self.strings.get
+        values = []
+        for field, kind, column, offsets in self._plan:
+            if kind == "strlist":
+                values.append([get(idx) for idx in column[offsets[row]:offsets[row + 1]]])
+                continue
+            value = column[row]
+            if kind == "str":
+                values.append(get(value))
+            elif kind == "date":
+                values.append(value if value != NO_DATE else None)
+            elif kind == "datetime":
+                values.append(value if value != NO_DATETIME else None)
+            else:
+                values.append(value)
+        return values
+
+    def same(self, row: int, record, values=None) -> bool:
+        """Whether a model object still holds exactly what is stored for a row"""
+        if not self._positional:
+            return False
+        if values is None:
+            values = self.decode(row)
+        for (field, kind, _, _), value in zip(self._plan, values):
+            current = getattr(record, field)
+            if kind == "strlist" and current is not None:
+                current = list(current)
+            if current != value:
+                return False
+        return (self.extras.get(row) or None) == (record.extras or None)
+
+    def build(self, row: int, key: str, values):
+        extras = self.extras.get(row)
+        if extras:
+            extras = json.loads(json.dumps(extras))
+        if self._positional:
+            return self.row_type(key, *values, extras)
+        fields = {field: value for (field, _, _, _), value in zip(self._plan, values)}
+        return self.row_type(key, extras=extras, **fields)
+
+    def scan(self) -> Iterator[Tuple[int, str, Tuple]]:
+        """(row, key, values) for live rows, decoding whole columns a chunk at a time"""
+        strings = self.strings.all()
+        for start in range(0, self.rows, SCAN_CHUNK_ROWS):
+            stop = min(start + SCAN_CHUNK_ROWS, self.rows)
+            decoded = []
+            for field, kind, column, offsets in self._plan:
+                if kind == "strlist":
+                    bounds = offsets[start:stop + 1].tolist()
+                    first = bounds[0]
+                    entries = [strings[idx] for idx in column[first:bounds[-1]].tolist()]
+                    decoded.append([entries[bounds[i] - first:bounds[i + 1] - first] for i in range(stop - start)])
+                    continue
+                values = column[start:stop].tolist()
+                if kind == "str":
+                    values = [strings[idx] for idx in values]
+                elif kind == "date":
+                    values = [value if value != NO_DATE else None for value in values]
+                elif kind == "datetime":
+                    values = [value if value != NO_DATETIME else None for value in values]
+                decoded.append(values)
+            ids = self.ids[start:stop].tolist()
+            for offset, values in enumerate(zip(*decoded)):
+                idx = ids[offset]
+                if idx:
+                    yield start + offset, strings[idx], values
+
+    def select(self, conditions) -> Optional[List[int]]:
+        """Live rows satisfying every (field, op, value) condition, tested a column at a time
+
+        None if a condition cannot be answered from the columns of this file.
+        """
+        plan = {field: (kind, column) for field, kind, column, _ in self._plan}
+        rows = None
+        for field, op, value in conditions:
+            kind, column = plan.get(field, (None, None))
+            if column is None or kind == "strlist":
+                return None
+            test = OPERATORS[op]
+            stored = column.tolist()
+            if kind == "str":
+                if op not in ("==", "!="):
+                    return None
+                target = self.strings.find(value) if value is not None else 0
+                if value is not None and target == 0:
+                    target = -1  # Not in the string table, so equal to no row
+            elif kind in ("date", "datetime"):
+                missing = NO_DATE if kind == "date" else NO_DATETIME
+                target = missing if value is None else value
+                if op in ORDERING:
+                    if value is None:
+                        return []
+                    passes = test
+                    test = lambda current, target: current != missing and passes(current, target)
+            else:
+                target = value
+            if rows is None:
+                rows = [row for row, current in enumerate(stored) if test(current, target)]
+            else:
+                rows = [row for row in rows if test(stored[row], target)]
+        ids = self.ids
+        if rows is None:
+            return [row for row in range(self.rows) if ids[row]]
+        return [row for row in rows if ids[row]]
+
+
+class Snapshot:
+    """A decoded-on-demand view of one snapshot file"""
+
+    def __init__(self, meta: Dict, sections: Dict[str, BaseSection], strings: StringTable, mapped=None):
+        self.meta = meta
+        self.sections = sections
+        self.strings = strings
+        self._mapped = mapped  # Keeps the memory map open while the columns are in use
+        self._top = json.dumps(meta["top"])
+
+    def checkout(self) -> Dict:
+        """A private, mutable view of the data; the snapshot itself is never modified"""
+        data = {name: Section(self, base) for name, base in self.sections.items()}
+        data.update(json.loads(self._top))
+        return data
+
+
+def decode_snapshot(buffer, mapped=None) -> Snapshot:
+    """Validate a snapshot and expose its columns without copying them"""
+    view = memoryview(buffer)
+    if len(view) < HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version, _, checksum, length = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SnapshotError("Not a cargo snapshot")
+    if version > FORMAT_VERSION:
+        raise SnapshotError(f"Snapshot format version {version} is newer than supported version {FORMAT_VERSION}")
+
+    payload = view[HEADER.size:HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        raise SnapshotError("Snapshot checksum mismatch")
+
+    (meta_length,) = META_LENGTH.unpack_from(payload)
+    meta = json.loads(bytes(payload[META_LENGTH.size:META_LENGTH.size + meta_length]))
+    base = META_LENGTH.size + meta_length
+    base += -base % 8
+    swap = meta["byteorder"] != sys.byteorder
+
+    columns = {}
+    for name, (offset, count, typecode) in meta["columns"].items():
+        start = base + offset
+        chunk = payload[start:start + count * array(typecode).itemsize]
+        if swap:
+            values = array(typecode)
+            values.frombytes(chunk)
+            values.byteswap()
+            chunk = memoryview(values.tobytes())
+        columns[name] = chunk.cast(typecode)
+
+    strings = StringTable(columns.pop("strings"), columns.pop("strings.offsets"), columns.pop("strings.hash"))
+
+    sections = {}
+    for name, row_type, fields in SECTIONS:
+        extras = {int(row): values for row, values in meta["extras"].get(name, {}).items()}
+        counts = meta["sections"][name]
+        sections[name] = BaseSection(name, row_type, fields, counts["rows"], counts["live"], columns, extras, strings)
+    return Snapshot(meta, sections, strings, mapped)
+
+
+def open_snapshot(path: str) -> Snapshot:
+    """Memory-map a snapshot file"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise SnapshotError("Snapshot is truncated")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return decode_snapshot(mapped, mapped)
+
+
+# Copy-on-write view
+
+class Section(MutableMapping):
+    """Mutable mapping over a snapshot section that records changes in an overlay
+
+    Rows are decoded when first read and kept, so callers can mutate the
+    objects they get back in place; only those rows are re-encoded on save.
+    """
+
+    def __init__(self, snapshot: Snapshot, base: BaseSection):
+        self.snapshot = snapshot
+        self.base = base
+        self.touched: Dict[str, Any] = {}  # Base rows that were read (and possibly changed)
+        self.added: Dict[str, Any] = {}  # Keys that are not live in the base
+        self.deleted: set = set()  # Base keys that were removed
+
+    def __getitem__(self, key):
+        row = self.touched.get(key)
+        if row is not None:
+            return row
+        row = self.added.get(key)
+        if row is not None:
+            return row
+        if key in self.deleted:
+            raise KeyError(key)
+        idx = self.base.find(key)
+        if idx is None:
+            raise KeyError(key)
+        row = self.touched[key] = self.base.materialize(idx, key)
+        return row
+
+    def __setitem__(self, key, value):
+        if key in self.touched or (key not in self.deleted and self.base.find(key) is not None):
+            self.touched[key] = value
+        else:
+            self.added[key] = value
+
+    def __delitem__(self, key):
+        if key in self.added:
+            del self.added[key]
+        elif key not in self.deleted and self.base.find(key) is not None:
+            self.deleted.add(key)
+            self.touched.pop(key, None)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.touched or key in self.added:
+            return True
+        return key not in self.deleted and self.base.find(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        deleted = self.deleted
+        for key in self.base.keys():
+            if key not in deleted:
+                yield key
+        yield from list(self.added)
+
+    def __len__(self):
+        return self.base.live - len(self.deleted) + len(self.added)
+
+    def items(self):
+        return _SectionItems(self)
+
+    def values(self):
+        return _SectionValues(self)
+
+    def changed(self) -> Dict[str, Any]:
+        """Base rows that were read and then modified"""
+        base = self.base
+        touched = self.touched
+        if len(touched) * 4 < base.live:
+            return {key: record for key, record in touched.items() if not base.same(base.find(key), record)}
+
+        # Most of the section was read (e.g. by a full scan), so compare column by column
+        changed = {}
+        for row, key, values in base.scan():
+            record = touched.get(key)
+            if record is not None and not base.same(row, record, values):
+                changed[key] = record
+        return changed
+
+    def release(self) -> None:
+        """Forget every decoded row; only for checkouts that are read and never written"""
+        self.touched = {}
+
+    def changes(self) -> List[Tuple[str, Any, Any]]:
+        """(key, stored row or None, current row or None) for every changed, added or deleted row
+
+        Rows that were read but not changed are dropped from touched, so later
+        calls to changed() only compare what really changed.
+        """
+        base = self.base
+        self.touched = self.changed()
+        changes = [(key, base.materialize(base.find(key), key), record) for key, record in self.touched.items()]
+        changes.extend((key, None, record) for key, record in self.added.items())
+        changes.extend((key, base.materialize(base.find(key), key), None) for key in self.deleted)
+        return changes
+
+    def rebase(self, snapshot: Snapshot) -> "Section":
+        """Replay this overlay's changes on a newer snapshot of the same section
+
+        Raises SnapshotConflict if any changed, added or deleted key was also
+        changed between the two snapshots.
+        """
+        old_base = self.base
+        new_base = snapshot.sections[old_base.name]
+        rebased = Section(snapshot, new_base)
+        for key, record in self.changed().items():
+            if not _same_rows(old_base, new_base, key):
+                raise SnapshotConflict(f"{old_base.name} {key} was changed concurrently")
+            rebased[key] = record
+        for key in self.deleted:
+            if not _same_rows(old_base, new_base, key):
+                raise SnapshotConflict(f"{old_base.name} {key} was changed concurrently")
+            del rebased[key]
+        for key, record in self.added.items():
+            if new_base.find(key) is not None:
+                raise SnapshotConflict(f"{old_base.name} {key} was added concurrently")
+            rebased.added[key] = record
+        return rebased
+
+    def select(self, conditions) -> Dict[str, Any]:
+        """Rows satisfying every (field, op, value) condition, by key
+
+        Untouched rows are tested on the stored columns and only the matches
+        are decoded; rows this checkout read, changed or added are tested as
+        objects.
+        """
+        rows = self.base.select(conditions)
+        if rows is None:
+            return {key: record for key, record in self.iter_rows() if matches(record, conditions)}
+        base = self.base
+        get = base.strings.get
+        ids = base.ids
+        touched = self.touched
+        deleted = self.deleted
+        selected = {}
+        for row in rows:
+            key = get(ids[row])
+            if key not in touched and key not in deleted:
+                selected[key] = touched[key] = base.materialize(row, key)
+        for key, record in list(touched.items()) + list(self.added.items()):
+            if key not in selected and matches(record, conditions):
+                selected[key] = record
+        return selected
+
+    def count(self, conditions) -> int:
+        """How many rows satisfy every condition, decoding only rows this checkout already holds"""
+        rows = self.base.select(conditions)
+        if rows is None:
+            return len(self.select(conditions))
+        get = self.base.strings.get
+        ids = self.base.ids
+        touched = self.touched
+        deleted = self.deleted
+        total = sum(1 for row in rows if get(ids[row]) not in touched and get(ids[row]) not in deleted)
+        for record in list(touched.values()) + list(self.added.values()):
+            if matches(record, conditions):
+                total += 1
+        return total
+
+    def iter_rows(self) -> Iterator[Tuple[str, Any]]:
+        """(key, row) pairs in order, decoding rows straight from the columns"""
+        base = self.base
+        touched = self.touched
+        deleted = self.deleted
+        for row, key, values in base.scan():
+            if key in deleted:
+                continue
+            record = touched.get(key)
+            if record is None:
+                record = touched[key] = base.build(row, key, values)
+            yield key, record
+        yield from list(self.added.items())
+
+
+def matches(record, conditions) -> bool:
+    """Whether a model object satisfies every (field, op, value) condition"""
+    for field, op, value in conditions:
+        current = getattr(record, field)
+        if op in ORDERING and (current is None or value is None):
+            return False
+        if not OPERATORS[op](current, value):
+            return False
+    return True
+
+
+def select(section, conditions) -> Dict[str, Any]:
+    """A section's rows satisfying every condition, by key, tested on the columns where possible"""
+    if hasattr(section, 'select'):
+        return section.select(conditions)
+    return {key: record for key, record in section.items() if matches(record, conditions)}
+
+
+def count(section, conditions) -> int:
+    """How many of a section's rows satisfy every condition"""
+    if hasattr(section, 'count'):
+        return section.count(conditions)
+    return sum(1 for record in section.values() if matches(record, conditions))
+
+
+def _same_rows(old_base: BaseSection, new_base: BaseSection, key: str) -> bool:
+    old_row = old_base.find(key)
+    new_row = new_base.find(key)
+    if old_row is None or new_row is None:
+        return old_row is None and new_row is None
+    return (old_base.decode(old_row) == new_base.decode(new_row) and
+            (old_base.extras.get(old_row) or None) == (new_base.extras.get(new_row) or None))
+
+
+class _SectionItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_rows()
+
+
+class _SectionValues(ValuesView):
+    def __iter__(self):
+        return (record for _, record in self._mapping.iter_rows())
+
+
+# Writing
+
+def _empty_columns(fields) -> List:
+    columns = []
+    for _, kind in fields:
+        columns.append((array('I'), array('I', [0])) if kind == "strlist" else array(TYPECODES[kind]))
+    return columns
+
+
+def _append_row(columns: List, fields, values: List) -> None:
+    for (_, kind), column, value in zip(fields, columns, values):
+        if kind == "strlist":
+            entries, offsets = column
+            entries.extend(value)
+            offsets.append(len(entries))
+        else:
+            column.append(value)
+
+
+def _section_columns(name: str, fields, ids: array, table: array, columns: List) -> List[Tuple[str, array]]:
+    """Name per-field columns for the file layout"""
+    named = [(f"{name}.id", ids), (f"{name}.hash", table)]
+    for (field, kind), column in zip(fields, columns):
+        if kind == "strlist":
+            entries, offsets = column
+            named.append((f"{name}.{field}.offsets", offsets))
+            named.append((f"{name}.{field}", entries))
+        else:
+            named.append((f"{name}.{field}", column))
+    return named
+
+
+def _copy(column) -> array:
+    values = array(column.format)
+    values.frombytes(_as_bytes(column))
+    return values
+
+
+def _encode_full(data: Dict, strings: _StringBuilder) -> Tuple[List, Dict, Dict]:
+    """Encode every row from scratch"""
+    named = []
+    counts = {}
+    all_extras = {}
+    for name, _, fields in SECTIONS:
+        rows = data.get(name, {})
+        ids = array('I')
+        columns = _empty_columns(fields)
+        extras = {}
+        keys = []
+        for row, (key, record) in enumerate(rows.items()):
+            keys.append((key, row + 1))
+            ids.append(strings.add(key))
+            values, row_extras = _encode_row(record, fields, strings)
+            _append_row(columns, fields, values)
+            if row_extras:
+                extras[str(row)] = row_extras
+        table = _hash_build(keys, len(keys))
+        named.extend(_section_columns(name, fields, ids, table, columns))
+        counts[name] = {"rows": len(ids), "live": len(ids)}
+        if extras:
+            all_extras[name] = extras
+    return named, counts, all_extras
+
+
+def _encode_incremental(data: Dict, strings: _StringBuilder) -> Tuple[List, Dict, Dict]:
+    """Encode by copying untouched rows straight from the mapped columns"""
+    named = []
+    counts = {}
+    all_extras = {}
+    for name, _, fields in SECTIONS:
+        section: Section = data[name]
+        base = section.base
+
+        # Deleted rows become tombstones so no other row moves
+        ids = _copy(base.ids)
+        deleted_rows = set()
+        for key in section.deleted:
+            row = base.find(key)
+            ids[row] = 0
+            deleted_rows.add(row)
+
+        columns = []
+        for field, kind in fields:
+            column = base.columns.get(f"{name}.{field}")
+            if kind == "strlist":
+                columns.append(None)  # Rebuilt below
+            elif column is not None:
+                columns.append(_copy(column))
+            else:
+                # A field this file predates
+                columns.append(array(TYPECODES[kind], [NO_DATETIME if kind == "datetime" else 0]) * base.rows)
+
+        extras = {row: values for row, values in base.extras.items() if row not in deleted_rows}
+
+        # Re-encode the rows that were changed through the overlay
+        touched_values = {}
+        for key, record in section.changed().items():
+            row = base.find(key)
+            values, row_extras = _encode_row(record, fields, strings)
+            touched_values[row] = values
+            extras.pop(row, None)
+            if row_extras:
+                extras[row] = row_extras
+            for (_, kind), column, value in zip(fields, columns, values):
+                if kind != "strlist":
+                    column[row] = value
+
+        # Variable-length columns: copy base slices for untouched rows
+        for position, (field, kind) in enumerate(fields):
+            if kind != "strlist":
+                continue
+            base_entries = base.columns.get(f"{name}.{field}")
+            base_offsets = base.columns.get(f"{name}.{field}.offsets")
+            entries = array('I')
+            offsets = array('I', [0])
+            for row in range(base.rows):
+                if row in touched_values:
+                    entries.extend(touched_values[row][position])
+                elif base_offsets is not None and row not in deleted_rows:
+                    entries.frombytes(_as_bytes(base_entries[base_offsets[row]:base_offsets[row + 1]]))
+                offsets.append(len(entries))
+            columns[position] = (entries, offsets)
+
+        # Append new rows
+        new_keys = []
+        for key, record in section.added.items():
+            row = len(ids)
+            new_keys.append((key, row + 1))
+            ids.append(strings.add(key))
+            values, row_extras = _encode_row(record, fields, strings)
+            _append_row(columns, fields, values)
+            if row_extras:
+                extras[row] = row_extras
+
+        table = _hash_extend(base.table, len(ids), new_keys, lambda: _live_keys(base, ids, strings, new_keys))
+
+        named.extend(_section_columns(name, fields, ids, table, columns))
+        counts[name] = {"rows": len(ids), "live": len(section)}
+        if extras:
+            all_extras[name] = {str(row): values for row, values in extras.items()}
+    return named, counts, all_extras
+
+
+def _live_keys(base: BaseSection, ids: array, strings: _StringBuilder, new_keys: List) -> List[Tuple[str, int]]:
+    """(key, row + 1) for every live base row, plus the new rows"""
+    table = base.strings.all()
+    return [(table[idx], row + 1) for row, idx in enumerate(ids[:base.rows]) if idx] + new_keys
+
+
+def encode(data: Dict, compact: bool = False) -> bytes:
+    """Serialize cargo data into snapshot bytes
+
+    When data is a checkout of a snapshot, only the touched rows are encoded
+    and everything else is copied from the mapped columns. Once tombstones
+    make up enough of the file it is rebuilt from scratch instead.
+    """
+    snapshot = _checkout_source(data)
+    dead_rows = 0
+    if snapshot is not None and not compact:
+        dead_rows = snapshot.meta.get("dead_rows", 0) + sum(len(data[name].deleted) for name, _, _ in SECTIONS)
+        live_rows = sum(len(data[name]) for name, _, _ in SECTIONS)
+        compact = dead_rows > max(COMPACTION_MIN_ROWS, COMPACTION_RATIO * live_rows)
+
+    if snapshot is not None and not compact:
+        strings = _StringBuilder(snapshot.strings)
+        named, counts, extras = _encode_incremental(data, strings)
+    else:
+        strings = _StringBuilder()
+        named, counts, extras = _encode_full(data, strings)
+        dead_rows = 0
+
+    meta = {
+        "byteorder": sys.byteorder,
+        "sections": counts,
+        "extras": extras,
+        "top": {key: value for key, value in data.items() if key not in counts},
+        "dead_rows": dead_rows
+    }
+
+    string_offsets, string_blob, string_table = strings.columns()
+    named.append(("strings.offsets", string_offsets))
+    named.append(("strings.hash", string_table))
+    named.append(("strings", array('B', string_blob)))
+
+    # Lay out columns after the metadata, each aligned to 8 bytes
+    layout = {}
+    position = 0
+    for name, column in named:
+        size = len(column) * column.itemsize
+        layout[name] = [position, len(column), column.typecode]
+        position += size + (-size % 8)
+    meta["columns"] = layout
+
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    head = META_LENGTH.pack(len(meta_bytes)) + meta_bytes
+    head += b"\0" * (-len(head) % 8)
+
+    parts = [head]
+    for name, column in named:
+        blob = column.tobytes()
+        parts.append(blob + b"\0" * (-len(blob) % 8))
+    payload = b"".join(parts)
+
+    return HEADER.pack(MAGIC, FORMAT_VERSION, 0, zlib.crc32(payload), len(payload)) + payload
+
+
+def _checkout_source(data: Dict) -> Optional[Snapshot]:
+    """The snapshot every section of data was checked out from, if there is one"""
+    sections = [data.get(name) for name, _, _ in SECTIONS]
+    if not all(isinstance(section, Section) for section in sections):
+        return None
+    if len({id(section.snapshot) for section in sections}) != 1:
+        return None
+    return sections[0].snapshot
+
+
+def rebase(data: Dict, snapshot: Snapshot) -> Dict:
+    """Replay a checkout's changes on a newer snapshot (see Section.rebase)"""
+    source = _checkout_source(data)
+    if source is None or source is snapshot:
+        return data
+
+    rebased = dict(data)
+    for name, _, _ in SECTIONS:
+        rebased[name] = data[name].rebase(snapshot)
+
+    # Top-level keys are replaced as a whole, so both sides changing them is a conflict
+    top = {key: value for key, value in data.items() if key not in source.sections}
+    if json.dumps(top, sort_keys=True) != json.dumps(source.meta["top"], sort_keys=True):
+        if json.dumps(snapshot.meta["top"], sort_keys=True) != json.dumps(source.meta["top"], sort_keys=True):
+            raise SnapshotConflict("Top-level data was changed concurrently")
+    else:
+        for key in top:
+            del rebased[key]
+        rebased.update(json.loads(json.dumps(snapshot.meta["top"])))
+    return rebased
+
+
+def empty_snapshot() -> Snapshot:
+    """A snapshot with no rows, for stores that have not been written yet"""
+    return decode_snapshot(encode({name: {} for name, _, _ in SECTIONS}))
+
+
+def export_json(path: str, data: Dict) -> None:
+    """Write cargo data in the original JSON format"""
+    with open(path, 'w') as f:
+        json.dump(models.to_json(data), f, indent=2)
+
+
+class SnapshotStore:
+    """Loads and saves cargo data as a snapshot file, keeping one mapping per process
+
+    Saves replace the file atomically, so a mapping stays valid for as long as
+    a request holds it, and a changed inode tells every worker to remap.
+    Writers serialize on a lock file; a checkout whose file was replaced since
+    it was loaded is rebased onto the new file instead of overwriting it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._identity = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def current(self) -> Snapshot:
+        stat = os.stat(self.path)
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if identity != self._identity:
+                self._snapshot = open_snapshot(self.path)
+                self._identity = identity
+            return self._snapshot
+
+    def load(self) -> Dict:
+        return self.current().checkout()
+
+    @contextmanager
+    def lock(self):
+        """Exclusive write lock shared by every process using this file"""
+        with open(f"{self.path}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def prepare(self, data: Dict) -> str:
+        """Encode data into a durable temporary file next to the snapshot (call with the lock held)"""
+        if self.exists():
+            data = rebase(data, self.current())
+        encoded = encode(data)
+        temp_path = self.temp_path()
+        with open(temp_path, 'wb') as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        return temp_path
+
+    def temp_path(self) -> str:
+        return f"{self.path}.tmp.{os.getpid()}.{threading.get_ident()}"
+
+    def commit(self, temp_path: str) -> None:
+        os.replace(temp_path, self.path)
+
+    def save(self, data: Dict, on_commit: Optional[Callable[[], Any]] = None) -> None:
+        """Rebase, write and install data; on_commit runs once it is installed, still under the lock"""
+        with self.lock():
+            self.commit(self.prepare(data))
+            if on_commit:
+                on_commit()
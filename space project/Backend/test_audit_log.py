@@ -0,0 +1,103 @@
+import threading
+
+import audit_log
+
+# Tests for the audit log writer
+#
+#   python -m pytest -q test_audit_log.py
+#
+# Writers get a long flush interval and a large batch size, so the background
+# thread never commits on its own unless a test wants it to.
+
+
+def _writer(tmp_path, **limits) -> audit_log.AuditLogWriter:
+    durability = {"search_item": audit_log.BATCH, "place_item": audit_log.SYNC}
+    options = {"batch_size": 1000, "flush_interval": 60.0, **limits}
+    return audit_log.AuditLogWriter(str(tmp_path / "logs.json"), durability, {}, **options)
+
+
+def _entry(action: str, number: int) -> dict:
+    return {"action": action, "number": number}
+
+
+def test_sync_write_commits_queued_entries_first(tmp_path):
+    writer = _writer(tmp_path)
+    try:
+        for number in range(3):
+            writer.write(_entry("search_item", number))
+        writer.write(_entry("place_item", 3))
+        writer.write(_entry("search_item", 4))
+
+        on_disk = audit_log.read_entries(writer.path)
+        assert [entry["number"] for entry in on_disk] == [0, 1, 2, 3]
+        assert [entry["number"] for entry in writer.read_all()] == [0, 1, 2, 3, 4]
+    finally:
+        writer.close()
+
+
+def test_flush_commits_everything_while_the_thread_waits(tmp_path):
+    writer = _writer(tmp_path)
+    try:
+        writer.write(_entry("search_item", 0))
+        assert writer._pending.wait(1.0)  # The thread is now waiting out the flush interval
+        for number in range(1, 5):
+            writer.write(_entry("search_item", number))
+        writer.flush()
+        assert [entry["number"] for entry in audit_log.read_entries(writer.path)] == [0, 1, 2, 3, 4]
+    finally:
+        writer.close()
+    # Nothing is written twice by the thread's own commit at exit
+    assert len(audit_log.read_entries(writer.path)) == 5
+
+
+def test_close_commits_every_accepted_entry(tmp_path):
+    writer = _writer(tmp_path)
+    for number in range(50):
+        writer.write(_entry("search_item", number))
+    writer.close()
+    assert not writer._thread.is_alive()
+    assert [entry["number"] for entry in audit_log.read_entries(writer.path)] == list(range(50))
+
+
+def test_full_batch_wakes_the_writer(tmp_path):
+    writer = _writer(tmp_path, batch_size=5)
+    try:
+        for number in range(5):
+            writer.write(_entry("search_item", number))
+        for _ in range(100):
+            if len(audit_log.read_entries(writer.path)) == 5:
+                break
+            threading.Event().wait(0.02)
+        assert len(audit_log.read_entries(writer.path)) == 5
+    finally:
+        writer.close()
+
+
+def test_full_queue_drops_entries(tmp_path):
+    writer = _writer(tmp_path, max_queue=3)
+    writer._ensure_started()
+    with writer._write_lock:  # Hold off any commit while the queue fills
+        for number in range(5):
+            writer.write(_entry("search_item", number))
+        assert writer._queue.qsize() == 3
+    writer.close()
+    assert [entry["number"] for entry in audit_log.read_entries(writer.path)] == [0, 1, 2]
+
+
+def test_readers_never_see_a_half_written_file(tmp_path):
+    path = str(tmp_path / "logs.json")
+    done = threading.Event()
+
+    def append():
+        for number in range(200):
+            audit_log.append_entries(path, [_entry("place_item", number)])
+        done.set()
+
+    appender = threading.Thread(target=append)
+    appender.start()
+    counts = []
+    while not done.is_set():
+        counts.append(len(audit_log.read_entries(path)))
+    appender.join()
+    assert counts == sorted(counts)
+    assert len(audit_log.read_entries(path)) == 200
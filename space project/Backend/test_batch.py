@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+import audit_log
+import main
+
+# Tests for /api/batch
+#
+#   python -m pytest -q test_batch.py
+#
+# The app runs on the sample data in a temporary directory shared by the tests
+# of this module, so each test places items under its own IDs.
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("station"))
+    try:
+        main.initialize_sample_data()
+        yield main.app.test_client()
+        main.log_writer.flush()  # Queued entries go to this directory's log, not wherever the tests end up
+    finally:
+        os.chdir(previous)
+
+
+def _place(item_id: str) -> dict:
+    return {"method": "POST", "path": "/api/place_item",
+            "body": {"item_id": item_id, "name": "Spare Part", "volume": 0.1, "weight": 0.1}}
+
+
+MISSING = {"method": "POST", "path": "/api/retrieve_item/no_such_item"}
+
+
+def _stored() -> bytes:
+    with open(main.SNAPSHOT_FILE, 'rb') as f:
+        return f.read()
+
+
+def _batch_entries() -> list:
+    main.log_writer.flush()
+    return [entry for entry in audit_log.read_entries(main.LOG_FILE) if entry.get('action') == 'batch']
+
+
+def test_failed_atomic_batch_changes_nothing(client):
+    stored, version, logged = _stored(), main.event_journal.latest_version(), len(_batch_entries())
+
+    response = client.post('/api/batch', json={"operations": [_place("atomic_1"), MISSING, _place("atomic_2")]})
+    body = response.get_json()
+    assert response.status_code == 400
+    assert [result["status"] for result in body["results"]] == [201, 404, None]
+    assert body["results"][2]["skipped"]
+
+    assert _stored() == stored
+    assert main.event_journal.latest_version() == version
+    assert len(_batch_entries()) == logged
+    assert client.get('/api/item/atomic_1').status_code == 404
+
+
+def test_atomic_batch_commits_once(client):
+    version = main.event_journal.latest_version()
+    response = client.post('/api/batch', json={"operations": [_place("atomic_3"), _place("atomic_4")]})
+    assert response.status_code == 200
+    assert response.get_json()["succeeded"] == 2
+
+    found, _ = main.event_journal.read_since(version)
+    assert sorted(event["id"] for event in found if event["entity"] == "items") == ["atomic_3", "atomic_4"]
+    assert client.get('/api/item/atomic_4').status_code == 200
+
+
+def test_best_effort_keeps_only_what_succeeded(client):
+    version = main.event_journal.latest_version()
+    response = client.post('/api/batch', json={"mode": "best_effort",
+                                               "operations": [_place("effort_1"), MISSING, _place("effort_2")]})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert [result["status"] for result in body["results"]] == [201, 404, 201]
+    assert body["succeeded"] == 2
+
+    found, _ = main.event_journal.read_since(version)
+    assert sorted(event["id"] for event in found if event["entity"] == "items") == ["effort_1", "effort_2"]
+    assert client.get('/api/item/effort_2').status_code == 200
+
+    details = _batch_entries()[-1]["details"]
+    assert (details["mode"], details["succeeded"]) == ("best_effort", 2)
+    assert [action["action"] for action in details["actions"]] == ["place_item", "place_item"]
+
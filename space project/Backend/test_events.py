@@ -0,0 +1,97 @@
+import json
+
+import events
+import main
+
+# Tests for the change event journal
+#
+#   python -m pytest -q test_events.py
+#
+# Events carry a padding field of varying length, so journal lines differ in
+# size and binary search midpoints land anywhere inside them.
+
+
+def _event(number: int) -> dict:
+    return {"type": "item_updated", "entity": "items", "id": f"i{number % 7}", "data": {"pad": "x" * (number * 37 % 90)}}
+
+
+def _journal(tmp_path, max_bytes: int = 1 << 20) -> events.EventJournal:
+    return events.EventJournal(str(tmp_path / "events.jsonl"), max_bytes)
+
+
+def test_read_since_finds_every_version(tmp_path):
+    journal = _journal(tmp_path)
+    for number in range(1, 41):
+        journal.append([_event(number)])
+
+    for version in range(0, 41):
+        found, oldest = journal.read_since(version)
+        assert [event["version"] for event in found] == list(range(version + 1, 41))
+        assert oldest == 1
+    assert [event["version"] for event in journal.read_since(10, limit=3)[0]] == [11, 12, 13]
+
+
+def test_partial_last_line_is_not_read(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append([_event(number) for number in range(1, 21)])
+    with open(journal.path, 'a') as f:
+        f.write(json.dumps({"version": 21, **_event(21)})[:25])  # A line still being written
+
+    assert journal.latest_version() == 20
+    for version in (0, 7, 19, 20):
+        found, _ = journal.read_since(version)
+        assert [event["version"] for event in found] == list(range(version + 1, 21))
+    with open(journal.path, 'rb') as f:
+        for version in (5, 19):
+            f.seek(journal._offset_after(f, version))
+            assert json.loads(f.readline())["version"] == version + 1
+        # Past the last whole line, the search stops where the partial one starts
+        assert journal._offset_after(f, 20) == f.seek(0, 2) - 25
+
+
+def test_versions_carry_on_after_compaction(tmp_path):
+    journal = _journal(tmp_path, max_bytes=2000)
+    for number in range(1, 101):
+        assert journal.append([_event(number)]) == number
+
+    oldest = journal.oldest_version()
+    assert oldest > 1
+    assert journal.latest_version() == 100
+    found, reported = journal.read_since(oldest - 1)
+    assert reported == oldest
+    assert [event["version"] for event in found] == list(range(oldest, 101))
+    assert not journal.behind(oldest - 1)
+    assert journal.behind(oldest - 2)
+
+
+def test_compaction_keeps_the_newest_event(tmp_path):
+    journal = _journal(tmp_path, max_bytes=100)
+    journal.append([_event(1)])
+    journal.append([{**_event(2), "data": {"pad": "x" * 500}}])  # Past the limit on its own
+
+    assert journal.oldest_version() == journal.latest_version() == 2
+    assert journal.append([_event(3)]) == 3
+
+
+def test_changes_ask_to_resync_once_events_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # No stored data: every item the events name reads as deleted
+    journal = _journal(tmp_path, max_bytes=2000)
+    monkeypatch.setattr(main, "event_journal", journal)
+    for number in range(1, 101):
+        journal.append([_event(number)])
+    oldest = journal.oldest_version()
+    client = main.app.test_client()
+
+    response = client.get(f'/api/changes?since={oldest - 2}')
+    assert response.status_code == 410
+    body = response.get_json()
+    assert (body["status"], body["oldest_version"], body["latest_version"]) == ("resync_required", oldest, 100)
+
+    response = client.get(f'/api/changes?since={oldest - 1}')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["version"] == min(100, oldest - 1 + main.CHANGES_PAGE_SIZE)
+    assert sorted(body["items"]["deleted"]) == sorted({f"i{number % 7}" for number in range(oldest, body["version"] + 1)})
+
+    response = client.get('/api/changes?since=100')
+    assert (response.status_code, response.get_json()["version"]) == (200, 100)
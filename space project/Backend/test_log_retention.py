@@ -0,0 +1,70 @@
+import json
+from datetime import date
+
+import pytest
+
+import audit_log
+import log_retention
+
+# Tests for log compaction
+#
+#   python -m pytest -q test_log_retention.py
+
+
+TODAY = date(2026, 10, 19)
+
+
+def _entries() -> list:
+    return [
+        {"timestamp": "2026-10-10 08:00:00", "action": "search_item", "details": {"results": ["i1"]}},
+        {"timestamp": "2026-10-10 08:01:00", "action": "retrieve_item", "details": {"item_id": "i1", "category": "food"}},
+        {"timestamp": "2026-10-11 09:00:00", "action": "place_item", "details": {"item_id": "i2"}},
+        {"timestamp": "2026-10-11 09:00:00", "action": "place_item", "details": {"item_id": "i2"}},
+        {"timestamp": "2026-10-19 10:00:00", "action": "place_item", "details": {"item_id": "i3"}},
+    ]
+
+
+def _archive(tmp_path) -> log_retention.LogArchive:
+    path = tmp_path / "logs.json"
+    path.write_text(json.dumps(_entries()))
+    return log_retention.LogArchive(str(path), 2, {"search_item": 30})
+
+
+def test_compact_seals_old_days(tmp_path):
+    archive = _archive(tmp_path)
+    result = archive.compact(TODAY)
+
+    assert result == {"entries_sealed": 4, "days_sealed": ["2026-10-10", "2026-10-11"], "entries_expired": 0}
+    assert [entry["timestamp"][:10] for entry in audit_log.read_entries(archive.path)] == ["2026-10-19"]
+    assert archive.read() == _entries()[:4]
+    totals = log_retention.combine(archive.rollups())
+    assert totals["place_item"]["count"] == 2
+    assert totals["retrieve_item"]["timed_retrievals"] == 1
+
+
+def test_failed_compaction_leaves_the_log_and_reruns_cleanly(tmp_path, monkeypatch):
+    archive = _archive(tmp_path)
+    write_json = archive._write_json
+
+    def fail_on_rollups(path, value, compress=False):
+        if path == archive.rollup_path:
+            raise OSError("disk full")
+        write_json(path, value, compress)
+
+    # The segments are written, then the compaction stops before the rollups
+    monkeypatch.setattr(archive, "_write_json", fail_on_rollups)
+    with pytest.raises(OSError):
+        archive.compact(TODAY)
+    assert audit_log.read_entries(archive.path) == _entries()
+    assert archive.read() == _entries()[:4]
+
+    monkeypatch.setattr(archive, "_write_json", write_json)
+    archive.compact(TODAY)
+    assert archive.read() == _entries()[:4]
+    assert log_retention.combine(archive.rollups())["place_item"]["count"] == 2
+    assert len(audit_log.read_entries(archive.path)) == 1
+
+    # Sealing the same entries again changes nothing
+    archive._seal(_entries()[:4])
+    assert archive.read() == _entries()[:4]
+    assert log_retention.combine(archive.rollups())["place_item"]["count"] == 2
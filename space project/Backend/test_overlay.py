@@ -0,0 +1,102 @@
+import pytest
+
+import models
+import overlay
+import snapshot
+
+# Tests for copy-on-read overlays
+#
+#   python -m pytest -q test_overlay.py
+#
+# Each test runs over a plain loaded dict and over a snapshot checkout, the two
+# kinds of section an overlay sits on.
+
+
+def _data() -> dict:
+    return models.from_json({
+        "items": {
+            "i1": {"name": "Food Pack", "location": "c1", "priority": 80, "volume": 0.5, "weight": 1.0},
+            "i2": {"name": "Wrench", "location": "c1", "priority": 20, "volume": 0.25, "weight": 0.5}
+        },
+        "containers": {
+            "c1": {"name": "Crew Quarters A", "total_volume": 10.0, "used_volume": 0.75, "max_weight": 50.0,
+                   "current_weight": 1.5, "items": ["i1", "i2"]}
+        },
+        "waste_containers": {},
+        "reservations": {}
+    })
+
+
+@pytest.fixture(params=["dict", "snapshot"])
+def data(request) -> dict:
+    if request.param == "dict":
+        return _data()
+    return snapshot.decode_snapshot(snapshot.encode(_data())).checkout()
+
+
+def test_changes_stay_private_until_merged(data):
+    layered = overlay.overlay(data)
+    layered['items']['i1'].priority = 10
+    layered['items']['i3'] = models.Item("i3", name="Filter", location="c1", volume=1.0, weight=2.0)
+    del layered['items']['i2']
+
+    assert data['items']['i1'].priority == 80
+    assert sorted(data['items']) == ["i1", "i2"]
+    assert sorted(layered['items']) == ["i1", "i3"]
+    assert len(layered['items']) == 2
+
+    overlay.merge(data, layered)
+    assert data['items']['i1'].priority == 10
+    assert sorted(data['items']) == ["i1", "i3"]
+
+
+def test_rows_only_read_are_not_changes(data):
+    layered = overlay.overlay(data)
+    assert layered['items']['i1'].name == "Food Pack"
+    assert [key for key, _ in layered['items'].items()] == ["i1", "i2"]
+    assert layered['items'].changes() == []
+    assert layered['items'].rows == {}
+
+
+def test_delete_and_re_add_round_trips(data):
+    layered = overlay.overlay(data)
+    row = layered['items']['i2']
+    del layered['items']['i2']
+    assert 'i2' not in layered['items']
+    layered['items']['i2'] = row
+    assert 'i2' in layered['items']
+    assert layered['items'].changes() == []
+
+    # Re-added changed, it is a change to the base row, not a new row
+    del layered['items']['i2']
+    layered['items']['i2'] = models.Item("i2", name="Wrench", location="c1", priority=30, volume=0.25, weight=0.5)
+    [(key, old, new)] = layered['items'].changes()
+    assert (key, old.priority, new.priority) == ("i2", 20, 30)
+
+    overlay.merge(data, layered)
+    assert sorted(data['items']) == ["i1", "i2"]
+    assert data['items']['i2'].priority == 30
+
+
+def test_added_then_deleted_leaves_nothing(data):
+    layered = overlay.overlay(data)
+    layered['items']['i3'] = models.Item("i3", name="Filter", location="c1", volume=1.0, weight=2.0)
+    del layered['items']['i3']
+    assert 'i3' not in layered['items']
+    assert layered['items'].changes() == []
+
+    overlay.merge(data, layered)
+    assert sorted(data['items']) == ["i1", "i2"]
+
+
+def test_stacked_overlays_merge_into_each_other(data):
+    outer = overlay.overlay(data)
+    inner = overlay.overlay(outer)
+    del inner['items']['i1']
+    inner['containers']['c1'].used_volume = 0.25
+
+    overlay.merge(outer, inner)
+    assert 'i1' not in outer['items'] and 'i1' in data['items']
+    overlay.merge(data, outer)
+    assert sorted(data['items']) == ["i2"]
+    assert data['containers']['c1'].used_volume == 0.25
@@ -0,0 +1,42 @@
+import models
+import reservations
+
+# Tests for capacity reservations
+#
+#   python -m pytest -q test_reservations.py
+#
+# models.now is patched, so reservations expire when a test says so.
+
+START = models.parse_datetime("2026-10-19 12:00:00")
+HOUR = 3600
+
+
+def _data() -> dict:
+    return models.from_json({
+        "items": {},
+        "containers": {"c1": {"name": "Airlock", "total_volume": 10.0, "max_weight": 100.0}},
+        "waste_containers": {},
+        "reservations": {}
+    })
+
+
+def test_expired_hold_releases_capacity_next_to_a_live_one(monkeypatch):
+    monkeypatch.setattr(models, "now", lambda: START)
+    data = _data()
+    assert reservations.create(data, "soon", None, START + HOUR, {"c1": (6.0, 1.0)}, None) is None
+    assert reservations.create(data, "later", None, START + 5 * HOUR, {"c1": (2.0, 1.0)}, None) is None
+    container = data['containers']['c1']
+    assert container.held() == (8.0, 2.0)
+    assert container.reserved_until == START + HOUR
+    assert not container.fits(4.0, 1.0)
+
+    monkeypatch.setattr(models, "now", lambda: START + 2 * HOUR)
+    assert reservations.expire(data) == ["soon"]
+    assert container.held() == (2.0, 1.0)
+    assert container.reserved_until == START + 5 * HOUR
+    assert container.fits(4.0, 1.0)
+
+    monkeypatch.setattr(models, "now", lambda: START + 6 * HOUR)
+    assert reservations.expire(data) == ["later"]
+    assert container.held() == (0.0, 0.0)
+    assert container.reserved_until is None
@@ -0,0 +1,61 @@
+import os
+import time
+
+import models
+import sandbox
+
+# Tests for sandbox expiry
+#
+#   python -m pytest -q test_sandbox.py
+#
+# Two registries on one directory stand in for two worker processes.
+
+
+def _base() -> dict:
+    return models.from_json({
+        "items": {"i1": {"name": "Food Pack", "location": "c1", "volume": 1.0, "weight": 1.0}},
+        "containers": {"c1": {"name": "Crew Quarters A", "total_volume": 10.0, "used_volume": 1.0,
+                              "max_weight": 50.0, "current_weight": 1.0, "items": ["i1"]}},
+        "waste_containers": {},
+        "reservations": {}
+    })
+
+
+def _make_idle(registry: sandbox.SandboxRegistry, sandbox_id: str) -> None:
+    past = time.time() - 120
+    os.utime(registry._path(sandbox_id, "json"), (past, past))
+
+
+def test_expiry_skips_a_sandbox_in_use(tmp_path):
+    directory = str(tmp_path / "sandboxes")
+    worker = sandbox.SandboxRegistry(directory, 10, 60)
+    other = sandbox.SandboxRegistry(directory, 10, 60)
+    sandbox_id = worker.create(_base()).sandbox_id
+
+    with worker.open(sandbox_id) as found:
+        _make_idle(worker, sandbox_id)  # A request that has been working on it for a while
+        other._expire()
+        assert os.path.exists(worker._path(sandbox_id, "json"))
+        found.state['items']['i1'].priority = 90
+        found.operations += 1
+
+    with other.open(sandbox_id) as found:
+        assert found.operations == 1
+        assert found.state['items']['i1'].priority == 90
+
+
+def test_expiry_discards_idle_sandboxes(tmp_path):
+    directory = str(tmp_path / "sandboxes")
+    worker = sandbox.SandboxRegistry(directory, 10, 60)
+    other = sandbox.SandboxRegistry(directory, 10, 60)
+    idle_id = worker.create(_base()).sandbox_id
+    kept_id = worker.create(_base()).sandbox_id
+    with worker.open(idle_id):
+        pass
+    _make_idle(worker, idle_id)
+
+    other._expire()
+    assert sorted(os.listdir(directory)) == sorted(["registry.lock", f"{kept_id}.json", f"{kept_id}.snap"])
+    with worker.open(idle_id) as found:
+        assert found is None
+    assert not os.path.exists(worker._path(idle_id, "lock"))
@@ -0,0 +1,141 @@
+import zlib
+
+import pytest
+
+import models
+import snapshot
+
+# Tests for the binary snapshot format
+#
+#   python -m pytest -q test_snapshot.py
+#
+# Round trips go through encode() and decode_snapshot() (or a SnapshotStore on
+# a temporary file) and compare the JSON shapes, which cover every stored field
+# and the extras kept outside the schema.
+
+
+def _sample() -> dict:
+    return models.from_json({
+        "items": {
+            "i1": {"name": "Food Pack", "location": "c1", "priority": 80, "expiration_date": "2026-11-02",
+                   "volume": 0.5, "weight": 1.25, "category": "food", "status": "active",
+                   "arrival_date": "2026-10-01", "last_accessed": "2026-10-18 09:30:00"},
+            "i2": {"name": "Oxygen Cylinder", "location": "c2", "priority": 95, "expiration_date": None,
+                   "volume": 2.0, "weight": 15.0, "category": "life_support", "status": "active",
+                   "serial": "OX-7"},
+            "i3": {"name": "Old Filter", "location": "waste_w1", "priority": 10, "volume": 1.0, "weight": 3.0,
+                   "status": "waste"}
+        },
+        "containers": {
+            "c1": {"name": "Crew Quarters A", "total_volume": 10.0, "used_volume": 0.5, "max_weight": 50.0,
+                   "current_weight": 1.25, "items": ["i1"], "type": "storage", "accessibility_factor": 0.9,
+                   "module": "Crew Quarters", "rack": "R1"},
+            "c2": {"name": "Airlock", "total_volume": 20.0, "used_volume": 2.0, "max_weight": 100.0,
+                   "current_weight": 15.0, "items": ["i2"], "type": "storage", "accessibility_factor": 0.4,
+                   "module": "Airlock", "reserved_volume": 4.0, "reserved_weight": 8.0,
+                   "reserved_until": "2026-10-25 12:00:00"}
+        },
+        "waste_containers": {
+            "w1": {"name": "Waste Bin", "total_volume": 5.0, "used_volume": 1.0, "max_weight": 30.0,
+                   "current_weight": 3.0, "items": ["i3"]}
+        },
+        "reservations": {}
+    })
+
+
+def _json(data: dict) -> dict:
+    return models.to_json({key: dict(value) if key in dict(models.SECTION_TYPES) else value
+                           for key, value in data.items()})
+
+
+def test_round_trip():
+    data = _sample()
+    decoded = snapshot.decode_snapshot(snapshot.encode(data)).checkout()
+    assert _json(decoded) == _json(data)
+    assert decoded['items']['i2'].extras == {"serial": "OX-7"}
+
+
+def test_incremental_save_round_trip(tmp_path):
+    store = snapshot.SnapshotStore(str(tmp_path / "cargo.snap"))
+    store.save(_sample())
+    data = store.load()
+    data['items']['i1'].priority = 50
+    data['items']['i4'] = models.Item("i4", name="Wrench", location="c1", volume=0.25, weight=0.5)
+    del data['items']['i3']
+    store.save(data)
+
+    expected = _json(data)
+    assert _json(store.load()) == expected
+    assert _json(snapshot.open_snapshot(store.path).checkout()) == expected
+
+
+def test_rejects_truncated_file():
+    encoded = snapshot.encode(_sample())
+    with pytest.raises(snapshot.SnapshotError, match="checksum"):
+        snapshot.decode_snapshot(encoded[:-16])
+    with pytest.raises(snapshot.SnapshotError, match="truncated"):
+        snapshot.decode_snapshot(encoded[:snapshot.HEADER.size - 1])
+
+
+def test_rejects_flipped_bit():
+    encoded = bytearray(snapshot.encode(_sample()))
+    encoded[len(encoded) // 2] ^= 0x01
+    with pytest.raises(snapshot.SnapshotError, match="checksum"):
+        snapshot.decode_snapshot(bytes(encoded))
+
+
+def test_rejects_empty_file(tmp_path):
+    path = tmp_path / "cargo.snap"
+    path.write_bytes(b"")
+    with pytest.raises(snapshot.SnapshotError, match="truncated"):
+        snapshot.open_snapshot(str(path))
+
+
+def test_rejects_newer_format_version():
+    encoded = bytearray(snapshot.encode(_sample()))
+    magic, _, reserved, checksum, length = snapshot.HEADER.unpack_from(encoded)
+    snapshot.HEADER.pack_into(encoded, 0, magic, snapshot.FORMAT_VERSION + 1, reserved, checksum, length)
+    with pytest.raises(snapshot.SnapshotError, match="newer"):
+        snapshot.decode_snapshot(bytes(encoded))
+
+
+def _previous_version(data: dict, monkeypatch) -> bytes:
+    """Snapshot bytes as written before containers stored their reservation totals"""
+    reservation_columns = {"reserved_volume", "reserved_weight", "reserved_until"}
+    sections = tuple((name, row_type, tuple(column for column in fields if column[0] not in reservation_columns))
+                     for name, row_type, fields in snapshot.SECTIONS)
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshot, "SECTIONS", sections)
+        encoded = snapshot.encode(data)
+    assert "containers.reserved_volume" not in snapshot.decode_snapshot(encoded).meta["columns"]
+    return encoded
+
+
+def test_reads_previous_version(tmp_path, monkeypatch):
+    data = _sample()
+    path = tmp_path / "cargo.snap"
+    path.write_bytes(_previous_version(data, monkeypatch))
+
+    store = snapshot.SnapshotStore(str(path))
+    loaded = store.load()
+    container = loaded['containers']['c2']
+    assert (container.reserved_volume, container.reserved_weight, container.reserved_until) == (0.0, 0.0, None)
+    assert container.items == {"i2": None}
+    assert _json(loaded)['items'] == _json(data)['items']
+
+    # Saving over it writes the current layout, keeping the untouched rows
+    loaded['containers']['c1'].reserved_volume = 1.5
+    store.save(loaded)
+    reloaded = store.load()
+    assert "containers.reserved_volume" in store.current().meta["columns"]
+    assert reloaded['containers']['c1'].reserved_volume == 1.5
+    assert reloaded['containers']['c2'].items == {"i2": None}
+    assert _json(reloaded)['items'] == _json(data)['items']
+
+
+def test_header_checksum_covers_payload():
+    encoded = snapshot.encode(_sample())
+    _, version, _, checksum, length = snapshot.HEADER.unpack_from(encoded)
+    assert version == snapshot.FORMAT_VERSION
+    assert length == len(encoded) - snapshot.HEADER.size
+    assert checksum == zlib.crc32(encoded[snapshot.HEADER.size:])
@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple
+
+import models
+import snapshot
+
+# Expired-item sweep
+#
+# Expired items are found with one column-wise select over the item section
+# (see snapshot.select), so only the items being swept are ever decoded. They
+# are then packed into waste containers best-fit decreasing: largest items
+# first, each into the accepting container it leaves the least volume free in,
+# with weight limits checked alongside. The caller applies the whole transfer
+# and saves once, so a sweep commits entirely or not at all.
+
+
+def expired_items(data: Dict, before: int) -> Dict[str, models.Item]:
+    """Active items whose expiration date is before the given day ordinal"""
+    return snapshot.select(data['items'], (
+        ("status", "==", models.ItemStatus.ACTIVE),
+        ("expiration_date", "<", before)
+    ))
+
+
+def pack(data: Dict, items: Dict[str, models.Item]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Assign items to waste containers; returns (container -> item IDs, item IDs left over)"""
+    free = {}
+    for container_id, container in data['waste_containers'].items():
+        free[container_id] = [container.total_volume - container.used_volume,
+                              container.max_weight - container.current_weight, container]
+
+    assignments: Dict[str, List[str]] = {}
+    unassigned = []
+    for item_id in sorted(items, key=lambda item_id: (-items[item_id].volume, item_id)):
+        item = items[item_id]
+        best, best_room = None, None
+        for container_id, (volume, weight, container) in free.items():
+            if item.volume > volume or item.weight > weight or not container.accepts(item.category):
+                continue
+            room = volume - item.volume
+            if best is None or room < best_room:
+                best, best_room = container_id, room
+        if best is None:
+            unassigned.append(item_id)
+            continue
+        free[best][0] -= item.volume
+        free[best][1] -= item.weight
+        assignments.setdefault(best, []).append(item_id)
+    return assignments, unassigned
+
+
+def apply(data: Dict, items: Dict[str, models.Item], assignments: Dict[str, List[str]]) -> None:
+    """Move assigned items out of their containers and into waste containers"""
+    for waste_container_id, item_ids in assignments.items():
+        waste_container = data['waste_containers'][waste_container_id]
+        for item_id in item_ids:
+            item = items[item_id]
+            if item.location in data['containers']:
+                data['containers'][item.location].remove_item(item)
+            item.status = models.ItemStatus.WASTE
+            item.location = f"waste_{waste_container_id}"
+            waste_container.used_volume += item.volume
+            waste_container.current_weight += item.weight
+
+
+def report(items: Dict[str, models.Item], assignments: Dict[str, List[str]], unassigned: List[str]) -> Dict:
+    """Disposal report: what goes where, and what could not be placed"""
+    containers = []
+    for waste_container_id, item_ids in sorted(assignments.items()):
+        containers.append({
+            "waste_container_id": waste_container_id,
+            "items": [{"item_id": item_id, "name": items[item_id].name, "category": items[item_id].category,
+                       "expiration_date": models.format_date(items[item_id].expiration_date)}
+                      for item_id in item_ids],
+            "volume": round(sum(items[item_id].volume for item_id in item_ids), 4),
+            "weight": round(sum(items[item_id].weight for item_id in item_ids), 4)
+        })
+    return {
+        "items_swept": sum(len(item_ids) for item_ids in assignments.values()),
+        "waste_containers": containers,
+        "unassigned": [{"item_id": item_id, "name": items[item_id].name, "category": items[item_id].category}
+                       for item_id in unassigned]
+    }